@@ -0,0 +1,15 @@
+"""Scaling benchmarks for urbs
+
+Generates synthetic input of configurable size and times the stages of a
+urbs run (reading, model building, LP writing, solving, result extraction,
+saving, reporting and plotting) over a grid of sizes. Run
+
+    python -m benchmark --help
+
+for the command line interface.
+
+"""
+
+from .runner import (compare_results, load_results, run_benchmark,
+                     run_workers, size_grid)
+from .synthetic import generate_data, write_excel
@@ -0,0 +1,451 @@
+"""Benchmark runner for urbs
+
+Times the stages of a typical urbs run (cf. runme.py) on synthetic input of
+increasing size and writes the results to a JSON file, together with the
+versions of Python, urbs and its dependencies:
+
+    python -m benchmark --sites 2 4 8 --timesteps 24 168 --output new.json
+
+Results of two runs, e.g. before and after a change, can be compared with:
+
+    old, new = load_results('old.json')[1], load_results('new.json')[1]
+    compare_results(old, new)
+
+"""
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc  # Python >= 3.4
+except ImportError:
+    tracemalloc = None
+
+from .synthetic import generate_data, write_excel
+
+STAGES = ['read_excel', 'create_model', 'write_lp', 'solve', 'get_entity',
+          'save', 'report', 'result_figures']
+
+# parameters of generate_data that describe the size of an instance
+SIZE_PARAMETERS = ['sites', 'processes', 'storages', 'transmissions', 'dsm',
+                   'timesteps']
+
+
+def size_grid(**ranges):
+    """Return all combinations of given size parameter values.
+
+    Args:
+        **ranges: lists of values for parameters of generate_data, e.g.
+                  sites=[2, 4], timesteps=[24, 168]
+
+    Returns:
+        list of dicts of keyword arguments to generate_data
+
+    Example:
+        >>> size_grid(sites=[2, 4], timesteps=[24])
+        [{'sites': 2, 'timesteps': 24}, {'sites': 4, 'timesteps': 24}]
+    """
+    names = sorted(ranges)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[ranges[name]
+                                              for name in names])]
+
+
+def run_benchmark(sizes, filename=None, solver='glpk', stages=None,
+                  trace_memory=False, workdir=None):
+    """Time all stages of a urbs run for a list of instance sizes.
+
+    For each size, synthetic input is generated (cf. generate_data) and
+    written to a spreadsheet, neither of which is timed. Then the stages
+    are run one after another on the same model:
+
+    - read_excel: read the spreadsheet
+    - create_model: build the model from the generated input
+    - write_lp: write the model to an LP file
+    - solve: solve the model (cf. urbs.solve)
+    - get_entity: extract all sets, parameters and variables to the result
+      cache (cf. urbs.save), which the following stages then use
+    - save: write input and result cache to a HDF5 file
+    - report: write the result spreadsheet
+    - result_figures: plot all demand timeseries (PNG only)
+
+    Stages after an unsuccessful solve are skipped.
+
+    Args:
+        sizes: list of dicts of keyword arguments to generate_data, e.g.
+               from size_grid
+        filename: (optional) JSON file to write results to; it is
+                  rewritten after each size, so that partial results of an
+                  aborted run remain
+        solver: solver name (cf. urbs.solver_factory), default: 'glpk'
+        stages: (optional) list of stages to run, default: STAGES
+        trace_memory: set True to record the peak of memory allocated by
+                      Python within each stage (cf. tracemalloc); this slows
+                      down all stages
+        workdir: (optional) directory for the files written by the stages;
+                 default: a temporary directory, removed afterwards
+
+    Returns:
+        list of result dicts, one per size and stage; keys are the size
+        parameters, 'stage', 'time' (s), 'peak_memory' (MB, traced by
+        tracemalloc, or None), 'max_rss' (MB, peak resident memory of the
+        process so far, or None), 'status' ('ok', solver status or error
+        message) and stage specific details (model size, file size)
+    """
+    if stages is None:
+        stages = STAGES
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError("Unknown stage '{}'".format(stage))
+    if trace_memory and tracemalloc is None:
+        raise ValueError("Memory tracing requires Python >= 3.4")
+
+    temporary = workdir is None
+    if temporary:
+        workdir = tempfile.mkdtemp(prefix='urbs-benchmark')
+    meta = environment(solver)
+    results = []
+    try:
+        for size in sizes:
+            results.extend(run_size(size, stages, solver, trace_memory,
+                                    workdir))
+            if filename:
+                write_results(filename, meta, results)
+    finally:
+        if temporary:
+            shutil.rmtree(workdir)
+    return results
+
+
+def run_size(size, stages, solver, trace_memory, workdir):
+    """Run the stages for one instance size; cf. run_benchmark."""
+    import urbs
+    from urbs.saveload import create_result_cache
+
+    full_size = dict((name, size.get(name, default))
+                     for name, default in zip(SIZE_PARAMETERS,
+                                              generate_defaults()))
+    try:
+        data = generate_data(**size)
+    except ValueError as e:
+        # invalid combination of a size grid, e.g. too many transmissions
+        return [dict(full_size, stage=stage, status='error: {}'.format(e))
+                for stage in STAGES if stage in stages]
+    size = full_size
+    timesteps = range(0, size['timesteps'] + 1)
+    basename = os.path.join(workdir, 'synthetic')
+    if 'read_excel' in stages:
+        write_excel(data, basename + '.xlsx')
+
+    state = {}
+
+    def read_excel():
+        # time parsing, not the input cache, to compare versions
+        urbs.read_excel(basename + '.xlsx', cache=False)
+
+    def create_model():
+        state['prob'] = urbs.create_model(data, timesteps)
+        return model_size(state['prob'])
+
+    def write_lp():
+        state['prob'].write(basename + '.lp',
+                            io_options={'symbolic_solver_labels': False})
+        return {'file_size': os.path.getsize(basename + '.lp') / 1e6}
+
+    def solve():
+        optim = urbs.solver_factory(solver)
+        result = urbs.solve(state['prob'], optim)
+        status = str(result.solver.termination_condition)
+        return {'status': status}
+
+    def get_entity():
+        state['prob']._result = create_result_cache(state['prob'])
+
+    def save():
+        urbs.save(state['prob'], basename + '.h5')
+        return {'file_size': os.path.getsize(basename + '.h5') / 1e6}
+
+    def report():
+        urbs.report(state['prob'], basename + '-report.xlsx')
+
+    def result_figures():
+        urbs.result_figures(state['prob'], basename, extensions=['png'])
+
+    functions = {
+        'read_excel': read_excel, 'create_model': create_model,
+        'write_lp': write_lp, 'solve': solve, 'get_entity': get_entity,
+        'save': save, 'report': report, 'result_figures': result_figures}
+
+    results = []
+    solved = False
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        result = dict(size, stage=stage)
+        needs_model = stage not in ('read_excel', 'create_model')
+        needs_solution = stage in ('get_entity', 'save', 'report',
+                                   'result_figures')
+        if ((needs_model and 'prob' not in state) or
+                (needs_solution and not solved)):
+            result['status'] = 'skipped'
+        else:
+            result.update(measure(functions[stage], trace_memory))
+            if stage == 'solve':
+                solved = result['status'] == 'optimal'
+        results.append(result)
+    return results
+
+
+def run_workers(sizes, workers, filename=None):
+    """Time model creation by the matrix backend for numbers of workers.
+
+    For each size and number of workers n, the model is built from the
+    synthetic input by create_model(..., backend='matrix', workers=n), which
+    runs the constraint block builders in a pool of n processes (cf.
+    urbs.matrix.build_blocks).
+
+    Args:
+        sizes: list of dicts of keyword arguments to generate_data
+        workers: list of numbers of worker processes, e.g. [1, 2, 4]
+        filename: (optional) JSON file to write results to, cf.
+                  run_benchmark
+
+    Returns:
+        list of result dicts, one per size and number of workers; keys as
+        in run_benchmark (stage 'create_model'), plus 'workers'
+    """
+    import urbs
+
+    meta = environment(solver=None)
+    results = []
+    for size in sizes:
+        full_size = dict(zip(SIZE_PARAMETERS, generate_defaults()), **size)
+        try:
+            data = generate_data(**size)
+        except ValueError as e:
+            results.extend(dict(full_size, stage='create_model', workers=n,
+                                status='error: {}'.format(e))
+                           for n in workers)
+            continue
+        timesteps = range(0, full_size['timesteps'] + 1)
+        for n in workers:
+            def create_model():
+                prob = urbs.create_model(data, timesteps, backend='matrix',
+                                         workers=n)
+                return {'variables': prob.ncols, 'constraints': prob.nrows}
+
+            results.append(dict(full_size, stage='create_model', workers=n,
+                                **measure(create_model)))
+        if filename:
+            write_results(filename, meta, results)
+    return results
+
+
+def generate_defaults():
+    """Return the default values of SIZE_PARAMETERS in generate_data."""
+    if hasattr(inspect, 'signature'):  # Python >= 3.3
+        parameters = inspect.signature(generate_data).parameters
+        return [parameters[name].default for name in SIZE_PARAMETERS]
+    spec = inspect.getargspec(generate_data)
+    defaults = dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+    return [defaults[name] for name in SIZE_PARAMETERS]
+
+
+def measure(function, trace_memory=False):
+    """Call function and measure its run time and memory use.
+
+    Args:
+        function: function without arguments; may return a dict of further
+                  results
+        trace_memory: set True to trace memory allocations
+
+    Returns:
+        dict with keys 'time', 'peak_memory', 'max_rss', 'status' and the
+        contents of the return value of function
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = timeit.default_timer()
+    try:
+        result = {'status': 'ok'}
+        result.update(function() or {})
+    except Exception as e:
+        result = {'status': 'error: {}'.format(e)}
+    result['time'] = timeit.default_timer() - start
+    if trace_memory:
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    else:
+        result['peak_memory'] = None
+    result['max_rss'] = max_rss()
+    return result
+
+
+def max_rss():
+    """Return peak resident memory (MB) of this process and its children.
+
+    Child processes are e.g. solvers run via LP file. Returns None if the
+    platform does not provide this information.
+    """
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # bytes on macOS, kilobytes elsewhere
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+
+def model_size(prob):
+    """Return number of variables and constraints of a urbs model."""
+    import pyomo.core as pyomo
+    variables = sum(1 for _ in prob.component_data_objects(pyomo.Var))
+    constraints = sum(1 for _ in prob.component_data_objects(
+        pyomo.Constraint, active=True))
+    return {'variables': variables, 'constraints': constraints}
+
+
+def environment(solver):
+    """Return versions of Python, urbs and its dependencies.
+
+    The urbs version is the output of 'git describe' in the directory of
+    the urbs package, if available.
+    """
+    import numpy
+    import pandas
+    import pyomo.version
+    import urbs
+
+    try:
+        urbs_dir = os.path.dirname(os.path.abspath(urbs.__file__))
+        with open(os.devnull, 'w') as devnull:
+            version = subprocess.check_output(
+                ['git', 'describe', '--always', '--dirty', '--tags'],
+                cwd=urbs_dir, stderr=devnull).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        version = None
+
+    return {
+        'created': datetime.now().strftime('%Y%m%dT%H%M%S'),
+        'urbs': version,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'pyomo': pyomo.version.version,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'solver': solver}
+
+
+def write_results(filename, meta, results):
+    """Write benchmark results to a JSON file.
+
+    Args:
+        filename: JSON file to be written
+        meta: dict as returned by environment
+        results: list of result dicts as returned by run_benchmark
+
+    Returns:
+        Nothing
+    """
+    with open(filename, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1,
+                  sort_keys=True)
+
+
+def load_results(filename):
+    """Read benchmark results from a JSON file written by run_benchmark.
+
+    Args:
+        filename: JSON file
+
+    Returns:
+        (meta, results) tuple of a dict and a DataFrame with one row per
+        instance size and stage
+    """
+    import pandas as pd
+    with open(filename) as f:
+        content = json.load(f)
+    return content['meta'], pd.DataFrame(content['results'])
+
+
+def compare_results(old, new):
+    """Compare run times of two benchmark runs.
+
+    Args:
+        old, new: results DataFrames as returned by load_results
+
+    Returns:
+        DataFrame indexed by size parameters and stage with columns 'old',
+        'new' (time in s) and 'ratio' (new / old)
+    """
+    index = SIZE_PARAMETERS + ['stage']
+    if 'workers' in old and 'workers' in new:
+        index.append('workers')  # cf. run_workers
+    comparison = (old.set_index(index)[['time']]
+                     .join(new.set_index(index)[['time']],
+                           lsuffix='_old', rsuffix='_new', how='inner'))
+    comparison.columns = ['old', 'new']
+    comparison['ratio'] = comparison['new'] / comparison['old']
+    return comparison
+
+
+def main(argv=None):
+    """Command line interface, cf. python -m benchmark --help."""
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmark',
+        description='Time urbs on synthetic input over a grid of sizes.')
+    defaults = dict(zip(SIZE_PARAMETERS, generate_defaults()))
+    for name in SIZE_PARAMETERS:
+        parser.add_argument('--' + name, type=int, nargs='+',
+                            default=[defaults[name]],
+                            help='values of {} (default: {})'.format(
+                                name, defaults[name]))
+    parser.add_argument('--solver', default='glpk',
+                        help='solver name (default: glpk)')
+    parser.add_argument('--stages', nargs='+', default=STAGES,
+                        choices=STAGES, help='stages to run (default: all)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='trace peak memory per stage (slower)')
+    parser.add_argument('--workdir', help='directory for written files '
+                        '(default: temporary directory)')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='only time model creation by the matrix backend '
+                        'for these numbers of worker processes')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='JSON result file (default: benchmark.json)')
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use('Agg')  # no display needed for result_figures
+
+    sizes = size_grid(**dict((name, getattr(args, name))
+                             for name in SIZE_PARAMETERS))
+    if args.workers:
+        results = run_workers(sizes, args.workers, args.output)
+        for result in results:
+            print('{sites:>4} sites {timesteps:>5} steps {workers:>3} workers'
+                  '{time:>9.2f} s  {status}'.format(
+                      **dict(result, time=result.get('time', 0))))
+        return
+    results = run_benchmark(sizes, args.output, solver=args.solver,
+                            stages=args.stages,
+                            trace_memory=args.trace_memory,
+                            workdir=args.workdir)
+    for result in results:
+        print('{sites:>4} sites {timesteps:>5} steps  {stage:<15}'
+              '{time:>9.2f} s  {status}'.format(
+                  **dict(result, time=result.get('time', 0))))
@@ -0,0 +1,324 @@
+"""Synthetic urbs input of configurable size
+
+generate_data returns an input dict in the same shape as urbs.read_excel,
+with sites, processes, storages, transmission links and DSM entries modelled
+after mimo-example.xlsx. write_excel writes it to a spreadsheet that
+read_excel reads back, e.g. for timing read_excel itself:
+
+    data = generate_data(sites=10, processes=6, timesteps=8760)
+    write_excel(data, 'synthetic.xlsx')
+
+"""
+import numpy as np
+import pandas as pd
+
+# process templates: (name, input commodity, input type, {output: ratio},
+# inst-cap, cap-up, max-grad, min-fraction, inv-cost, fix-cost, var-cost,
+# startup-cost, depreciation)
+PROCESSES = [
+    ('Gas plant', 'Gas', 'Stock', {'Elec': 0.6, 'CO2': 0.2},
+     0, 80000, 4.8, 0.25, 450000, 6000, 1.62, 6, 30),
+    ('Wind park', 'Wind', 'SupIm', {'Elec': 1.0},
+     0, 13000, np.inf, 0, 1500000, 30000, 0, 0, 25),
+    ('Photovoltaics', 'Solar', 'SupIm', {'Elec': 1.0},
+     0, 160000, np.inf, 0, 600000, 12000, 0, 0, 25),
+    ('Coal plant', 'Coal', 'Stock', {'Elec': 0.4, 'CO2': 0.3},
+     0, 100000, 0.6, 0.5, 600000, 18000, 0.6, 15, 40),
+    ('Hydro plant', 'Hydro', 'SupIm', {'Elec': 1.0},
+     0, 20000, np.inf, 0, 1600000, 20000, 0, 0, 50),
+    ('Biomass plant', 'Biomass', 'Stock', {'Elec': 0.35, 'CO2': 0},
+     0, 5000, 1.2, 0, 875000, 28000, 1.4, 0, 25),
+    ('Lignite plant', 'Lignite', 'Stock', {'Elec': 0.4, 'CO2': 0.4},
+     0, 60000, 0.9, 0.65, 600000, 18000, 0.6, 20, 40),
+]
+
+# slack process, added to every site to keep all instances feasible
+SLACK = ('Slack powerplant', 'Slack', 'Stock', {'Elec': 1.0},
+         999999, 999999, np.inf, 0, 0, 0, 100, 0, 1)
+
+STOCK_PRICES = {'Gas': 27, 'Coal': 7, 'Biomass': 6, 'Lignite': 4,
+                'Slack': 999}
+
+# storage templates: (name, eff-in, eff-out, inv-cost-p, inv-cost-c,
+# fix-cost-p, fix-cost-c, var-cost-p, discharge)
+STORAGES = [
+    ('Pump storage', 0.94, 0.94, 100000, 0, 20000, 0, 0.02, 0),
+    ('Hydrogen', 0.64, 0.64, 42000, 6.54, 0, 0.327, 0.02, 3e-6),
+]
+
+PROCESS_COLUMNS = ['inst-cap', 'cap-lo', 'cap-up', 'max-grad',
+                   'min-fraction', 'inv-cost', 'fix-cost', 'var-cost',
+                   'startup-cost', 'wacc', 'depreciation', 'area-per-cap']
+TRANSMISSION_COLUMNS = ['eff', 'inv-cost', 'fix-cost', 'var-cost',
+                        'inst-cap', 'cap-lo', 'cap-up', 'wacc',
+                        'depreciation']
+STORAGE_COLUMNS = ['inst-cap-c', 'cap-lo-c', 'cap-up-c', 'inst-cap-p',
+                   'cap-lo-p', 'cap-up-p', 'eff-in', 'eff-out', 'inv-cost-p',
+                   'inv-cost-c', 'fix-cost-p', 'fix-cost-c', 'var-cost-p',
+                   'var-cost-c', 'wacc', 'depreciation', 'init', 'discharge']
+DSM_COLUMNS = ['delay', 'eff', 'recov', 'cap-max-do', 'cap-max-up']
+
+# sheet names of read_excel and the index columns of each sheet
+SHEETS = [
+    ('global_prop', 'Global', ['Property']),
+    ('site', 'Site', ['Name']),
+    ('commodity', 'Commodity', ['Site', 'Commodity', 'Type']),
+    ('process', 'Process', ['Site', 'Process']),
+    ('process_commodity', 'Process-Commodity',
+     ['Process', 'Commodity', 'Direction']),
+    ('transmission', 'Transmission',
+     ['Site In', 'Site Out', 'Transmission', 'Commodity']),
+    ('storage', 'Storage', ['Site', 'Storage', 'Commodity']),
+    ('demand', 'Demand', ['t']),
+    ('supim', 'SupIm', ['t']),
+    ('buy_sell_price', 'Buy-Sell-Price', ['t']),
+    ('dsm', 'DSM', ['Site', 'Commodity']),
+]
+
+
+def generate_data(sites=3, processes=5, storages=1, transmissions=3, dsm=1,
+                  timesteps=168, seed=0):
+    """Return synthetic input data in the shape returned by read_excel.
+
+    Processes and storages are taken in turn from the templates PROCESSES
+    and STORAGES; beyond their number, variants with slightly different
+    costs are added. Transmission links first connect the sites in a ring,
+    then further pairs of sites. Timeseries are deterministic for a given
+    seed.
+
+    Args:
+        sites: number of sites
+        processes: number of processes per site (plus one slack power plant
+                   that keeps every instance feasible)
+        storages: number of storages per site
+        transmissions: number of transmission links, i.e. pairs of sites
+                       connected in both directions
+        dsm: number of sites with demand side management
+        timesteps: number of timesteps (plus initialisation timestep 0)
+        seed: seed of the random number generator
+
+    Returns:
+        a dict of DataFrames like read_excel
+    """
+    if sites < 1:
+        raise ValueError("At least one site is required")
+    if transmissions > sites * (sites - 1) // 2:
+        raise ValueError("{} sites allow at most {} transmission "
+                         "links".format(sites, sites * (sites - 1) // 2))
+    if dsm > sites:
+        raise ValueError("DSM entries cannot exceed the number of sites")
+
+    random = np.random.RandomState(seed)
+    site_names = ['Site{}'.format(k) for k in range(sites)]
+    process_list = ([variant(PROCESSES, k) for k in range(processes)] +
+                    [SLACK])
+    storage_list = [variant(STORAGES, k) for k in range(storages)]
+
+    site = pd.DataFrame({'area': np.nan},
+                        index=pd.Index(site_names, name='Name'))
+
+    # commodities: demand, CO2 and the inputs of all processes
+    commodity_rows = []
+    for sit in site_names:
+        commodity_rows.append((sit, 'Elec', 'Demand', np.nan, np.nan,
+                               np.nan))
+        commodity_rows.append((sit, 'CO2', 'Env', 0, np.inf, np.inf))
+        for com, com_type in sorted(set((p[1], p[2])
+                                        for p in process_list)):
+            if com_type == 'Stock':
+                commodity_rows.append((sit, com, com_type,
+                                       STOCK_PRICES[com], np.inf, np.inf))
+            else:
+                commodity_rows.append((sit, com, com_type, np.nan, np.nan,
+                                       np.nan))
+    commodity = frame(commodity_rows, ['Site', 'Commodity', 'Type'],
+                      ['price', 'max', 'maxperstep'])
+
+    process_rows = []
+    for k, sit in enumerate(site_names):
+        for (pro, _, _, _, inst_cap, cap_up, max_grad, min_fraction,
+             inv_cost, fix_cost, var_cost, startup_cost,
+             depreciation) in process_list:
+            process_rows.append((sit, pro, inst_cap, inst_cap, cap_up,
+                                 max_grad, min_fraction, inv_cost, fix_cost,
+                                 var_cost, startup_cost, 0.07, depreciation,
+                                 np.nan))
+    process = frame(process_rows, ['Site', 'Process'], PROCESS_COLUMNS)
+
+    process_commodity_rows = []
+    for pro, com, _, outputs, min_fraction in [
+            (p[0], p[1], p[2], p[3], p[7]) for p in process_list]:
+        # partial operation: less efficient at minimum load
+        ratio_min = 1.2 if min_fraction > 0 else np.nan
+        process_commodity_rows.append((pro, com, 'In', 1.0, ratio_min))
+        for out, ratio in sorted(outputs.items()):
+            process_commodity_rows.append((pro, out, 'Out', ratio, np.nan))
+    process_commodity = frame(process_commodity_rows,
+                              ['Process', 'Commodity', 'Direction'],
+                              ['ratio', 'ratio-min'])
+
+    transmission_rows = []
+    for sit_in, sit_out in site_pairs(site_names, transmissions):
+        for a, b in [(sit_in, sit_out), (sit_out, sit_in)]:
+            transmission_rows.append((a, b, 'hvac', 'Elec', 0.9, 1650000,
+                                      16500, 0, 0, 0, np.inf, 0.07, 40))
+    transmission = frame(transmission_rows,
+                         ['Site In', 'Site Out', 'Transmission',
+                          'Commodity'], TRANSMISSION_COLUMNS)
+
+    storage_rows = []
+    for sit in site_names:
+        for (sto, eff_in, eff_out, inv_cost_p, inv_cost_c, fix_cost_p,
+             fix_cost_c, var_cost_p, discharge) in storage_list:
+            storage_rows.append((sit, sto, 'Elec', 0, 0, np.inf, 0, 0,
+                                 np.inf, eff_in, eff_out, inv_cost_p,
+                                 inv_cost_c, fix_cost_p, fix_cost_c,
+                                 var_cost_p, 0, 0.07, 50, 0.5, discharge))
+    storage = frame(storage_rows, ['Site', 'Storage', 'Commodity'],
+                    STORAGE_COLUMNS)
+
+    dsm_rows = [(sit, 'Elec', 1 + 7 * (k % 3), 1.0, 1, 500, 500)
+                for k, sit in enumerate(site_names[:dsm])]
+    dsm_frame = frame(dsm_rows, ['Site', 'Commodity'], DSM_COLUMNS)
+
+    t = np.arange(timesteps + 1)
+    index = pd.Index(t, name='t')
+    demand = pd.DataFrame(
+        {(sit, 'Elec'): demand_timeseries(t, random) for sit in site_names},
+        index=index)
+    supim = pd.DataFrame(
+        {(sit, com): supim_timeseries(com, t, random)
+         for sit in site_names
+         for com in sorted(set(p[1] for p in process_list
+                               if p[2] == 'SupIm'))},
+        index=index)
+    buy_sell_price = pd.DataFrame(
+        {('Elec buy',): 0.08 + 0.02 * random.rand(len(t)),
+         ('Elec sell',): 0.02 * random.rand(len(t))},
+        index=index)
+    for timeseries in (demand, supim, buy_sell_price):
+        timeseries.iloc[0] = 0  # initialisation timestep
+
+    global_prop = pd.DataFrame(
+        {'value': [np.inf],
+         'description': ['Limits the sum of all created CO2']},
+        index=pd.Index(['CO2 limit'], name='Property'),
+        columns=['value', 'description'])
+
+    data = {
+        'global_prop': global_prop,
+        'site': site,
+        'commodity': commodity,
+        'process': process,
+        'process_commodity': process_commodity,
+        'transmission': transmission,
+        'storage': storage,
+        'demand': demand,
+        'supim': supim,
+        'buy_sell_price': buy_sell_price,
+        'dsm': dsm_frame
+        }
+
+    # sort nested indexes like read_excel
+    for key in data:
+        if isinstance(data[key].index, pd.MultiIndex):
+            data[key].sort_index(inplace=True)
+    return data
+
+
+def variant(templates, k):
+    """Return template k, or a variant of it with 5% higher costs per round.
+
+    Args:
+        templates: list of process or storage template tuples
+        k: running number
+
+    Returns:
+        template tuple, renamed to e.g. 'Gas plant 2' for the second round
+    """
+    template = templates[k % len(templates)]
+    rounds = k // len(templates)
+    if rounds == 0:
+        return template
+    factor = 1 + 0.05 * rounds
+    name = '{} {}'.format(template[0], rounds + 1)
+    if templates is STORAGES:
+        return ((name,) + template[1:3] +
+                tuple(cost * factor for cost in template[3:8]) +
+                template[8:])
+    return ((name,) + template[1:8] +
+            tuple(cost * factor for cost in template[8:12]) +
+            template[12:])
+
+
+def site_pairs(site_names, number):
+    """Return number pairs of sites, first forming a ring, then chords.
+
+    Args:
+        site_names: list of site names
+        number: number of pairs
+
+    Returns:
+        list of (site, site) tuples
+    """
+    n = len(site_names)
+    pairs = []
+    for distance in range(1, n // 2 + 1):
+        for k in range(n):
+            pair = tuple(sorted((k, (k + distance) % n)))
+            if pair[0] != pair[1] and pair not in pairs:
+                pairs.append(pair)
+    return [(site_names[a], site_names[b]) for a, b in pairs[:number]]
+
+
+def demand_timeseries(t, random):
+    """Electricity demand with daily and seasonal cycle plus noise."""
+    base = 5000 + 40000 * random.rand()
+    daily = 1 + 0.2 * np.sin(2 * np.pi * (t % 24 - 9) / 24)
+    seasonal = 1 + 0.15 * np.cos(2 * np.pi * t / 8760)
+    noise = 1 + 0.05 * random.randn(len(t))
+    return base * daily * seasonal * noise
+
+
+def supim_timeseries(com, t, random):
+    """Normalised availability of intermittent supply commodity com."""
+    if com == 'Solar':
+        # daylight only
+        series = np.maximum(0, np.sin(2 * np.pi * (t % 24 - 6) / 24))
+        series *= 0.6 + 0.4 * random.rand(len(t))
+    elif com == 'Wind':
+        # smoothed random walk
+        steps = 0.1 * random.randn(len(t))
+        series = 0.5 + 0.4 * np.sin(np.cumsum(steps))
+    else:
+        series = 0.3 + 0.1 * random.rand() * np.ones(len(t))
+    return np.clip(series, 0, 1)
+
+
+def frame(rows, index, columns):
+    """Create a DataFrame with (Multi)Index from a list of row tuples."""
+    df = pd.DataFrame(rows, columns=index + columns)
+    return df.set_index(index)
+
+
+def write_excel(data, filename):
+    """Write an input dict to a spreadsheet that read_excel can read.
+
+    Args:
+        data: input dict, e.g. from generate_data
+        filename: Excel spreadsheet filename
+
+    Returns:
+        Nothing
+    """
+    with pd.ExcelWriter(filename) as writer:
+        for name, sheet, index in SHEETS:
+            df = data[name].copy()
+            if index == ['t']:
+                # join MultiIndex columns ('Site', 'Commodity') to
+                # 'Site.Commodity'
+                df.columns = ['.'.join(col) if isinstance(col, tuple)
+                              else col for col in df.columns]
+            df.index.names = index
+            df.reset_index().to_excel(writer, sheet_name=sheet,
+                                      index=False)
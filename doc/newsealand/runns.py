@@ -1,10 +1,11 @@
+import multiprocessing
 import os
 import pandas as pd
 import pyomo.environ
 import shutil
+import time
 import urbs
 from datetime import datetime
-from pyomo.opt.base import SolverFactory
 
 
 # SCENARIOS
@@ -33,12 +34,19 @@ def prepare_result_directory(result_name):
     return result_dir
 
 
-def setup_solver(optim, logfile='solver.log'):
-    """ """
-    if optim.name == 'gurobi':
+def setup_solver(optim, logfile='solver.log', threads=None):
+    """ set solver log file and (optional) number of solver threads """
+    if hasattr(optim, 'highs_options'):
+        # HiGHS, in-process via Pyomo's appsi interface
+        optim.options['log_file'] = logfile
+        if threads:
+            optim.options['threads'] = threads
+    elif optim.name in ('gurobi', 'gurobi_persistent'):
         # reference with list of option names
         # http://www.gurobi.com/documentation/5.6/reference-manual/parameters
         optim.set_options("logfile={}".format(logfile))
+        if threads:
+            optim.set_options("threads={}".format(threads))
         # optim.set_options("timelimit=7200")  # seconds
         # optim.set_options("mipgap=5e-4")  # default = 1e-4
     elif optim.name == 'glpk':
@@ -47,6 +55,15 @@ def setup_solver(optim, logfile='solver.log'):
         optim.set_options("log={}".format(logfile))
         # optim.set_options("tmlim=7200")  # seconds
         # optim.set_options("mipgap=.0005")
+        # glpk is single-threaded, so threads needs no option
+    elif optim.name == 'cplex':
+        optim.set_options("logfile={}".format(logfile))
+        if threads:
+            optim.set_options("threads={}".format(threads))
+    elif optim.name == 'cplex_persistent':
+        # in-process CPLEX only takes parameters, no log file name
+        if threads:
+            optim.set_options("threads={}".format(threads))
     else:
         print("Warning from setup_solver: no options set for solver "
               "'{}'!".format(optim.name))
@@ -54,7 +71,8 @@ def setup_solver(optim, logfile='solver.log'):
 
 
 def run_scenario(input_file, timesteps, scenario, result_dir,
-                 plot_tuples=None, plot_periods=None, report_tuples=None):
+                 plot_tuples=None, plot_periods=None, report_tuples=None,
+                 threads=None, tee=True):
     """ run an urbs model for given input, time steps and scenario
 
     Args:
@@ -65,6 +83,8 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
         plot_tuples: (optional) list of plot tuples (c.f. urbs.result_figures)
         plot_periods: (optional) dict of plot periods (c.f. urbs.result_figures)
         report_tuples: (optional) list of (sit, com) tuples (c.f. urbs.report)
+        threads: (optional) maximum number of solver threads
+        tee: show solver output (default: True)
 
     Returns:
         the urbs model instance
@@ -83,13 +103,11 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
     log_filename = os.path.join(result_dir, '{}.log').format(sce)
 
     # solve model and read results
-    optim = SolverFactory('glpk')  # cplex, glpk, gurobi, ...
-    optim = setup_solver(optim, logfile=log_filename)
-    result = optim.solve(prob, tee=True)
+    optim = urbs.solver_factory('glpk')  # cplex, glpk, gurobi, highs, ...
+    optim = setup_solver(optim, logfile=log_filename, threads=threads)
+    result = urbs.solve(prob, optim, tee=tee)
+    prob.solver_status = str(result.solver.termination_condition)
 
-    # copy input file to result directory
-    shutil.copyfile(input_file, os.path.join(result_dir, input_file))
-    
     # save problem solution (and input data) to HDF5 file
     urbs.save(prob, os.path.join(result_dir, '{}.h5'.format(sce)))
 
@@ -109,11 +127,85 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
         figure_size=(24, 9))
     return prob
 
+
+def run_scenario_summary(args):
+    """ run_scenario for one scenario of run_scenarios; returns a summary
+
+    Args:
+        args: tuple (input_file, timesteps, scenario, result_dir, kwargs),
+              kwargs being a dict of further arguments to run_scenario
+
+    Returns:
+        a dict with scenario name, solver status, objective and run time
+    """
+    input_file, timesteps, scenario, result_dir, kwargs = args
+    start = time.time()
+    try:
+        prob = run_scenario(input_file, timesteps, scenario, result_dir,
+                            **kwargs)
+        status = prob.solver_status
+        objective = urbs.get_entity(prob, 'costs').sum()
+    except Exception as e:
+        # a failing scenario must not stop the remaining ones
+        status = 'error: {}'.format(e)
+        objective = float('nan')
+    return {'scenario': scenario.__name__, 'status': status,
+            'objective': objective, 'time': time.time() - start}
+
+
+def limit_threads(threads):
+    """ limit threads of numerical libraries and solvers in a worker """
+    for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'OPENBLAS_NUM_THREADS']:
+        os.environ[variable] = str(threads)
+
+
+def run_scenarios(input_file, timesteps, scenarios, result_dir, workers=1,
+                  threads=None, **kwargs):
+    """ run several scenarios, optionally in parallel worker processes
+
+    Args:
+        input_file: filename to an Excel spreadsheet for urbs.read_excel
+        timesteps: a list of timesteps, e.g. range(0,8761)
+        scenarios: a list of scenario functions
+        result_dir: directory name for all result files
+        workers: number of worker processes (default: 1)
+        threads: (optional) solver threads per worker; default: number of
+                 CPUs divided by workers
+        **kwargs: further arguments to run_scenario, e.g. report_tuples
+
+    Returns:
+        DataFrame with solver status, objective value and run time (s) of
+        each scenario
+    """
+    if threads is None:
+        threads = max(1, multiprocessing.cpu_count() // workers)
+    tasks = [(input_file, timesteps, scenario, result_dir,
+              dict(kwargs, threads=threads, tee=(workers == 1)))
+             for scenario in scenarios]
+
+    if workers == 1:
+        summaries = [run_scenario_summary(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(workers, initializer=limit_threads,
+                                    initargs=(threads,))
+        try:
+            summaries = pool.map(run_scenario_summary, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    summary = pd.DataFrame(summaries).set_index('scenario')
+    return summary[['status', 'objective', 'time']]
+
 if __name__ == '__main__':
     input_file = 'newsealand.xlsx'
     result_name = os.path.splitext(input_file)[0]  # cut away file extension
     result_dir = prepare_result_directory(result_name)  # name + time stamp
 
+    # copy input file to result directory
+    shutil.copyfile(input_file, os.path.join(result_dir, input_file))
+
     # simulation timesteps
     (offset, length) = (3500, 14*24) # time step selection
     timesteps = range(offset, offset+length+1)
@@ -152,8 +244,13 @@ if __name__ == '__main__':
         scenario_base,
         scenario_co2_limit]
 
-    for scenario in scenarios:
-        prob = run_scenario(input_file, timesteps, scenario, result_dir,
+    # number of parallel scenario runs
+    workers = min(len(scenarios), multiprocessing.cpu_count())
+
+    summary = run_scenarios(input_file, timesteps, scenarios, result_dir,
+                            workers=workers,
                             plot_tuples=plot_tuples,
                             plot_periods=plot_periods,
                             report_tuples=report_tuples)
+    summary.to_csv(os.path.join(result_dir, 'summary.csv'))
+    print(summary)
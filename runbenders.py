@@ -0,0 +1,20 @@
+import pyomo.environ
+import urbs
+
+data = urbs.read_excel('mimo-example.xlsx')
+timesteps = range(3500, 3525)
+
+# the first capacities of the master problem (no new capacities) have no
+# feasible dispatch, so the subproblems must return feasibility cuts
+result = urbs.benders(data, timesteps)
+print(result.iterations)
+assert result.iterations['feasibility_cuts'].iloc[0] > 0
+assert result.solver_status == 'optimal'
+
+# monolithic model for comparison; benders returns an upper bound of its
+# costs, as annual limits apply to each time block
+prob = urbs.create_model(data, timesteps)
+urbs.solve(prob, urbs.solver_factory('glpk'))
+print('Benders: {:.6g}, monolithic: {:.6g}'.format(
+    urbs.get_entity(result, 'costs').sum(),
+    urbs.get_entity(prob, 'costs').sum()))
@@ -0,0 +1,120 @@
+import numpy as np
+import pyomo.environ
+import urbs
+from pyomo.core import Constraint, value
+from urbs.matrix import entity_series
+
+# relative tolerance for objective values and constraint violations
+TOLERANCE = 1e-6
+
+
+def matrix_solution(matrix, prob):
+    """ map the solution of model prob (of either backend) to the columns of
+    matrix """
+    x = np.full(matrix.ncols, np.nan)
+    for name, v in matrix._vars.items():
+        times = matrix.timesteps[v['axis']] if v['axis'] else None
+        # column numbers, labelled like the result of get_entity
+        columns = entity_series(name, v['offset'] + np.arange(v['size']),
+                                v['index'], v['labels'], times)
+        values = urbs.get_entity(prob, name).reindex(columns.index)
+        x[columns.values.astype(int)] = values.values
+    # variables in no constraint (e.g. tau_pro at the initialisation
+    # timestep) keep no value in Pyomo; any value within bounds will do
+    empty = np.isnan(x) & (np.diff(matrix.A.tocsc().indptr) == 0)
+    x[empty] = np.clip(0, matrix.col_lb, matrix.col_ub)[empty]
+    return x
+
+
+def matrix_violation(matrix, x):
+    """ largest violation of the rows of matrix by x, relative to the sum of
+    the magnitudes of each row's terms, which equality rows cancel out """
+    activity = matrix.A.dot(x)
+    scale = np.maximum(1, abs(matrix.A).dot(abs(x)))
+    violation = np.maximum(matrix.row_lb - activity, activity - matrix.row_ub)
+    return float(np.max(violation / scale, initial=0))
+
+
+def pyomo_violation(prob, matrix):
+    """ largest violation of the constraints of prob by matrix's solution """
+    for name in matrix._vars:
+        var = getattr(prob, name)
+        for index, val in urbs.get_entity(matrix, name).items():
+            if index in var:
+                var[index].value = val
+    try:
+        from pyomo.core.expr import identify_variables
+    except ImportError:
+        from pyomo.core.expr.current import identify_variables
+    violation = 0
+    for con in prob.component_data_objects(Constraint, active=True):
+        body = value(con.body)
+        # like matrix_violation, relative to the magnitude of the terms
+        scale = max([1, abs(body)] + [abs(var.value or 0) for var in
+                                      identify_variables(con.body)])
+        if con.has_lb():
+            violation = max(violation, (value(con.lower) - body) / scale)
+        if con.has_ub():
+            violation = max(violation, (body - value(con.upper)) / scale)
+    return violation
+
+
+def compare(data, timesteps, solver, **options):
+    """ build and solve both backends, then cross-check their solutions """
+    prob = urbs.create_model(data, timesteps, **options)
+    urbs.solve(prob, urbs.solver_factory(solver))
+    objective = value(prob.obj)
+
+    matrix = urbs.create_model(data, timesteps, backend='matrix', **options)
+    assert urbs.solve_matrix(matrix, solver) == 'optimal'
+    matrix_objective = urbs.get_entity(matrix, 'costs').sum()
+    assert abs(matrix_objective - objective) <= TOLERANCE * abs(objective)
+
+    # the optimum of each backend is feasible in the other one, with the
+    # same objective value, so both build the same linear program
+    x = matrix_solution(matrix, prob)
+    assert not np.isnan(x).any(), 'variables missing in Pyomo model'
+    assert abs(matrix.c.dot(x) - objective) <= TOLERANCE * abs(objective)
+    assert matrix_violation(matrix, x) <= TOLERANCE
+    assert pyomo_violation(prob, matrix) <= TOLERANCE
+
+    if options.get('dual'):
+        # marginal costs; duals of degenerate rows may differ
+        duals = urbs.get_entity(prob, 'res_vertex')
+        matrix_duals = urbs.get_entity(matrix, 'res_vertex')
+        print('res_vertex duals, max. difference: {:g}'.format(
+            (duals - matrix_duals.reindex(duals.index)).abs().max()))
+    print('{}: objective {:.12g} (Pyomo), {:.12g} (matrix)'.format(
+        options or 'plain', objective, matrix_objective))
+
+
+def compare_presolve(data, timesteps, solver, **options):
+    """ solve the matrix backend with and without presolve; the postsolved
+    solution must be an optimum of the linear program as built """
+    matrix = urbs.create_model(data, timesteps, backend='matrix', **options)
+    assert urbs.solve_matrix(matrix, solver, presolve=False) == 'optimal'
+    x = matrix_solution(matrix, matrix)
+    assert urbs.solve_matrix(matrix, solver) == 'optimal'
+    x_presolved = matrix_solution(matrix, matrix)
+
+    objective = matrix.c.dot(x)
+    assert (abs(matrix.c.dot(x_presolved) - objective) <=
+            TOLERANCE * abs(objective))
+    assert matrix_violation(matrix, x_presolved) <= TOLERANCE
+    # alternative optima may differ, e.g. in the (costless) DSM shifts
+    differ = abs(x_presolved - x) > TOLERANCE * np.maximum(1, abs(x))
+    assert not matrix.c[differ].any()
+    print('{} presolve: objective {:.12g}, {} of {} variables differ'.format(
+        options or 'plain', matrix.c.dot(x_presolved),
+        np.count_nonzero(differ), matrix.ncols))
+
+
+if __name__ == '__main__':
+    data = urbs.read_excel('mimo-example.xlsx')
+    # includes empty columns (tau_pro at the initialisation timestep)
+    timesteps = range(3500, 3549)
+    for options in [{}, {'dual': True}, {'undirected': True}]:
+        compare(data, timesteps, 'glpk', **options)
+    # presolve does not apply to models with dual=True
+    for options in [{}, {'undirected': True}]:
+        compare_presolve(data, timesteps, 'glpk', **options)
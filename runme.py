@@ -1,10 +1,12 @@
+import copy
+import multiprocessing
 import os
 import pandas as pd
 import pyomo.environ
 import shutil
+import time
 import urbs
 from datetime import datetime
-from pyomo.opt.base import SolverFactory
 
 
 # SCENARIOS
@@ -70,12 +72,19 @@ def prepare_result_directory(result_name):
     return result_dir
 
 
-def setup_solver(optim, logfile='solver.log'):
-    """ """
-    if optim.name == 'gurobi':
+def setup_solver(optim, logfile='solver.log', threads=None):
+    """ set solver log file and (optional) number of solver threads """
+    if hasattr(optim, 'highs_options'):
+        # HiGHS, in-process via Pyomo's appsi interface
+        optim.options['log_file'] = logfile
+        if threads:
+            optim.options['threads'] = threads
+    elif optim.name in ('gurobi', 'gurobi_persistent'):
         # reference with list of option names
         # http://www.gurobi.com/documentation/5.6/reference-manual/parameters
         optim.set_options("logfile={}".format(logfile))
+        if threads:
+            optim.set_options("threads={}".format(threads))
         # optim.set_options("timelimit=7200")  # seconds
         # optim.set_options("mipgap=5e-4")  # default = 1e-4
     elif optim.name == 'glpk':
@@ -84,6 +93,15 @@ def setup_solver(optim, logfile='solver.log'):
         optim.set_options("log={}".format(logfile))
         # optim.set_options("tmlim=7200")  # seconds
         # optim.set_options("mipgap=.0005")
+        # glpk is single-threaded, so threads needs no option
+    elif optim.name == 'cplex':
+        optim.set_options("logfile={}".format(logfile))
+        if threads:
+            optim.set_options("threads={}".format(threads))
+    elif optim.name == 'cplex_persistent':
+        # in-process CPLEX only takes parameters, no log file name
+        if threads:
+            optim.set_options("threads={}".format(threads))
     else:
         print("Warning from setup_solver: no options set for solver "
               "'{}'!".format(optim.name))
@@ -91,38 +109,77 @@ def setup_solver(optim, logfile='solver.log'):
 
 
 def run_scenario(input_file, timesteps, scenario, result_dir,
-                 plot_tuples=None, plot_periods=None, report_tuples=None):
+                 plot_tuples=None, plot_periods=None, report_tuples=None,
+                 prob=None, threads=None, tee=True, warmstart=None,
+                 solver='glpk', optim=None, cache_dir=None):
     """ run an urbs model for given input, time steps and scenario
 
     Args:
-        input_file: filename to an Excel spreadsheet for urbs.read_excel
+        input_file: filename to an Excel spreadsheet for urbs.read_excel, or
+                    an input data dict (which is copied before modification)
         timesteps: a list of timesteps, e.g. range(0,8761)
         scenario: a scenario function that modifies the input data dict
         result_dir: directory name for result spreadsheet and plots
         plot_tuples: (optional) list of plot tuples (c.f. urbs.result_figures)
         plot_periods: (optional) dict of plot periods (c.f. urbs.result_figures)
         report_tuples: (optional) list of (sit, com) tuples (c.f. urbs.report)
+        prob: (optional) urbs model instance of a previous scenario; it is
+              updated in place if the scenario only changes mutable
+              parameters (c.f. urbs.update_model)
+        threads: (optional) maximum number of solver threads
+        tee: show solver output (default: True)
+        warmstart: (optional) solved urbs model instance or HDF5 result file
+                   (c.f. urbs.save) whose solution seeds the solve; by
+                   default, a model that must be created anew is seeded
+                   with the solution of prob (c.f. urbs.warm_start)
+        solver: solver name, e.g. 'glpk', 'gurobi' or 'highs'; its
+                persistent interface is used if installed
+                (c.f. urbs.solver_factory)
+        optim: (optional) solver of a previous scenario, which is re-used;
+               a persistent solver then only receives the changes of prob
+        cache_dir: (optional) model cache directory; if set, the scenario
+                   result is taken from or added to it (c.f.
+                   urbs.cached_solve) and prob, warmstart and optim are
+                   ignored
 
     Returns:
-        the urbs model instance
+        the urbs model instance (or result container, if cached)
     """
 
     # scenario name, read and modify data for scenario
     sce = scenario.__name__
-    data = urbs.read_excel(input_file)
+    if isinstance(input_file, dict):
+        data = copy.deepcopy(input_file)
+    else:
+        data = urbs.read_excel(input_file)
     data = scenario(data)
 
-    # create model
-    prob = urbs.create_model(data, timesteps)
-
-    # refresh time stamp string and create filename for logfile
-    now = prob.created
-    log_filename = os.path.join(result_dir, '{}.log').format(sce)
-
-    # solve model and read results
-    optim = SolverFactory('glpk')  # cplex, glpk, gurobi, ...
-    optim = setup_solver(optim, logfile=log_filename)
-    result = optim.solve(prob, tee=True)
+    if cache_dir is not None:
+        # take result or compiled model from cache, if possible
+        prob = urbs.cached_solve(data, timesteps, solver=solver,
+                                 cache_dir=cache_dir, tee=tee)
+    else:
+        # update previous model (which keeps its solution as starting
+        # point) or, if the scenario changes its structure, create a new one
+        if prob is not None:
+            try:
+                prob = urbs.update_model(prob, data)
+            except ValueError:
+                if warmstart is None:
+                    warmstart = prob
+                prob = None
+        if prob is None:
+            prob = urbs.create_model(data, timesteps)
+        if warmstart is not None:
+            urbs.warm_start(prob, warmstart)
+
+        # solve model and read results
+        log_filename = os.path.join(result_dir, '{}.log').format(sce)
+        if optim is None:
+            optim = urbs.solver_factory(solver)
+        optim = setup_solver(optim, logfile=log_filename, threads=threads)
+        result = urbs.solve(prob, optim, tee=tee)
+        prob.solver_status = str(result.solver.termination_condition)
 
     # save problem solution (and input data) to HDF5 file
     urbs.save(prob, os.path.join(result_dir, '{}.h5'.format(sce)))
@@ -143,6 +200,99 @@ def run_scenario(input_file, timesteps, scenario, result_dir,
         figure_size=(24, 9))
     return prob
 
+
+def run_scenario_summary(args):
+    """ run_scenario for one scenario of run_scenarios; returns a summary
+
+    Args:
+        args: tuple (input_file, timesteps, scenario, result_dir, kwargs),
+              kwargs being a dict of further arguments to run_scenario
+
+    Returns:
+        (summary dict, urbs model instance or None on error)
+    """
+    input_file, timesteps, scenario, result_dir, kwargs = args
+    start = time.time()
+    try:
+        prob = run_scenario(input_file, timesteps, scenario, result_dir,
+                            **kwargs)
+        status = prob.solver_status
+        objective = urbs.get_entity(prob, 'costs').sum()
+    except Exception as e:
+        # a failing scenario must not stop the remaining ones
+        prob = None
+        status = 'error: {}'.format(e)
+        objective = float('nan')
+    summary = {'scenario': scenario.__name__, 'status': status,
+               'objective': objective, 'time': time.time() - start}
+    return summary, prob
+
+
+def limit_threads(threads):
+    """ limit threads of numerical libraries and solvers in a worker """
+    for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'OPENBLAS_NUM_THREADS']:
+        os.environ[variable] = str(threads)
+
+
+def pool_run_scenario(args):
+    """ run_scenario_summary in a worker process; returns the summary only """
+    return run_scenario_summary(args)[0]
+
+
+def run_scenarios(input_file, timesteps, scenarios, result_dir, workers=1,
+                  threads=None, solver='glpk', **kwargs):
+    """ run several scenarios, optionally in parallel worker processes
+
+    With workers=1, scenarios run one after another in this process and
+    share one model and solver where possible (c.f. run_scenario).
+    Otherwise, each scenario runs in one of a pool of worker processes and
+    builds its own model. Solver output then only goes to the per-scenario
+    log files.
+
+    Args:
+        input_file: filename to an Excel spreadsheet or input data dict
+        timesteps: a list of timesteps, e.g. range(0,8761)
+        scenarios: a list of scenario functions
+        result_dir: directory name for all result files
+        workers: number of worker processes (default: 1)
+        threads: (optional) solver threads per worker; default: number of
+                 CPUs divided by workers
+        solver: solver name, e.g. 'glpk', 'gurobi' or 'highs'
+        **kwargs: further arguments to run_scenario, e.g. report_tuples
+
+    Returns:
+        DataFrame with solver status, objective value and run time (s) of
+        each scenario
+    """
+    if threads is None:
+        threads = max(1, multiprocessing.cpu_count() // workers)
+
+    if workers == 1:
+        summaries = []
+        prob = None
+        optim = urbs.solver_factory(solver)
+        for scenario in scenarios:
+            summary, new_prob = run_scenario_summary(
+                (input_file, timesteps, scenario, result_dir,
+                 dict(kwargs, prob=prob, threads=threads, optim=optim)))
+            summaries.append(summary)
+            prob = new_prob if new_prob is not None else prob
+    else:
+        tasks = [(input_file, timesteps, scenario, result_dir,
+                  dict(kwargs, threads=threads, tee=False, solver=solver))
+                 for scenario in scenarios]
+        pool = multiprocessing.Pool(workers, initializer=limit_threads,
+                                    initargs=(threads,))
+        try:
+            summaries = pool.map(pool_run_scenario, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    summary = pd.DataFrame(summaries).set_index('scenario')
+    return summary[['status', 'objective', 'time']]
+
 if __name__ == '__main__':
     input_file = 'mimo-example.xlsx'
     result_name = os.path.splitext(input_file)[0]  # cut away file extension
@@ -192,8 +342,26 @@ if __name__ == '__main__':
         scenario_north_process_caps,
         scenario_all_together]
 
-    for scenario in scenarios:
-        prob = run_scenario(input_file, timesteps, scenario, result_dir,
+    # number of parallel scenario runs; with 1 worker, scenarios run one
+    # after another and re-use the model, solver and previous solution
+    # where possible. For parallel runs in worker processes (without
+    # model re-use and solver output), set e.g.
+    # workers = min(len(scenarios), multiprocessing.cpu_count())
+    workers = 1
+
+    if workers == 1:
+        # read input once
+        data = urbs.read_excel(input_file)
+    else:
+        # convert input once; workers map its timeseries from the input
+        # directory and so share them in memory
+        data = os.path.join(result_dir, 'input')
+        urbs.convert_input(input_file, data, memmap=True)
+
+    summary = run_scenarios(data, timesteps, scenarios, result_dir,
+                            workers=workers,
                             plot_tuples=plot_tuples,
                             plot_periods=plot_periods,
                             report_tuples=report_tuples)
+    summary.to_csv(os.path.join(result_dir, 'summary.csv'))
+    print(summary)
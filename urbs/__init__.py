@@ -10,11 +10,21 @@ commodities.
 
 """
 
+from .decomposition import benders
+from .cache import cache_key, cached_solve
 from .data import COLORS
-from .model import create_model
-from .input import read_excel, get_input
+from .model import create_model, update_model
+from .input import (convert_input, read_excel, read_input_database,
+                    write_input_database, get_input)
+from .matrix import solve_matrix, write_mps
 from .output import get_constants, get_timeseries
 from .plot import plot, result_figures, to_color
+from .prune import prune_data
 from .pyomoio import get_entity, get_entities, list_entities
 from .report import report
+from .rolling import fix_capacities, rolling_horizon
 from .saveload import load, save
+from .solver import solve, solver_factory
+from .tsa import aggregate_timeseries
+from .validation import input_violations, validate_input
+from .warmstart import warm_start
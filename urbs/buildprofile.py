@@ -0,0 +1,131 @@
+"""Build profile for urbs models
+
+create_model(data, profile=True) returns a model that records, for each
+Set, Param, Var, Constraint and Objective, how long its construction took
+and how large it is:
+
+    prob = urbs.create_model(data, range(1, 169), profile='profile.json')
+    prob.build_profile.sort_values('time', ascending=False).head(10)
+
+"""
+import timeit
+import pandas as pd
+import pyomo.core as pyomo
+
+try:
+    import tracemalloc  # Python >= 3.4
+except ImportError:
+    tracemalloc = None
+
+PROFILE_COLUMNS = ['type', 'time', 'indices', 'skipped', 'nonzeros',
+                   'memory']
+
+
+class ProfiledModel(pyomo.ConcreteModel):
+    """ConcreteModel that profiles the construction of its components.
+
+    Pyomo constructs a component of a ConcreteModel as soon as it is added
+    to the model, i.e. in add_component. This class wraps add_component and
+    records one row per component in attribute build_profile.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ProfiledModel, self).__init__(*args, **kwargs)
+        self._profile_rows = []
+
+    def add_component(self, name, val):
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            memory = tracemalloc.get_traced_memory()[0]
+        else:
+            memory = None
+
+        start = timeit.default_timer()
+        super(ProfiledModel, self).add_component(name, val)
+        duration = timeit.default_timer() - start
+
+        if memory is not None:
+            memory = tracemalloc.get_traced_memory()[0] - memory
+        self._profile_rows.append(
+            (name, type(val).__name__, duration) + component_size(val) +
+            (memory,))
+
+    @property
+    def build_profile(self):
+        """DataFrame of component build times and sizes (in build order).
+
+        Columns: type (component class), time (construction wall time in
+        seconds), indices (number of constructed indices), skipped (number
+        of Constraint indices whose rule returned Constraint.Skip),
+        nonzeros (number of variable occurrences in Constraints and
+        Objectives), memory (allocated bytes, if traced by tracemalloc)
+        """
+        rows = self._profile_rows
+        profile = pd.DataFrame([row[1:] for row in rows],
+                               index=pd.Index([row[0] for row in rows],
+                                              name='Name'),
+                               columns=PROFILE_COLUMNS)
+        return profile
+
+
+def component_size(component):
+    """Return size of a constructed model component.
+
+    Args:
+        component: a Pyomo Set, Param, Var, Constraint or Objective
+
+    Returns:
+        (indices, skipped, nonzeros) tuple
+    """
+    if isinstance(component, pyomo.Set):
+        return (len(component), 0, 0)
+
+    indices = len(component)
+    skipped = 0
+    nonzeros = 0
+    if isinstance(component, (pyomo.Constraint, pyomo.Objective)):
+        try:
+            from pyomo.core.expr import identify_variables
+        except ImportError:
+            from pyomo.core.expr.current import identify_variables
+
+        if component.is_indexed():
+            skipped = len(component.index_set()) - indices
+        for data in component.values():
+            expr = (data.body if isinstance(component, pyomo.Constraint)
+                    else data.expr)
+            nonzeros += len(list(identify_variables(expr,
+                                                    include_fixed=False)))
+    return (indices, skipped, nonzeros)
+
+
+def start_profile():
+    """Create an empty ProfiledModel and start tracing memory allocations.
+
+    Memory tracing (Python >= 3.4 only) slows down model construction, but
+    does so roughly evenly for all components.
+
+    Returns:
+        (model, tracing) tuple; tracing is True if tracing was started here
+        and must be stopped by finish_profile
+    """
+    tracing = tracemalloc is not None and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    return ProfiledModel(), tracing
+
+
+def finish_profile(m, tracing, filename=None):
+    """Stop memory tracing and optionally write the profile to JSON.
+
+    Args:
+        m: a ProfiledModel
+        tracing: return value of start_profile
+        filename: (optional) JSON file to write the profile to
+
+    Returns:
+        Nothing
+    """
+    if tracing:
+        tracemalloc.stop()
+    if filename is not None:
+        m.build_profile.to_json(filename, orient='index')
@@ -0,0 +1,277 @@
+"""Content-addressed cache of compiled and solved urbs models
+
+Models are identified by a hash of their input data, timesteps, the
+arguments of create_model and the urbs source code. For each model, the
+cache stores the compiled problem and, once solved, its result:
+
+- Pyomo backend: the LP file, the symbol map from LP column and row names
+  back to urbs entities, and input, sets and parameters (model.h5)
+- matrix backend: the MatrixModel (model.pkl), which contains both the
+  problem and its entity names
+
+Usage, e.g. in a run script:
+
+    result = urbs.cached_solve(data, timesteps, cache_dir='cache')
+    urbs.report(result, 'report.xlsx')
+
+If the result is cached, it is loaded (cf. load) and neither model creation
+nor solving take place. If only the compiled problem is cached, it is solved
+without creating the model. The least recently used entries are removed
+when the cache exceeds max_size bytes.
+
+"""
+import copy
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import pandas as pd
+from .matrix import MatrixModel, solve_matrix
+from .model import create_model
+from .pyomoio import get_entity, list_entities
+from .saveload import load, save
+from .solver import solve, solver_factory
+
+MAX_CACHE_SIZE = 2e9  # bytes
+
+# increase to invalidate all caches, e.g. when their file format changes
+CACHE_VERSION = 1
+
+_code_hash = None
+
+
+def cache_key(data, timesteps=None, dt=1, dual=False, backend='pyomo'):
+    """Return the cache key of a model.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        timesteps, dt, dual, backend: arguments of create_model
+
+    Returns:
+        hexadecimal SHA-256 hash string of data, arguments and urbs code
+    """
+    key = hashlib.sha256()
+    if timesteps is not None:
+        timesteps = list(timesteps)
+    key.update(repr((CACHE_VERSION, code_hash(), timesteps, dt, dual,
+                     backend)).encode('utf-8'))
+    for name in sorted(data):
+        key.update(name.encode('utf-8'))
+        # text representation is independent of pandas/pickle versions
+        key.update(data[name].to_csv().encode('utf-8'))
+    return key.hexdigest()
+
+
+def code_hash():
+    """Return hash of the urbs source code, so that cache entries of a
+    modified model formulation are not reused."""
+    global _code_hash
+    if _code_hash is None:
+        key = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(glob.glob(os.path.join(package_dir,
+                                                      '*.py'))):
+            with open(filename, 'rb') as f:
+                key.update(f.read())
+        _code_hash = key.hexdigest()
+    return _code_hash
+
+
+def cached_solve(data, timesteps=None, dt=1, dual=False, backend='pyomo',
+                 solver='glpk', cache_dir='cache', max_size=MAX_CACHE_SIZE,
+                 tee=False):
+    """Create and solve a model, or take it from the cache.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        timesteps, dt, dual, backend: arguments of create_model
+        solver: solver name (cf. solver_factory; solve_matrix for backend
+                'matrix')
+        cache_dir: cache directory, created if necessary
+        max_size: maximum cache size in bytes (default: MAX_CACHE_SIZE)
+        tee: set True to show solver output
+
+    Returns:
+        a solved urbs model instance or result container, with attribute
+        solver_status; a Pyomo model instance only if the model was not
+        cached yet (all reporting functions accept each of them)
+    """
+    entry = os.path.join(cache_dir, cache_key(data, timesteps, dt, dual,
+                                              backend))
+    result_file = os.path.join(entry, 'result.h5')
+
+    if os.path.exists(result_file):
+        os.utime(entry, None)  # mark as recently used
+        prob = load(result_file)
+        prob.solver_status = 'optimal'
+        return prob
+
+    if is_compiled(entry, backend):
+        os.utime(entry, None)
+        prob = load_compiled(entry, backend)
+        status = solve_compiled(prob, entry, solver, tee)
+    else:
+        # create_model adds columns to data, which would change its key
+        prob = create_model(copy.deepcopy(data), timesteps, dt=dt,
+                            dual=dual, backend=backend)
+        if not os.path.exists(entry):
+            os.makedirs(entry)
+        store_compiled(prob, entry)
+        if backend == 'matrix':
+            status = solve_matrix(prob, solver, tee=tee)
+        else:
+            result = solve(prob, solver_factory(solver), tee=tee)
+            status = str(result.solver.termination_condition)
+
+    prob.solver_status = status
+    if status == 'optimal':
+        save(prob, result_file)
+    evict(cache_dir, max_size, keep=entry)
+    return prob
+
+
+def is_compiled(entry, backend):
+    """Return True if cache entry contains a compiled problem."""
+    if backend == 'matrix':
+        return os.path.exists(os.path.join(entry, 'model.pkl'))
+    return all(os.path.exists(os.path.join(entry, filename))
+               for filename in ['model.lp', 'model.h5', 'symbols.pkl'])
+
+
+def store_compiled(prob, entry):
+    """Store the compiled problem of a model in a cache entry.
+
+    Args:
+        prob: a urbs model instance, not yet solved
+        entry: cache entry directory
+
+    Returns:
+        Nothing
+    """
+    if isinstance(prob, MatrixModel):
+        with open(os.path.join(entry, 'model.pkl'), 'wb') as f:
+            pickle.dump(prob, f, protocol=2)
+        return
+
+    _, smap_id = prob.write(os.path.join(entry, 'model.lp'),
+                            io_options={'symbolic_solver_labels': False})
+    symbol_map = prob.solutions.symbol_map[smap_id].byObject
+
+    # input, sets and parameters do not depend on the solution
+    entity_types = ['set', 'par']
+    with pd.HDFStore(os.path.join(entry, 'model.h5'), mode='w') as store:
+        for name in prob._data:
+            store['data/' + name] = prob._data[name]
+        for entity_type in entity_types:
+            for name in list_entities(prob, entity_type).index:
+                store['result/' + name] = get_entity(prob, name)
+
+    # for variables (and constraints, for duals), the LP symbol of each
+    # entry of get_entity, or None if it does not appear in the LP file
+    symbols = {}
+    entity_types = ['var']
+    if hasattr(prob, 'dual'):
+        entity_types.append('con')
+    for entity_type in entity_types:
+        for name in list_entities(prob, entity_type).index:
+            entity = getattr(prob, name)
+            if entity_type == 'con':
+                # get_entity needs duals to determine the index
+                for _, con in entity.iteritems():
+                    prob.dual[con] = 0
+            symbols[name] = (
+                entity_type,
+                get_entity(prob, name).index,
+                [symbol_map.get(id(data)) for _, data in entity.iteritems()])
+    if hasattr(prob, 'dual'):
+        prob.dual.clear()
+    with open(os.path.join(entry, 'symbols.pkl'), 'wb') as f:
+        pickle.dump(symbols, f, protocol=2)
+
+
+def load_compiled(entry, backend):
+    """Load the compiled problem of a cache entry.
+
+    Args:
+        entry: cache entry directory
+        backend: 'pyomo' or 'matrix'
+
+    Returns:
+        a MatrixModel (matrix) or a result container with input, sets and
+        parameters (pyomo)
+    """
+    if backend == 'matrix':
+        with open(os.path.join(entry, 'model.pkl'), 'rb') as f:
+            return pickle.load(f)
+    return load(os.path.join(entry, 'model.h5'))
+
+
+def solve_compiled(prob, entry, solver, tee=False):
+    """Solve a compiled problem and add its solution to prob.
+
+    Args:
+        prob: the return value of load_compiled
+        entry: cache entry directory
+        solver: solver name
+        tee: set True to show solver output
+
+    Returns:
+        solver status, e.g. 'optimal'
+    """
+    if isinstance(prob, MatrixModel):
+        return solve_matrix(prob, solver, tee=tee)
+
+    from pyomo.environ import SolverFactory
+    optim = SolverFactory(solver)  # file based, for solving the LP file
+    result = optim.solve(os.path.join(entry, 'model.lp'), tee=tee)
+    status = str(result.solver.termination_condition)
+    if status != 'optimal':
+        return status
+
+    solution = result.solution(0)
+    with open(os.path.join(entry, 'symbols.pkl'), 'rb') as f:
+        symbols = pickle.load(f)
+    for name, (entity_type, index, entity_symbols) in symbols.items():
+        if entity_type == 'var':
+            entries, key = solution.variable, 'Value'
+        else:
+            entries, key = solution.constraint, 'Dual'
+        # solvers may omit zero values from their solution
+        values = [entries.get(symbol, {}).get(key, 0) if symbol is not None
+                  else None for symbol in entity_symbols]
+        prob._result[name] = pd.Series(values, index=index, name=name,
+                                       dtype=float)
+    return status
+
+
+def evict(cache_dir, max_size=MAX_CACHE_SIZE, keep=None):
+    """Remove least recently used cache entries beyond max_size.
+
+    Args:
+        cache_dir: cache directory
+        max_size: maximum total size of all entries in bytes
+        keep: (optional) entry directory that must not be removed
+
+    Returns:
+        list of removed entry directories
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if os.path.isdir(entry):
+            size = sum(os.path.getsize(os.path.join(entry, filename))
+                       for filename in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), entry, size))
+
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, entry, size in sorted(entries):
+        if total <= max_size:
+            break
+        if keep is not None and os.path.samefile(entry, keep):
+            continue
+        shutil.rmtree(entry)
+        total -= size
+        removed.append(entry)
+    return removed
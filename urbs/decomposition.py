@@ -0,0 +1,596 @@
+"""Benders decomposition of investment and dispatch
+
+Capacity expansion problems with many sites and a full year can be too big
+to be solved as one linear program. Benders decomposition splits them:
+
+- the master problem holds the new capacities of processes, transmissions
+  and storages, their investment and fixed costs and the constraints that
+  only involve capacities (bounds, area, symmetry);
+- one subproblem per time block computes the dispatch for the capacities
+  of the master problem. The duals of the constraints fixing the
+  capacities yield an optimality cut, a linear estimate of the operational
+  costs of the block for other capacities, which is added to the master.
+  If no dispatch is feasible for the capacities (e.g. intermittent supply
+  exceeds demand and storage), the subproblem minimises the capacity
+  deviation needed instead; its duals yield a feasibility cut, which
+  excludes these capacities from the master problem.
+
+Master and subproblems are solved alternately until the gap between the
+lower bound (master objective) and the upper bound (costs of the best
+capacities found) is small enough. Initially, the operational costs of each
+block are bounded from below by its dispatch with free capacities (within
+their restrictions), so that cuts cannot make the master problem unbounded:
+
+    data = urbs.read_excel('mimo-example.xlsx')
+    result = urbs.benders(data, range(0, 8761), blocks=12, workers=4)
+    urbs.report(result, 'report.xlsx')
+
+Like the windows of rolling_horizon, time blocks are modelled independently:
+each block returns to its initial storage content at its end, and annual
+limits (commodity max, CO2 limit) apply to each block, scaled to its length.
+The result is therefore an upper bound of the monolithic optimum, identical
+to it if these limits do not bind.
+
+"""
+import multiprocessing
+import pandas as pd
+import pyomo.core as pyomo
+from .model import create_model
+from .pyomoio import get_entity, list_entities
+from .saveload import ResultContainer
+from .solver import solve, solver_factory
+
+# new capacities, the variables of the master problem
+CAPACITY_VARIABLES = ['cap_pro_new', 'cap_tra_new', 'cap_sto_c_new',
+                      'cap_sto_p_new']
+
+# constraints that only involve capacity variables: the definitions of
+# total capacities are part of master and subproblems, the restrictions
+# only of the master problem
+CAPACITY_DEFINITIONS = ['def_process_capacity', 'def_transmission_capacity',
+                        'def_storage_power', 'def_storage_capacity']
+CAPACITY_RESTRICTIONS = ['res_process_capacity', 'res_area',
+                         'res_sell_buy_symmetry', 'res_transmission_capacity',
+                         'res_transmission_symmetry', 'res_storage_power',
+                         'res_storage_capacity']
+
+# cost types that only depend on capacities
+CAPACITY_COSTS = ['Invest', 'Fixed']
+
+
+def benders(data, timesteps=None, blocks=4, gap=1e-4, max_iterations=100,
+            solver='glpk', workers=1, dt=1):
+    """Solve an urbs model by Benders decomposition.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        timesteps: list of timesteps, starting with the initialisation
+                   timestep; default: demand timeseries
+        blocks: number of time blocks (subproblems) of equal length
+        gap: relative gap (upper - lower bound) / upper bound to stop at
+        max_iterations: maximum number of master problem solves
+        solver: solver name (cf. solver_factory), default: 'glpk'
+        workers: number of processes solving subproblems in parallel;
+                 each keeps its subproblems between iterations
+        dt: timestep duration in hours (default: 1)
+
+    Returns:
+        result container (cf. load) with sets, parameters and variables of
+        all time blocks at the best capacities found, and the attributes
+        solver_status ('optimal' if gap was reached, else
+        'maxIterations') and iterations (DataFrame of lower bound, upper
+        bound, gap and number of feasibility cuts per iteration)
+    """
+    if 'periods' in data:
+        raise ValueError("Benders decomposition does not support typical "
+                         "periods")
+    if timesteps is None:
+        timesteps = data['demand'].index.tolist()
+    timesteps = list(timesteps)
+    if not 1 <= blocks <= len(timesteps) - 1:
+        raise ValueError("blocks must be between 1 and the number of "
+                         "modelled timesteps")
+    block_timesteps = split_timesteps(timesteps, blocks)
+    shares = [float(len(block) - 1) / (len(timesteps) - 1)
+              for block in block_timesteps]
+
+    subproblems = Subproblems(data, block_timesteps, dt, solver, workers)
+    try:
+        master = create_master(data, timesteps, [
+            share * bound
+            for share, bound in zip(shares, subproblems.lower_bounds())], dt)
+        iterations = []
+        best = None
+        for iteration in range(max_iterations):
+            # capacities and lower bound; the master problem gets new cuts,
+            # so it is loaded anew into persistent solvers (it is small)
+            result = solve(master, solver_factory(solver))
+            status = str(result.solver.termination_condition)
+            if status != 'optimal':
+                raise RuntimeError("Master problem could not be solved: "
+                                   "{}".format(status))
+            lower = pyomo.value(master.benders_obj)
+            capacities = get_capacities(master)
+            capacity_costs = sum(pyomo.value(master.costs[cost_type])
+                                 for cost_type in CAPACITY_COSTS)
+
+            # upper bound: costs of these capacities, if feasible
+            solutions = subproblems.solve(capacities)
+            if all(feasible for feasible, _, _ in solutions):
+                upper = capacity_costs + sum(
+                    share * objective
+                    for share, (_, objective, _) in zip(shares, solutions))
+                if best is None or upper < best['upper']:
+                    best = {'upper': upper, 'capacities': capacities,
+                            'costs': get_entity(master, 'costs')}
+
+            for block, (feasible, objective, duals) in enumerate(solutions):
+                add_cut(master, block, shares[block], feasible, objective,
+                        duals, capacities)
+
+            infeasible = sum(not feasible for feasible, _, _ in solutions)
+            if best is None:
+                iterations.append((lower, float('inf'), float('inf'),
+                                   infeasible))
+            else:
+                iterations.append((lower, best['upper'],
+                                   (best['upper'] - lower) /
+                                   abs(best['upper']), infeasible))
+            if iterations[-1][2] <= gap:
+                break
+
+        if best is None:
+            raise RuntimeError("No capacities with a feasible dispatch found "
+                               "in {} iterations".format(max_iterations))
+        # subproblems still contain the dispatch of the last capacities
+        if capacities is not best['capacities']:
+            subproblems.solve(best['capacities'])
+        results = subproblems.results()
+    finally:
+        subproblems.close()
+
+    prob = merge_results(data, block_timesteps, shares, results,
+                         best['costs'])
+    prob.iterations = pd.DataFrame(
+        iterations, columns=['lower', 'upper', 'gap', 'feasibility_cuts'])
+    prob.iterations.index.name = 'iteration'
+    prob.solver_status = ('optimal' if iterations[-1][2] <= gap
+                          else 'maxIterations')
+    return prob
+
+
+def split_timesteps(timesteps, blocks):
+    """Split timesteps into consecutive blocks of (almost) equal length.
+
+    Args:
+        timesteps: list of timesteps, starting with the initialisation
+                   timestep
+        blocks: number of blocks
+
+    Returns:
+        list of timestep lists, each starting with the last timestep of the
+        previous block (or the initialisation timestep) like timesteps
+    """
+    n = len(timesteps) - 1
+    bounds = [n * b // blocks for b in range(blocks + 1)]
+    return [timesteps[bounds[b]:bounds[b + 1] + 1] for b in range(blocks)]
+
+
+def create_master(data, timesteps, lower_bounds, dt=1):
+    """Create the master problem.
+
+    It is an urbs model of a single modelled timestep, in which only the
+    capacity constraints and costs are active. Variable theta[block]
+    estimates the operational costs of a time block by the cuts added so
+    far; a lower bound keeps it finite before (and beyond) them.
+
+    Args:
+        data: input data dict
+        timesteps: list of timesteps of the whole horizon
+        lower_bounds: list of lower bounds of theta, one per time block
+        dt: timestep duration in hours
+
+    Returns:
+        a pyomo ConcreteModel
+    """
+    master = create_model(data, timesteps[:2], dt=dt)
+    for con in master.component_objects(pyomo.Constraint, active=True):
+        if con.name not in CAPACITY_DEFINITIONS + CAPACITY_RESTRICTIONS:
+            if con.name != 'def_costs':
+                con.deactivate()
+    for cost_type in master.cost_type:
+        if cost_type not in CAPACITY_COSTS:
+            master.def_costs[cost_type].deactivate()
+            master.costs[cost_type].fix(0)
+
+    master.theta = pyomo.Var(
+        range(len(lower_bounds)),
+        within=pyomo.Reals,
+        bounds=lambda m, block: (lower_bounds[block], None),
+        doc='Estimated operational costs (EUR/a) of time block')
+    master.cuts = pyomo.ConstraintList(
+        doc='theta >= optimality cut from subproblem')
+    master.obj.deactivate()
+    master.benders_obj = pyomo.Objective(
+        expr=sum(master.costs[cost_type] for cost_type in CAPACITY_COSTS) +
+        pyomo.summation(master.theta),
+        sense=pyomo.minimize,
+        doc='minimize(capacity costs + estimated operational costs)')
+    return master
+
+
+def get_capacities(master):
+    """Return the new capacities of a solved master problem.
+
+    Returns:
+        dict {variable name: {index: value}}, values rounded up to 0
+    """
+    return {name: {index: max(0, var.value or 0)
+                   for index, var in getattr(master, name).iteritems()}
+            for name in CAPACITY_VARIABLES}
+
+
+def add_cut(master, block, share, feasible, objective, duals, capacities):
+    """Add an optimality or feasibility cut of a time block to the master.
+
+    Optimality cut:
+        theta[block] >= share * (objective + sum(dual * (cap - value)))
+    Feasibility cut, objective being the minimal capacity deviation:
+        0 >= objective + sum(dual * (cap - value))
+
+    Args:
+        master: master problem
+        block: time block number
+        share: share of the block in all modelled timesteps
+        feasible: True if the subproblem had a feasible dispatch
+        objective: operational costs (EUR/a) or minimal capacity deviation
+        duals: dict {variable name: {index: dual}} of the fixed capacities
+        capacities: dict {variable name: {index: value}} of the subproblem
+
+    Returns:
+        Nothing
+    """
+    if not feasible:
+        share = 1
+    # cuts are scaled to coefficients of at most 1, as duals of expensive
+    # capacities (e.g. if only slack is left) are otherwise many orders of
+    # magnitude apart from those of theta
+    scale = max([1] + [share * abs(dual) for name in CAPACITY_VARIABLES
+                       for dual in duals[name].values()])
+    estimate = share * objective / scale
+    for name in CAPACITY_VARIABLES:
+        var = getattr(master, name)
+        for index, dual in duals[name].items():
+            if dual:
+                estimate += (share * dual / scale *
+                             (var[index] - capacities[name][index]))
+    if feasible:
+        master.cuts.add(master.theta[block] / scale >= estimate)
+    else:
+        master.cuts.add(estimate <= 0)
+
+
+def create_subproblem(data, timesteps, dt=1):
+    """Create the dispatch subproblem of a time block.
+
+    Capacity restrictions and costs are left to the master problem. The new
+    capacities are fixed by constraints res_benders_<variable> to the values
+    of mutable parameters benders_<variable>, plus deviations
+    benders_up/down_<variable>. These are fixed to 0, except for the
+    feasibility objective benders_deviation, which is deactivated.
+
+    Args:
+        data: input data dict
+        timesteps: list of timesteps of the time block
+        dt: timestep duration in hours
+
+    Returns:
+        a pyomo ConcreteModel
+    """
+    prob = create_model(data, timesteps, dt=dt, dual=True)
+    for name in CAPACITY_RESTRICTIONS:
+        getattr(prob, name).deactivate()
+    for cost_type in CAPACITY_COSTS:
+        prob.def_costs[cost_type].deactivate()
+        prob.costs[cost_type].fix(0)
+
+    # the dispatch constraints keep total capacities non-negative; bounds on
+    # new capacities would only make the duals of the fixing constraints
+    # degenerate, i.e. the cuts weaker
+    deviations = []
+    for name in CAPACITY_VARIABLES:
+        var = getattr(prob, name)
+        for _, var_data in var.iteritems():
+            data.domain = pyomo.Reals
+        value = pyomo.Param(var.index_set(), initialize=0, mutable=True)
+        up = pyomo.Var(var.index_set(), within=pyomo.NonNegativeReals)
+        down = pyomo.Var(var.index_set(), within=pyomo.NonNegativeReals)
+        setattr(prob, 'benders_' + name, value)
+        setattr(prob, 'benders_up_' + name, up)
+        setattr(prob, 'benders_down_' + name, down)
+        up.fix(0)
+        down.fix(0)
+        setattr(prob, 'res_benders_' + name, pyomo.Constraint(
+            var.index_set(),
+            rule=fixing_rule(var, value, up, down),
+            doc='{} == capacity of master problem'.format(name)))
+        deviations.extend([up, down])
+
+    prob.benders_deviation = pyomo.Objective(
+        expr=sum(pyomo.summation(deviation) for deviation in deviations),
+        sense=pyomo.minimize,
+        doc='minimize(capacity deviation from master problem)')
+    prob.benders_deviation.deactivate()
+    return prob
+
+
+def fixing_rule(var, value, up, down):
+    """Return the rule of res_benders_<name>: var == value + up - down."""
+    return lambda m, *index: (
+        var[index] == value[index] + up[index] - down[index])
+
+
+def solve_subproblem(prob, optim, solver, capacities):
+    """Solve a subproblem for given capacities.
+
+    If its dispatch is infeasible, the minimal capacity deviation is
+    determined instead (with a new solver object, as the objective
+    changes).
+
+    Args:
+        prob: a subproblem as returned by create_subproblem
+        optim: its solver
+        solver: solver name, for the feasibility problem
+        capacities: dict {variable name: {index: value}}
+
+    Returns:
+        (feasible, operational costs or capacity deviation, dict {variable
+        name: {index: dual}})
+    """
+    for name in CAPACITY_VARIABLES:
+        param = getattr(prob, 'benders_' + name)
+        for index, value in capacities[name].items():
+            param[index] = value
+    feasible = solve_block(prob, optim)
+    if feasible:
+        objective = pyomo.value(prob.obj)
+    else:
+        deviations = [getattr(prob, 'benders_{}_{}'.format(direction, name))
+                      for name in CAPACITY_VARIABLES
+                      for direction in ['up', 'down']]
+        for deviation in deviations:
+            deviation.unfix()
+        prob.obj.deactivate()
+        prob.benders_deviation.activate()
+        if not solve_block(prob, solver_factory(solver)):
+            raise RuntimeError("Time block starting at timestep {} has no "
+                               "feasible dispatch for any "
+                               "capacities".format(prob.t[1]))
+        objective = pyomo.value(prob.benders_deviation)
+        for deviation in deviations:
+            deviation.fix(0)
+        prob.benders_deviation.deactivate()
+        prob.obj.activate()
+
+    duals = {}
+    for name in CAPACITY_VARIABLES:
+        con = getattr(prob, 'res_benders_' + name)
+        duals[name] = {index: prob.dual[con[index]] for index in con}
+    return feasible, objective, duals
+
+
+def lower_bound(prob, solver):
+    """Return a lower bound of the operational costs of a subproblem.
+
+    The bound is the minimum over all capacities within their restrictions,
+    i.e. with capacities as variables but without their costs.
+
+    Args:
+        prob: a subproblem as returned by create_subproblem
+        solver: solver name
+
+    Returns:
+        operational costs (EUR/a)
+    """
+    for name in CAPACITY_RESTRICTIONS:
+        getattr(prob, name).activate()
+    for name in CAPACITY_VARIABLES:
+        getattr(prob, 'res_benders_' + name).deactivate()
+    result = solve(prob, solver_factory(solver))
+    status = str(result.solver.termination_condition)
+    if status != 'optimal':
+        raise RuntimeError("Operational costs of time block starting at "
+                           "timestep {} have no lower bound ({}); capacities "
+                           "need upper bounds".format(prob.t[1], status))
+    for name in CAPACITY_RESTRICTIONS:
+        getattr(prob, name).deactivate()
+    for name in CAPACITY_VARIABLES:
+        getattr(prob, 'res_benders_' + name).activate()
+    return pyomo.value(prob.obj)
+
+
+def solve_block(prob, optim):
+    """Solve a subproblem; return True if optimal, False if infeasible.
+
+    lower_bound has shown every block to be bounded, so 'unbounded' means
+    infeasible, too (GLPK reports an LP without primal feasible solution as
+    unbounded).
+    """
+    result = solve(prob, optim)
+    status = str(result.solver.termination_condition)
+    if status in ['infeasible', 'infeasibleOrUnbounded', 'unbounded']:
+        return False
+    if status != 'optimal':
+        raise RuntimeError("Time block starting at timestep {} could not be "
+                           "solved: {}".format(prob.t[1], status))
+    if not len(prob.dual) and hasattr(optim, 'load_duals'):
+        optim.load_duals()  # persistent solvers
+    return True
+
+
+def block_results(prob):
+    """Return sets, parameters and variables of a solved subproblem.
+
+    Returns:
+        dict {entity name: Series}, like the result cache of save
+    """
+    results = {}
+    for entity_type in ['set', 'par', 'var']:
+        for name in list_entities(prob, entity_type).index:
+            if not name.startswith('benders_'):
+                results[name] = get_entity(prob, name)
+    return results
+
+
+def subproblem_worker(conn, data, block_timesteps, dt, solver):
+    """Keep subproblems of some time blocks in a worker process.
+
+    Answers messages of Subproblems received through connection conn:
+    ('solve', capacities) with the list of solve_subproblem return values,
+    ('bounds', None) with the list of lower_bound values, ('results', None)
+    with the list of block_results and ('close', None) by returning.
+    Exceptions are sent back instead of an answer.
+    """
+    try:
+        subproblems = [(create_subproblem(data, timesteps, dt),
+                        solver_factory(solver))
+                       for timesteps in block_timesteps]
+        conn.send(None)
+        while True:
+            message, capacities = conn.recv()
+            if message == 'solve':
+                conn.send([solve_subproblem(prob, optim, solver, capacities)
+                           for prob, optim in subproblems])
+            elif message == 'bounds':
+                conn.send([lower_bound(prob, solver)
+                           for prob, _ in subproblems])
+            elif message == 'results':
+                conn.send([block_results(prob) for prob, _ in subproblems])
+            else:
+                break
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+
+class Subproblems(object):
+    """ Subproblems of all time blocks, in this or in worker processes. """
+    def __init__(self, data, block_timesteps, dt, solver, workers=1):
+        self.blocks = len(block_timesteps)
+        self.solver = solver
+        self.workers = max(1, min(workers, self.blocks))
+        if self.workers == 1:
+            self.subproblems = [(create_subproblem(data, timesteps, dt),
+                                 solver_factory(solver))
+                                for timesteps in block_timesteps]
+            return
+
+        # worker w keeps blocks w, w + workers, w + 2 * workers, ...
+        self.connections = []
+        self.processes = []
+        for w in range(self.workers):
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=subproblem_worker,
+                args=(child_conn, data, block_timesteps[w::self.workers],
+                      dt, solver))
+            process.start()
+            self.connections.append(conn)
+            self.processes.append(process)
+        self.receive()  # wait until all subproblems are created
+
+    def solve(self, capacities):
+        """Solve all subproblems for given capacities.
+
+        Returns:
+            list of (feasible, objective, duals), cf. solve_subproblem
+        """
+        if self.workers == 1:
+            return [solve_subproblem(prob, optim, self.solver, capacities)
+                    for prob, optim in self.subproblems]
+        return self.request('solve', capacities)
+
+    def lower_bounds(self):
+        """Return list of lower_bound of all subproblems."""
+        if self.workers == 1:
+            return [lower_bound(prob, self.solver)
+                    for prob, _ in self.subproblems]
+        return self.request('bounds')
+
+    def results(self):
+        """Return list of block_results of all subproblems."""
+        if self.workers == 1:
+            return [block_results(prob) for prob, _ in self.subproblems]
+        return self.request('results')
+
+    def request(self, message, capacities=None):
+        """Send message to all workers and return their answers."""
+        for conn in self.connections:
+            conn.send((message, capacities))
+        return self.receive()
+
+    def receive(self):
+        """Receive answers of all workers, in block order."""
+        answers = [conn.recv() for conn in self.connections]
+        for answer in answers:
+            if isinstance(answer, Exception):
+                raise answer
+        if answers[0] is None:
+            return None
+        blocks = [None] * self.blocks
+        for w, answer in enumerate(answers):
+            blocks[w::self.workers] = answer
+        return blocks
+
+    def close(self):
+        """Stop worker processes."""
+        if self.workers == 1:
+            return
+        for conn, process in zip(self.connections, self.processes):
+            if process.is_alive():
+                try:
+                    conn.send(('close', None))
+                except (IOError, OSError):
+                    pass
+            process.join()
+
+
+def merge_results(data, block_timesteps, shares, results, capacity_costs):
+    """Combine the results of all time blocks.
+
+    Time-indexed entities are concatenated, the initialisation timestep of
+    each block being taken from the previous block. Other entities stem from
+    the first block, except for costs: capacity costs from the master
+    problem, operational costs averaged over all blocks (weighted by their
+    share of modelled timesteps).
+
+    Args:
+        data: input data dict
+        block_timesteps: list of timestep lists of all blocks
+        shares: list of the blocks' shares of modelled timesteps
+        results: list of block_results of all blocks
+        capacity_costs: costs entity of the master problem
+
+    Returns:
+        a result container
+    """
+    merged = {}
+    for block, block_result in enumerate(results):
+        for name, entity in block_result.items():
+            if entity.index.names[0] == 't':
+                if block > 0:
+                    entity = entity[entity.index.get_level_values(0) !=
+                                    block_timesteps[block][0]]
+                merged.setdefault(name, []).append(entity)
+            elif block == 0:
+                merged[name] = [entity]
+    merged = {name: pd.concat(parts) if len(parts) > 1 else parts[0]
+              for name, parts in merged.items()}
+
+    costs = sum(share * block_result['costs']
+                for share, block_result in zip(shares, results))
+    for cost_type in CAPACITY_COSTS:
+        costs[cost_type] = capacity_costs[cost_type]
+    merged['costs'] = costs
+    return ResultContainer(data, merged)
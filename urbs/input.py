@@ -1,8 +1,103 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import numpy as np
 import pandas as pd
 from xlrd import XLRDError
+from .tsa import TIMESERIES
+from .util import is_string
+from .validation import validate_input
 
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
 
-def read_excel(filename):
+# worksheets of the input file: (sheet name, input dict key, index columns,
+# split 'Site.Commodity' column titles into a MultiIndex)
+SHEETS = [
+    ('Site', 'site', ['Name'], False),
+    ('Commodity', 'commodity', ['Site', 'Commodity', 'Type'], False),
+    ('Process', 'process', ['Site', 'Process'], False),
+    ('Process-Commodity', 'process_commodity',
+     ['Process', 'Commodity', 'Direction'], False),
+    ('Transmission', 'transmission',
+     ['Site In', 'Site Out', 'Transmission', 'Commodity'], False),
+    ('Storage', 'storage', ['Site', 'Storage', 'Commodity'], False),
+    ('Demand', 'demand', ['t'], True),
+    ('SupIm', 'supim', ['t'], True),
+    ('Buy-Sell-Price', 'buy_sell_price', ['t'], True),
+    ('DSM', 'dsm', ['Site', 'Commodity'], False),
+    ('Global', 'global_prop', ['Property'], False)]
+
+# file extensions of spreadsheets that read_sheet can stream
+STREAM_EXTENSIONS = ['.xlsx', '.xlsm']
+
+# cell texts that read_sheet reads as missing values, like pandas does
+NA_VALUES = set(['-1.#IND', '1.#QNAN', '1.#IND', '-1.#QNAN', '#N/A N/A',
+                 '#N/A', 'N/A', 'NA', '#NA', 'NULL', 'NaN', '-NaN', 'nan',
+                 '-nan', ''])
+
+# file extensions of HDF5 input stores (cf. convert_input)
+STORE_EXTENSIONS = ['.h5', '.hdf5']
+
+# suffix of the input cache that read_excel writes next to a spreadsheet
+CACHE_SUFFIX = '.h5'
+
+# version of the input store format and of the parsed tables within; to be
+# increased whenever either changes, so that older caches are parsed anew
+STORE_VERSION = 2
+
+# suffix of input directories written by convert_input(memmap=True); they
+# hold the tables but TIMESERIES in INPUT_STORE, each of the TIMESERIES as
+# a float array in a .npy file and their index and columns in MANIFEST
+MEMMAP_SUFFIX = '.input'
+INPUT_STORE = 'input.h5'
+MANIFEST = 'timeseries.json'
+
+# file extensions of SQLite input databases (cf. write_input_database)
+DATABASE_EXTENSIONS = ['.db', '.sqlite', '.sqlite3']
+
+# column keys of the TIMESERIES, which an input database stores in long
+# format: one row (t, keys..., value) per timestep and column
+TIMESERIES_KEYS = {
+    'demand': ['Site', 'Commodity'],
+    'supim': ['Site', 'Commodity'],
+    'buy_sell_price': ['Commodity']}
+
+# input database table of the timesteps (index) of each timeseries
+TIMESTEP_TABLE = 'timestep'
+
+# site columns of the input database tables, by which read_input_database
+# selects rows
+SITE_COLUMNS = {
+    'site': ['Name'],
+    'commodity': ['Site'],
+    'process': ['Site'],
+    'transmission': ['Site In', 'Site Out'],
+    'storage': ['Site'],
+    'dsm': ['Site'],
+    'demand': ['Site'],
+    'supim': ['Site']}
+
+# indexed columns of the input database tables
+DATABASE_INDEXES = {
+    'commodity': [['Site', 'Commodity']],
+    'process': [['Site', 'Process'], ['Process']],
+    'process_commodity': [['Process', 'Commodity']],
+    'transmission': [['Site In', 'Site Out', 'Transmission'],
+                     ['Site Out']],
+    'storage': [['Site', 'Storage']],
+    'dsm': [['Site', 'Commodity']],
+    'demand': [['Site', 't']],
+    'supim': [['Site', 't']],
+    'buy_sell_price': [['t']],
+    TIMESTEP_TABLE: [['timeseries', 't']]}
+
+
+def read_excel(filename, cache=True, workers=1):
     """Read Excel input file and prepare URBS input dict.
 
     Reads an Excel spreadsheet that adheres to the structure shown in
@@ -12,10 +107,20 @@ def read_excel(filename):
     2. The attribute 'annuity-factor' is derived here from the columns 'wacc'
     and 'depreciation' for 'Process', 'Transmission' and 'Storage'.
 
+    Parsing large spreadsheets is slow, so the prepared input is cached in a
+    HDF5 file next to the spreadsheet (filename + CACHE_SUFFIX). Later calls
+    load the cache instead, as long as the spreadsheet has the same
+    modification time or content (SHA-256 hash) as when it was cached.
+
     Args:
         filename: filename to an Excel spreadsheet with the required sheets
             'Commodity', 'Process', 'Transmission', 'Storage', 'Demand' and
-            'SupIm'.
+            'SupIm', to a HDF5 input store or input directory written by
+            convert_input, or to a SQLite input database (extension .db,
+            .sqlite or .sqlite3; cf. read_input_database)
+        cache: set False to neither read nor write the cache
+        workers: number of processes that read worksheets in parallel
+            (default: 1)
 
     Returns:
         a dict of 6 DataFrames
@@ -25,51 +130,443 @@ def read_excel(filename):
         >>> data['global_prop'].loc['CO2 limit', 'value']
         150000000
     """
-    with pd.ExcelFile(filename) as xls:
-        site = xls.parse('Site').set_index(['Name'])
-        commodity = (
-            xls.parse('Commodity').set_index(['Site', 'Commodity', 'Type']))
-        process = xls.parse('Process').set_index(['Site', 'Process'])
-        process_commodity = (
-            xls.parse('Process-Commodity')
-               .set_index(['Process', 'Commodity', 'Direction']))
-        transmission = (
-            xls.parse('Transmission')
-               .set_index(['Site In', 'Site Out',
-                           'Transmission', 'Commodity']))
-        storage = (
-            xls.parse('Storage').set_index(['Site', 'Storage', 'Commodity']))
-        demand = xls.parse('Demand').set_index(['t'])
-        supim = xls.parse('SupIm').set_index(['t'])
-        buy_sell_price = xls.parse('Buy-Sell-Price').set_index(['t'])
-        dsm = xls.parse('DSM').set_index(['Site', 'Commodity'])
-        global_prop = xls.parse('Global').set_index(['Property'])
-
-    # prepare input data
-    # split columns by dots '.', so that 'DE.Elec' becomes the two-level
-    # column index ('DE', 'Elec')
-    demand.columns = split_columns(demand.columns, '.')
-    supim.columns = split_columns(supim.columns, '.')
-    buy_sell_price.columns = split_columns(buy_sell_price.columns, '.')
-
-    data = {
-        'global_prop': global_prop,
-        'site': site,
-        'commodity': commodity,
-        'process': process,
-        'process_commodity': process_commodity,
-        'transmission': transmission,
-        'storage': storage,
-        'demand': demand,
-        'supim': supim,
-        'buy_sell_price': buy_sell_price,
-        'dsm': dsm
-        }
-
-    for index in data['process_commodity']['ratio'].index:
-        if (data['process_commodity'].loc[index]['ratio'] >
-            data['process_commodity'].loc[index]['ratio-min']):
-            raise ValueError('ratio-min must be larger than ratio!')
+    if os.path.isdir(filename):
+        return read_input_directory(filename)
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in STORE_EXTENSIONS:
+        return read_input_store(filename)[0]
+    if extension in DATABASE_EXTENSIONS:
+        return read_input_database(filename)
+    if not cache:
+        return parse_excel(filename, workers)
+
+    cache_file = filename + CACHE_SUFFIX
+    data = read_input_cache(filename, cache_file)
+    if data is None:
+        data = parse_excel(filename, workers)
+        try:
+            write_input_store(data, cache_file, filename)
+        except (IOError, OSError, ImportError):
+            pass  # e.g. read-only directory or PyTables missing
+    return data
+
+
+def convert_input(filename, out=None, workers=1, memmap=False):
+    """Convert an Excel input file to a HDF5 input store.
+
+    Prepares inputs ahead of a run: read_excel(out) loads the store without
+    parsing the spreadsheet. With the default out, the store is the cache
+    that read_excel(filename) uses.
+
+    With memmap=True, out is an input directory instead, in which the
+    timeseries are stored as memory-mappable arrays (cf.
+    write_input_directory). read_excel(out) then returns timeseries
+    DataFrames that are views of these files: processes reading the same
+    input directory share its pages in memory instead of each holding a
+    copy of the timeseries.
+
+    If out has one of the DATABASE_EXTENSIONS, a SQLite input database is
+    written instead (cf. write_input_database).
+
+    Args:
+        filename: filename to an Excel spreadsheet (cf. read_excel)
+        out: HDF5 store file (extension .h5 or .hdf5), SQLite database or,
+             with memmap, directory to be written; default: filename +
+             CACHE_SUFFIX or filename + MEMMAP_SUFFIX
+        workers: number of processes that read worksheets in parallel
+        memmap: set True to write an input directory
+
+    Returns:
+        Nothing
+    """
+    data = parse_excel(filename, workers)
+    if memmap:
+        write_input_directory(data, out or filename + MEMMAP_SUFFIX,
+                              filename)
+    elif (out is not None and
+            os.path.splitext(out)[1].lower() in DATABASE_EXTENSIONS):
+        write_input_database(data, out)
+    else:
+        write_input_store(data, out or filename + CACHE_SUFFIX, filename)
+
+
+def parse_excel(filename, workers=1):
+    """Parse an Excel input file (cf. read_excel) without cache.
+
+    Worksheets of .xlsx files are streamed by read_sheet (if openpyxl is
+    installed), other files are parsed by pandas.
+
+    Args:
+        filename: filename to an Excel spreadsheet
+        workers: number of processes that read worksheets in parallel
+
+    Returns:
+        a dict of 6 DataFrames
+    """
+    streaming = (os.path.splitext(filename)[1].lower() in STREAM_EXTENSIONS
+                 and load_workbook is not None)
+    sheets = [sheet[0] for sheet in SHEETS]
+    if streaming and workers > 1:
+        # every worker opens the workbook once and reads every workers-th
+        # sheet, which spreads the long timeseries sheets over the workers
+        workers = min(workers, len(sheets))
+        pool = multiprocessing.Pool(workers)
+        try:
+            groups = pool.map(read_sheets_args,
+                              [(filename, sheets[i::workers])
+                               for i in range(workers)],
+                              chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        frames = [None] * len(sheets)
+        for i, group in enumerate(groups):
+            frames[i::workers] = group
+    elif streaming:
+        frames = read_sheets(filename, sheets)
+    else:
+        with pd.ExcelFile(filename) as xls:
+            frames = [xls.parse(sheet[0]) for sheet in SHEETS]
+
+    data = {}
+    for (_, name, index, split), df in zip(SHEETS, frames):
+        df = df.set_index(index)
+        if split:
+            # split columns by dots '.', so that 'DE.Elec' becomes the
+            # two-level column index ('DE', 'Elec')
+            df.columns = split_columns(df.columns, '.')
+        data[name] = df
+
+    validate_input(data)
+
+    # sort nested indexes to make direct assignments work
+    for key in data:
+        if isinstance(data[key].index, pd.core.index.MultiIndex):
+            data[key].sortlevel(inplace=True)
+    return data
+
+
+def read_sheets(filename, sheets):
+    """Read worksheets of an .xlsx file (cf. read_sheet).
+
+    Args:
+        filename: filename to an .xlsx spreadsheet
+        sheets: list of worksheet names
+
+    Returns:
+        list of DataFrames, one per sheet
+    """
+    wb = load_workbook(filename, read_only=True, data_only=True)
+    try:
+        return [read_sheet(wb[sheet]) for sheet in sheets]
+    finally:
+        wb.close()
+
+
+def read_sheets_args(args):
+    """read_sheets for a (filename, sheets) tuple (cf. parse_excel)."""
+    return read_sheets(*args)
+
+
+def read_sheet(ws):
+    """Read a worksheet by streaming its rows into NumPy columns.
+
+    In a workbook opened in read-only mode, only one row is held in memory
+    at a time; its values are written into preallocated columns.
+    Like pandas' Excel parser, blank rows are skipped, NA_VALUES and empty
+    cells become NaN and columns whose
+    values are all numbers (or numeric text, e.g. 'inf') are converted to
+    floats, or to integers if they only hold whole numbers.
+
+    Args:
+        ws: an openpyxl worksheet
+
+    Returns:
+        a DataFrame with the first row as column titles
+    """
+    rows = ws.iter_rows(values_only=True)
+    header = list(next(rows, ()))
+    while header and header[-1] is None:
+        header.pop()
+    width = len(header)
+    size = max((ws.max_row or 0) - 1, 16)
+    columns = [np.empty(size, dtype=object) for _ in header]
+    n = 0
+    for row in rows:
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        if all(value is None for value in row):
+            continue
+        if n == size:
+            size *= 2
+            columns = [np.resize(column, size) for column in columns]
+        for column, value in zip(columns, row):
+            if value is None or (is_string(value) and value in NA_VALUES):
+                value = np.nan
+            column[n] = value
+        n += 1
+
+    df = pd.DataFrame(dict((j, numeric_column(column[:n]))
+                           for j, column in enumerate(columns)),
+                      columns=range(width))
+    df.columns = header
+    return df
+
+
+def numeric_column(column):
+    """Convert an object array to float or int, if all values are numbers.
+
+    Args:
+        column: NumPy object array
+
+    Returns:
+        column as int64 array (whole numbers only), float array (numbers
+        or numeric text) or unchanged (else)
+    """
+    if column.size == 0 or any(isinstance(value, bool) for value in column):
+        return column
+    try:
+        values = column.astype(float)
+    except (TypeError, ValueError):
+        return column
+    if np.all(np.isfinite(values)) and np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    return values
+
+
+def file_hash(filename):
+    """Return the SHA-256 hex digest of a file's content."""
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def write_input_store(data, filename, source):
+    """Write an input dict to a HDF5 store file.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        filename: HDF5 store file to be written
+        source: spreadsheet the input was read from; its SHA-256 hash and
+                modification time are stored, together with STORE_VERSION,
+                to validate the cache
+
+    Returns:
+        Nothing
+    """
+    import warnings
+    warnings.filterwarnings('ignore',
+                            category=pd.io.pytables.PerformanceWarning)
+
+    meta = pd.Series([file_hash(source), repr(os.path.getmtime(source)),
+                      str(STORE_VERSION)],
+                     index=['sha256', 'mtime', 'version'])
+    with pd.HDFStore(filename, mode='w') as store:
+        for name in data:
+            store['data/' + name] = data[name]
+        store['meta'] = meta
+
+
+def read_input_store(filename):
+    """Read an input dict from a HDF5 store file.
+
+    Args:
+        filename: HDF5 store file written by write_input_store
+
+    Returns:
+        (data, meta) tuple of the input dict and a Series with the hash and
+        modification time of its source spreadsheet
+
+    Raises:
+        ValueError: if the store was written with another STORE_VERSION
+    """
+    with pd.HDFStore(filename, mode='r') as store:
+        meta = store['meta']
+        if meta.get('version') != str(STORE_VERSION):
+            raise ValueError("Input store '{}' has format version {}, "
+                             "expected {}; convert the input again".format(
+                                 filename, meta.get('version', 1),
+                                 STORE_VERSION))
+        data = {}
+        for group in store.get_node('data'):
+            data[group._v_name] = store[group._v_pathname]
+    return data, meta
+
+
+def write_input_directory(data, directory, source):
+    """Write an input dict to a directory with memory-mappable timeseries.
+
+    The TIMESERIES tables are written as float arrays (one row per
+    timestep) to NumPy .npy files, their index and columns to the JSON file
+    MANIFEST. All other tables go to the HDF5 store INPUT_STORE.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        directory: directory to be written (created if needed)
+        source: spreadsheet the input was read from (cf. write_input_store)
+
+    Returns:
+        Nothing
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    write_input_store(
+        dict((name, df) for name, df in data.items()
+             if name not in TIMESERIES),
+        os.path.join(directory, INPUT_STORE), source)
+
+    manifest = {}
+    for name in TIMESERIES:
+        df = data[name]
+        np.save(os.path.join(directory, name + '.npy'),
+                np.ascontiguousarray(df.values, dtype=float))
+        manifest[name] = {
+            'index': df.index.tolist(),
+            'index_name': df.index.name,
+            'columns': [list(column) for column in df.columns],
+            'column_names': list(df.columns.names)}
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+
+
+def read_input_directory(directory):
+    """Read an input dict from a directory written by write_input_directory.
+
+    The timeseries DataFrames are views of copy-on-write memory maps of
+    their .npy files: only the pages of rows that are actually read are
+    loaded, and they are shared with other processes mapping the same
+    files. Changing values (e.g. in a scenario function) copies only the
+    affected pages to private memory and leaves the files unchanged.
+
+    Args:
+        directory: input directory
+
+    Returns:
+        the input dict
+    """
+    data, _ = read_input_store(os.path.join(directory, INPUT_STORE))
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    for name, info in manifest.items():
+        values = np.load(os.path.join(directory, name + '.npy'),
+                         mmap_mode='c')
+        index = pd.Index(info['index'], name=info['index_name'])
+        if info['columns']:
+            columns = pd.MultiIndex.from_tuples(
+                [tuple(column) for column in info['columns']],
+                names=info['column_names'])
+        else:
+            columns = pd.Index([])
+        data[name] = pd.DataFrame(values, index=index, columns=columns,
+                                  copy=False)
+    return data
+
+
+def write_input_database(data, filename):
+    """Write an input dict to a SQLite input database.
+
+    Each table of SHEETS becomes a database table of the same name (e.g.
+    'process'), with its index levels as leading columns. The TIMESERIES
+    are stored in long format, one row (t, TIMESERIES_KEYS..., value) per
+    timestep and column, so that rows can be selected by site and
+    timestep; their timesteps go to TIMESTEP_TABLE. The site and technology
+    key columns are indexed (cf. DATABASE_INDEXES). An existing file is
+    replaced.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        filename: SQLite database file to be written
+
+    Returns:
+        Nothing
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+    connection = sqlite3.connect(filename)
+    try:
+        for _, name, _, _ in SHEETS:
+            df = data[name]
+            if name in TIMESERIES:
+                timeseries_rows(df, TIMESERIES_KEYS[name]).to_sql(
+                    name, connection, index=False)
+                steps = pd.DataFrame({'timeseries': name,
+                                      't': df.index.values})
+                steps.to_sql(TIMESTEP_TABLE, connection, index=False,
+                             if_exists='append')
+            else:
+                df.reset_index().to_sql(name, connection, index=False)
+        for name, indexes in DATABASE_INDEXES.items():
+            for columns in indexes:
+                connection.execute('CREATE INDEX "{}" ON "{}" ({})'.format(
+                    '_'.join(['ix', name] + columns).replace(' ', '_'),
+                    name, ', '.join('"{}"'.format(c) for c in columns)))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def timeseries_rows(df, keys):
+    """Return a timeseries DataFrame in long format (t, keys..., value)."""
+    rows, columns = df.shape
+    long = pd.DataFrame({'t': np.repeat(df.index.values, columns)})
+    for level, key in enumerate(keys):
+        long[key] = np.tile(df.columns.get_level_values(level), rows)
+    long['value'] = df.values.ravel()
+    return long
+
+
+def read_input_database(filename, sites=None, timesteps=None):
+    """Read an input dict from a SQLite input database.
+
+    Optionally, only the rows of some sites and a timestep range are read,
+    using the indexes of the database: commodities, processes, storages,
+    DSM entries and timeseries columns of the given sites, transmissions
+    between them and the process_commodity entries of their processes. The
+    tables global_prop and buy_sell_price (which have no site) are read
+    completely, the latter for the timestep range only.
+
+    Args:
+        filename: SQLite database written by write_input_database
+        sites: (optional) list of site names to read
+        timesteps: (optional) timesteps to read, e.g. the timesteps for
+                   create_model; rows from min(timesteps) to max(timesteps)
+                   are read
+
+    Returns:
+        the input dict; its timeseries have the columns sorted
+
+    Example:
+        >>> data = read_input_database('mimo-example.db', ['North', 'Mid'],
+        ...                            range(3500, 3669))
+        >>> data['demand'].columns.tolist()
+        [('Mid', 'Elec'), ('North', 'Elec')]
+    """
+    if sites is not None:
+        sites = [sites] if is_string(sites) else list(sites)
+    if timesteps is not None:
+        timesteps = (int(min(timesteps)), int(max(timesteps)))
+
+    data = {}
+    connection = sqlite3.connect(filename)
+    try:
+        for _, name, index, _ in SHEETS:
+            query, params = database_query(name, sites, timesteps)
+            df = pd.read_sql_query(query, connection, params=params)
+            if name in TIMESERIES:
+                query, params = database_query(
+                    TIMESTEP_TABLE, None, timesteps, name)
+                steps = pd.read_sql_query(query, connection, params=params)
+                df = timeseries_frame(df, TIMESERIES_KEYS[name],
+                                      pd.Index(steps['t'], name='t'))
+            else:
+                # columns of NULLs only are read as object columns
+                for column in df.columns[df.isnull().all().values]:
+                    df[column] = df[column].astype(float)
+                df = df.set_index(index)
+            data[name] = df
+    finally:
+        connection.close()
 
     # sort nested indexes to make direct assignments work
     for key in data:
@@ -78,6 +575,90 @@ def read_excel(filename):
     return data
 
 
+def database_query(table, sites, timesteps, timeseries=None):
+    """Return (query, params) selecting the rows of an input database table.
+
+    Args:
+        table: input database table name
+        sites: list of site names or None for all sites
+        timesteps: (first, last) timestep or None for all timesteps
+        timeseries: with table TIMESTEP_TABLE, the timeseries name
+
+    Returns:
+        (query, params) tuple for pandas.read_sql_query
+    """
+    conditions, params = [], []
+    if sites is not None:
+        marks = ', '.join(['?'] * len(sites))
+        for column in SITE_COLUMNS.get(table, []):
+            conditions.append('"{}" IN ({})'.format(column, marks))
+            params.extend(sites)
+        if table == 'process_commodity':
+            conditions.append('"Process" IN (SELECT "Process" FROM process '
+                              'WHERE "Site" IN ({}))'.format(marks))
+            params.extend(sites)
+    if timeseries is not None:
+        conditions.append('"timeseries" = ?')
+        params.append(timeseries)
+    if timesteps is not None and (table in TIMESERIES or
+                                  table == TIMESTEP_TABLE):
+        conditions.append('"t" BETWEEN ? AND ?')
+        params.extend(timesteps)
+
+    query = 'SELECT * FROM "{}"'.format(table)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if table == TIMESTEP_TABLE:
+        query += ' ORDER BY "t"'
+    return query, params
+
+
+def timeseries_frame(rows, keys, index):
+    """Return the timeseries DataFrame of rows in long format.
+
+    Args:
+        rows: DataFrame with columns t, keys and value (cf. timeseries_rows)
+        keys: column keys of the timeseries
+        index: timesteps of the timeseries
+
+    Returns:
+        DataFrame with index and the (sorted) keys as columns, like the
+        ones of read_excel
+    """
+    if rows.empty:
+        return pd.DataFrame(index=index)
+    df = rows.set_index(['t'] + keys)['value'].unstack(keys).reindex(index)
+    df.columns = pd.MultiIndex.from_arrays(
+        [df.columns.get_level_values(level) for level in range(len(keys))],
+        names=[None] * len(keys))
+    return df.sort_index(axis=1)
+
+
+def read_input_cache(filename, cache_file):
+    """Load the cached input of a spreadsheet, if still valid.
+
+    Args:
+        filename: Excel spreadsheet
+        cache_file: its HDF5 input cache
+
+    Returns:
+        the input dict, or None if the cache is missing, unreadable, of
+        another STORE_VERSION or belongs to another version of the
+        spreadsheet
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        data, meta = read_input_store(cache_file)
+    except (IOError, OSError, ImportError, KeyError, ValueError,
+            RuntimeError):
+        return None
+    if (meta['mtime'] != repr(os.path.getmtime(filename)) and
+            meta['sha256'] != file_hash(filename)):
+        return None
+    return data
+
+
 def split_columns(columns, sep='.'):
     """Split columns by separator into MultiIndex.
 
@@ -0,0 +1,1680 @@
+"""Sparse matrix backend for urbs
+
+Instead of calling one Python rule function per index tuple and building a
+Pyomo expression object for each constraint, this module assembles the urbs
+linear program block-wise. For every constraint block, the coefficients are
+generated for all timesteps at once with NumPy index arithmetic and stored as
+(row, column, value) triplets of a SciPy sparse matrix.
+
+The resulting MatrixModel holds the same variables and constraints as the
+Pyomo model returned by create_model. It can be written to an MPS file and
+solved. After solving, the solution is stored as a result cache under the
+same entity names as in the Pyomo model, so that get_entity, report, plot and
+save keep working.
+
+Usage:
+    prob = urbs.create_model(data, timesteps, backend='matrix')
+    urbs.solve_matrix(prob, solver='glpk')
+    urbs.report(prob, 'report.xlsx')
+
+"""
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from collections import OrderedDict
+from datetime import datetime
+from .modelhelper import annuity_factor, transmission_corridors
+from .presolve import postsolve, presolve as presolve_model
+
+COST_TYPES = ['Invest', 'Fixed', 'Variable', 'Fuel', 'Revenue', 'Purchase',
+              'Startup', 'Environmental']
+
+# index labels of tuple sets, identical to the onset names that get_entity
+# derives from the corresponding Pyomo sets
+COM_LABELS = ['sit', 'com', 'com_type']
+PRO_LABELS = ['sit', 'pro']
+PRO_COM_LABELS = ['sit', 'pro', 'com']
+TRA_LABELS = ['sit', 'sit_', 'tra', 'com']
+STO_LABELS = ['sit', 'sto', 'com']
+DSM_LABELS = ['sit', 'com']
+
+# relative tolerance for row violations of a solution read from GLPK (cf.
+# max_row_violation)
+FEASIBILITY_TOLERANCE = 1e-5
+
+
+class MatrixModel(object):
+    """ Sparse matrix representation of an urbs linear program.
+
+    Variables and constraints are organised in named blocks. A block has a
+    static index (a list of tuples, e.g. m.pro_tuples) and optionally a time
+    axis ('t' for all timesteps, 'tm' for modelled timesteps). Within a
+    block, entries are stored tuple-major, i.e. position j * K + k belongs to
+    static tuple j and timestep k of the K timesteps of the block.
+
+    Attributes:
+        A: constraint matrix (scipy.sparse.csr_matrix), after finalize()
+        c: objective coefficients
+        col_lb, col_ub: variable bounds
+        row_lb, row_ub: constraint bounds
+    """
+    def __init__(self):
+        self.name = 'urbs'
+        self.created = datetime.now().strftime('%Y%m%dT%H%M')
+        self.timesteps = {}
+        self._vars = OrderedDict()
+        self._cons = OrderedDict()
+        self._blocks = []
+        self._col_lb = []
+        self._col_ub = []
+        self._row_lb = []
+        self._row_ub = []
+        self.ncols = 0
+        self.nrows = 0
+
+    def add_var(self, name, index, labels, axis=None, lb=0.0, ub=np.inf,
+                domain=None, doc=''):
+        """Add a block of variables.
+
+        Args:
+            name: entity name, e.g. 'e_pro_in'
+            index: list of static index tuples
+            labels: onset names of the static index tuples
+            axis: None, 't' or 'tm'; the time axis of the block
+            lb, ub: scalar or array of lower/upper bounds
+            domain: (optional) list of static index tuples of the
+                    corresponding Pyomo variable; results are reported on
+                    this domain, with zeros for the non-modelled entries
+            doc: description
+
+        Returns:
+            Nothing
+        """
+        index = list(index)
+        K = len(self.timesteps[axis]) if axis else 1
+        size = len(index) * K
+        self._vars[name] = {
+            'offset': self.ncols, 'index': index, 'labels': labels,
+            'axis': axis, 'K': K, 'size': size, 'domain': domain, 'doc': doc}
+        self._col_lb.append(np.broadcast_to(np.asarray(lb, float), (size,)))
+        self._col_ub.append(np.broadcast_to(np.asarray(ub, float), (size,)))
+        self.ncols += size
+
+    def add_con(self, block):
+        """Add a constraint block created by function con_block.
+
+        Args:
+            block: a dict as returned by con_block, with filled entries
+                   (or their matrix, cf. block_matrix)
+
+        Returns:
+            Nothing
+        """
+        name = block['name']
+        size = block['size']
+        self._cons[name] = {
+            'offset': self.nrows, 'index': block['index'],
+            'labels': block['labels'], 'axis': block['axis'],
+            'K': block['K'], 'size': size, 'doc': block['doc']}
+        if 'matrix' not in block:
+            block_matrix(block, self.ncols)
+        self._blocks.append(block['matrix'])
+        self._row_lb.append(np.reshape(block['lb'], size))
+        self._row_ub.append(np.reshape(block['ub'], size))
+        self.nrows += size
+
+    def finalize(self):
+        """Assemble constraint matrix, bounds and objective."""
+        # stack the rows of all blocks
+        if self._blocks:
+            self.A = sp.vstack(self._blocks, format='csr')
+        else:
+            self.A = sp.csr_matrix((self.nrows, self.ncols))
+        self.A.eliminate_zeros()
+        self.col_lb = np.concatenate(self._col_lb)
+        self.col_ub = np.concatenate(self._col_ub)
+        self.row_lb = np.concatenate(self._row_lb)
+        self.row_ub = np.concatenate(self._row_ub)
+        self._blocks = []
+        self._col_lb = self._col_ub = self._row_lb = self._row_ub = None
+
+        # objective: minimize sum of all cost types
+        self.c = np.zeros(self.ncols)
+        costs = self._vars['costs']
+        self.c[costs['offset']:costs['offset'] + costs['size']] = 1
+
+
+def con_block(prob, name, index, labels, axis=None, lb=-np.inf, ub=np.inf,
+              doc=''):
+    """Create an empty constraint block.
+
+    Args:
+        prob: a MatrixModel with all variables added
+        name: entity name, e.g. 'res_vertex'
+        index: list of static index tuples
+        labels: onset names of the static index tuples
+        axis: None, 't' or 'tm'; the time axis of the block
+        lb, ub: scalar or array of shape (len(index), K) of row bounds
+        doc: description
+
+    Returns:
+        a dict that collects the coefficients of the block (cf. add_terms)
+    """
+    index = list(index)
+    K = len(prob.timesteps[axis]) if axis else 1
+    size = len(index) * K
+    lb = np.asarray(lb, float)
+    ub = np.asarray(ub, float)
+    if lb.ndim == 1:
+        lb = lb[:, np.newaxis]
+    if ub.ndim == 1:
+        ub = ub[:, np.newaxis]
+    return {'name': name, 'index': index, 'labels': labels, 'axis': axis,
+            'K': K, 'size': size, 'doc': doc, 'entries': [],
+            'lb': np.broadcast_to(lb, (len(index), K)),
+            'ub': np.broadcast_to(ub, (len(index), K))}
+
+
+def column_numbers(prob, var, var_j, k=None, axis=None, shift=0):
+    """Column numbers of variable entries.
+
+    Args:
+        prob: a MatrixModel
+        var: variable name
+        var_j: array of static positions within the variable block
+        k: (optional) array of time positions on given axis
+        axis: time axis of k, 't' or 'tm'
+        shift: time offset, e.g. -1 for the previous timestep
+
+    Returns:
+        array of column numbers, broadcast from var_j and k
+    """
+    v = prob._vars[var]
+    var_j = np.asarray(var_j, dtype=int)
+    if v['axis'] is None:
+        return v['offset'] + var_j
+    # translate time positions from the given axis to the variable's axis;
+    # position k of 'tm' is position k + 1 of 't'
+    pos = k + shift
+    if axis == 'tm' and v['axis'] == 't':
+        pos = pos + 1
+    elif axis == 't' and v['axis'] == 'tm':
+        pos = pos - 1
+    return v['offset'] + var_j * v['K'] + pos
+
+
+def add_terms(prob, block, var, row_j, var_j, coef, shift=0, axis='tm'):
+    """Add coefficients of one variable to a constraint block.
+
+    For a time-indexed block, each (row_j, var_j) pair is expanded over all
+    timesteps of the block. For a block without time axis, time-indexed
+    variables are summed over all timesteps of the given axis.
+
+    Args:
+        prob: a MatrixModel
+        block: a constraint block as returned by con_block
+        var: variable name
+        row_j: array of static row positions within the block
+        var_j: array of static positions within the variable block
+        coef: scalar, array of len(row_j) or array of shape (len(row_j), K)
+        shift: time offset of the variable, e.g. -1 for the previous timestep
+        axis: for blocks without time axis: the time axis to sum over
+
+    Returns:
+        Nothing
+    """
+    row_j = np.asarray(row_j, dtype=int)
+    var_j = np.asarray(var_j, dtype=int)
+    if row_j.size == 0:
+        return
+    coef = np.asarray(coef, float)
+    if coef.ndim == 1:
+        coef = coef[:, np.newaxis]
+    timed_var = prob._vars[var]['axis'] is not None
+
+    if block['axis'] is not None:
+        K = block['K']
+        k = np.arange(K)[np.newaxis, :]
+        rows = row_j[:, np.newaxis] * K + k
+        if timed_var:
+            cols = column_numbers(prob, var, var_j[:, np.newaxis], k,
+                                  block['axis'], shift)
+        else:
+            cols = column_numbers(prob, var, var_j)[:, np.newaxis]
+            cols = np.broadcast_to(cols, rows.shape)
+    elif timed_var:
+        K = len(prob.timesteps[axis])
+        k = np.arange(K)[np.newaxis, :]
+        rows = np.broadcast_to(row_j[:, np.newaxis], (row_j.size, K))
+        cols = column_numbers(prob, var, var_j[:, np.newaxis], k, axis, shift)
+    else:
+        rows = row_j[:, np.newaxis]
+        cols = column_numbers(prob, var, var_j)[:, np.newaxis]
+    vals = np.broadcast_to(coef, rows.shape)
+    block['entries'].append((rows.ravel(), cols.ravel(), vals.ravel()))
+
+
+def add_entries(prob, block, rows, cols, vals):
+    """Add raw coefficients (local row numbers, columns) to a block."""
+    block['entries'].append((np.asarray(rows, dtype=int),
+                             np.asarray(cols, dtype=int),
+                             np.broadcast_to(np.asarray(vals, float),
+                                             np.shape(rows))))
+
+
+def block_matrix(block, ncols):
+    """Convert the entries of a constraint block to a sparse matrix.
+
+    Duplicate (row, column) entries are summed up. The matrix replaces the
+    entries in the block dict.
+
+    Args:
+        block: a constraint block as returned by con_block
+        ncols: number of columns (variables) of the model
+
+    Returns:
+        CSR matrix of shape (block size, ncols)
+    """
+    if block['entries']:
+        rows = np.concatenate([e[0] for e in block['entries']])
+        cols = np.concatenate([e[1] for e in block['entries']])
+        vals = np.concatenate([e[2] for e in block['entries']])
+    else:
+        rows = cols = np.zeros(0, dtype=int)
+        vals = np.zeros(0)
+    block['matrix'] = sp.csr_matrix((vals, (rows, cols)),
+                                    shape=(block['size'], ncols))
+    block['entries'] = []
+    return block['matrix']
+
+
+def create_matrix_model(data, timesteps=None, dt=1, dual=False, workers=1,
+                        undirected=False):
+    """Create a MatrixModel from given input data.
+
+    Builds the same variables and constraints as create_model, but as blocks
+    of a sparse matrix instead of Pyomo objects.
+
+    Args:
+        data: a dict of DataFrames as returned by read_excel
+        timesteps: optional list of timesteps, default: demand timeseries
+        dt: timestep duration in hours (default: 1)
+        dual: set True to retrieve dual values after solving
+        workers: number of processes building constraint blocks in
+                 parallel (cf. build_blocks); default: 1
+        undirected: set True for one transmission capacity per corridor
+                    (cf. create_model)
+
+    Returns:
+        a MatrixModel object
+    """
+    if 'periods' in data:
+        raise ValueError("Typical periods are not supported by the matrix "
+                         "backend")
+    if not timesteps:
+        timesteps = data['demand'].index.tolist()
+    timesteps = list(timesteps)
+
+    prob = MatrixModel()
+    prob._data = data
+    prob.dual = dual
+    ctx = prepare_context(data, timesteps, dt, undirected)
+    prob.timesteps = {'t': ctx['t'], 'tm': ctx['tm']}
+    prob._sets = ctx['sets']
+    prob._params = {
+        'weight': pd.Series(ctx['weight'], name='weight',
+                            index=pd.Index(ctx['tm'], name='tm')),
+        'dt': dt}
+
+    add_variables(prob, ctx)
+    for blocks in build_blocks(prob, ctx, workers):
+        for block in blocks:
+            prob.add_con(block)
+    prob.finalize()
+    return prob
+
+
+def build_blocks(prob, ctx, workers=1):
+    """Run all BLOCK_BUILDERS, optionally in a pool of worker processes.
+
+    The builders only read the variable layout of prob and the context, so
+    they do not depend on each other. Each worker converts its blocks to
+    sparse matrices (cf. block_matrix), the most expensive step of the
+    construction; add_con stacks them in the order of BLOCK_BUILDERS, so
+    the model is identical to a sequential build.
+
+    Args:
+        prob: a MatrixModel with all variables added
+        ctx: context dict as returned by prepare_context
+        workers: number of worker processes; 1 builds in this process
+
+    Returns:
+        list of constraint block lists, one per builder
+    """
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1")
+    if workers == 1:
+        return [builder(prob, ctx) for builder in BLOCK_BUILDERS]
+
+    # workers only need the variable layout, not input data and bounds
+    layout = MatrixModel()
+    layout.timesteps = prob.timesteps
+    layout._vars = prob._vars
+    layout.ncols = prob.ncols
+    pool = multiprocessing.Pool(min(workers, len(BLOCK_BUILDERS)),
+                                initializer=init_block_worker,
+                                initargs=(layout, ctx))
+    try:
+        return pool.map(run_block_builder, range(len(BLOCK_BUILDERS)),
+                        chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+_worker_state = {}
+
+
+def init_block_worker(layout, ctx):
+    """Pool initializer of build_blocks: keep layout and context."""
+    _worker_state['prob'] = layout
+    _worker_state['ctx'] = ctx
+
+
+def run_block_builder(i):
+    """Run BLOCK_BUILDERS[i] in a worker process of build_blocks."""
+    prob = _worker_state['prob']
+    blocks = BLOCK_BUILDERS[i](prob, _worker_state['ctx'])
+    for block in blocks:
+        block_matrix(block, prob.ncols)
+        # send bounds as plain arrays, not as broadcast views
+        block['lb'] = np.ascontiguousarray(block['lb'])
+        block['ub'] = np.ascontiguousarray(block['ub'])
+    return blocks
+
+
+def prepare_context(data, timesteps, dt, undirected=False):
+    """Derive index lists and parameter arrays from the input data.
+
+    Args:
+        data: a dict of DataFrames as returned by read_excel
+        timesteps: list of timesteps
+        dt: timestep duration in hours
+        undirected: set True for one transmission capacity per corridor
+
+    Returns:
+        a dict of index lists, lookup dicts and parameter arrays
+    """
+    commodity = data['commodity']
+    process = data['process']
+    process_commodity = data['process_commodity']
+    transmission = data['transmission']
+    storage = data['storage']
+    dsm = data['dsm']
+
+    # derive annuity factor from WACC and depreciation duration
+    process['annuity-factor'] = annuity_factor(
+        process['depreciation'], process['wacc'])
+    transmission['annuity-factor'] = annuity_factor(
+        transmission['depreciation'], transmission['wacc'])
+    storage['annuity-factor'] = annuity_factor(
+        storage['depreciation'], storage['wacc'])
+
+    ctx = {'data': data, 'dt': dt}
+    ctx['t'] = np.array(timesteps)
+    ctx['tm'] = ctx['t'][1:]
+    ctx['weight'] = float(8760) / (len(ctx['tm']) * dt)
+
+    # tuple sets
+    com_tuples = commodity.index.tolist()
+    pro_tuples = process.index.tolist()
+    tra_tuples = transmission.index.tolist()
+    sto_tuples = storage.index.tolist()
+    dsm_tuples = dsm.index.tolist() if not dsm.empty else []
+    ctx.update(com_tuples=com_tuples, pro_tuples=pro_tuples,
+               tra_tuples=tra_tuples, sto_tuples=sto_tuples,
+               dsm_tuples=dsm_tuples)
+
+    # transmission capacity variables: one per transmission tuple, or one
+    # per corridor (undirected); 'tra_cap' holds the position of the
+    # capacity of each transmission tuple
+    if undirected:
+        tra_cap_tuples, corridor = transmission_corridors(transmission)
+    else:
+        tra_cap_tuples, corridor = tra_tuples, {t: t for t in tra_tuples}
+    tra_cap_pos = positions(tra_cap_tuples)
+    ctx['tra_cap_tuples'] = tra_cap_tuples
+    ctx['tra_cap'] = np.array([tra_cap_pos[corridor[t]] for t in tra_tuples],
+                              dtype=int)
+    ctx['undirected'] = undirected
+
+    # commodity names by type (cf. commodity_subset)
+    com_names = {}
+    for (sit, com, com_type) in com_tuples:
+        com_names.setdefault(com_type, set()).add(com)
+    ctx['com_names'] = com_names
+
+    def names(com_type):
+        return com_names.get(com_type, set())
+
+    ctx['names'] = names
+
+    # process input/output ratios and partial operation ratios
+    r_in = process_commodity.xs('In', level='Direction')['ratio']
+    r_out = process_commodity.xs('Out', level='Direction')['ratio']
+    r_in_min = process_commodity.xs('In', level='Direction')['ratio-min']
+    r_out_min = process_commodity.xs('Out', level='Direction')['ratio-min']
+    r_in_min = r_in_min[r_in_min > 0]
+    r_out_min = r_out_min[r_out_min > 0]
+    ctx['r_in'] = r_in.to_dict()
+    ctx['r_out'] = r_out.to_dict()
+    ctx['r_in_min'] = r_in_min.to_dict()
+    ctx['r_out_min'] = r_out_min.to_dict()
+
+    pro_input_tuples = [(sit, pro, com)
+                        for (sit, pro) in pro_tuples
+                        for (p, com) in r_in.index if p == pro]
+    pro_output_tuples = [(sit, pro, com)
+                         for (sit, pro) in pro_tuples
+                         for (p, com) in r_out.index if p == pro]
+    pro_partial_tuples = unique([(sit, pro)
+                                 for (sit, pro) in pro_tuples
+                                 for (p, _) in r_in_min.index if p == pro])
+    pro_partial_input_tuples = [(sit, pro, com)
+                                for (sit, pro) in pro_partial_tuples
+                                for (p, com) in r_in_min.index if p == pro]
+    pro_partial_output_tuples = [(sit, pro, com)
+                                 for (sit, pro) in pro_partial_tuples
+                                 for (p, com) in r_out_min.index if p == pro]
+    max_grad = process['max-grad'].to_dict()
+    pro_maxgrad_tuples = [(sit, pro) for (sit, pro) in pro_tuples
+                          if max_grad[sit, pro] < 1.0 / dt]
+    ctx.update(pro_input_tuples=pro_input_tuples,
+               pro_output_tuples=pro_output_tuples,
+               pro_partial_tuples=pro_partial_tuples,
+               pro_partial_input_tuples=pro_partial_input_tuples,
+               pro_partial_output_tuples=pro_partial_output_tuples,
+               pro_maxgrad_tuples=pro_maxgrad_tuples)
+
+    # positions of tuples within their variable blocks
+    ctx['pos'] = {
+        'com': positions(com_tuples),
+        'pro': positions(pro_tuples),
+        'pro_in': positions(pro_input_tuples),
+        'pro_out': positions(pro_output_tuples),
+        'partial': positions(pro_partial_tuples),
+        'tra': positions(tra_tuples),
+        'sto': positions(sto_tuples),
+        'dsm': positions(dsm_tuples)}
+
+    # terms of the commodity balance by (site, commodity): lists of
+    # (variable, position, sign), cf. commodity_balance_index
+    balance = {}
+    for j, (sit, pro, com) in enumerate(pro_input_tuples):
+        balance.setdefault((sit, com), []).append(('e_pro_in', j, 1))
+    for j, (sit, pro, com) in enumerate(pro_output_tuples):
+        balance.setdefault((sit, com), []).append(('e_pro_out', j, -1))
+    for j, (sin, sout, tra, com) in enumerate(tra_tuples):
+        balance.setdefault((sin, com), []).append(('e_tra_in', j, 1))
+        balance.setdefault((sout, com), []).append(('e_tra_out', j, -1))
+    for j, (sit, sto, com) in enumerate(sto_tuples):
+        balance.setdefault((sit, com), []).append(('e_sto_in', j, 1))
+        balance.setdefault((sit, com), []).append(('e_sto_out', j, -1))
+    ctx['balance'] = balance
+
+    # DSM downshift tuples (t, tt) with |t - tt| <= delay, as positions on
+    # the modelled timestep axis 'tm'
+    K = len(ctx['tm'])
+    dsm_down_j = []
+    dsm_down_k1 = []
+    dsm_down_k2 = []
+    for j, (sit, com) in enumerate(dsm_tuples):
+        delay = int(dsm.loc[(sit, com), 'delay'])
+        k1, k2 = dsm_windows(K, delay)
+        dsm_down_j.append(np.full(k1.size, j, dtype=int))
+        dsm_down_k1.append(k1)
+        dsm_down_k2.append(k2)
+    if dsm_tuples:
+        ctx['dsm_down'] = (np.concatenate(dsm_down_j),
+                           np.concatenate(dsm_down_k1),
+                           np.concatenate(dsm_down_k2))
+    else:
+        ctx['dsm_down'] = (np.zeros(0, dtype=int),) * 3
+
+    # set entities for the result cache
+    ctx['sets'] = {
+        't': (ctx['t'], ['t']),
+        'tm': (ctx['tm'], ['t']),
+        'tt': (ctx['tm'], ['t']),
+        'sit': (unique(s for (s, _, _) in com_tuples), ['sit']),
+        'com': (unique(c for (_, c, _) in com_tuples), ['com']),
+        'com_type': (unique(ct for (_, _, ct) in com_tuples), ['com_type']),
+        'pro': (unique(p for (_, p) in pro_tuples), ['pro']),
+        'tra': (unique(tr for (_, _, tr, _) in tra_tuples), ['tra']),
+        'sto': (unique(st for (_, st, _) in sto_tuples), ['sto']),
+        'cost_type': (COST_TYPES, ['cost_type']),
+        'com_tuples': (com_tuples, COM_LABELS),
+        'pro_tuples': (pro_tuples, PRO_LABELS),
+        'tra_tuples': (tra_tuples, TRA_LABELS),
+        'tra_cap_tuples': (tra_cap_tuples, TRA_LABELS),
+        'sto_tuples': (sto_tuples, STO_LABELS),
+        'dsm_site_tuples': (dsm_tuples, DSM_LABELS),
+        'pro_input_tuples': (pro_input_tuples, PRO_COM_LABELS),
+        'pro_output_tuples': (pro_output_tuples, PRO_COM_LABELS),
+        'pro_partial_tuples': (pro_partial_tuples, PRO_LABELS),
+        'pro_maxgrad_tuples': (pro_maxgrad_tuples, PRO_LABELS)}
+    return ctx
+
+
+def dsm_windows(K, delay):
+    """All pairs of timestep positions (k1, k2) with |k1 - k2| <= delay.
+
+    Args:
+        K: number of (modelled) timesteps
+        delay: allowed DSM delay in timesteps
+
+    Returns:
+        (k1, k2) tuple of arrays, sorted by k1, then k2
+    """
+    offsets = np.arange(-delay, delay + 1)
+    k1 = np.repeat(np.arange(K), offsets.size)
+    k2 = k1 + np.tile(offsets, K)
+    valid = (k2 >= 0) & (k2 < K)
+    return k1[valid], k2[valid]
+
+
+def unique(iterable):
+    """List of unique elements, in order of first occurrence."""
+    seen = set()
+    result = []
+    for item in iterable:
+        if item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
+
+
+def positions(tuples):
+    """Dict of tuple -> position within list."""
+    return {tup: j for j, tup in enumerate(tuples)}
+
+
+def param(df, index, column, default=np.nan):
+    """Array of parameter values for given index tuples.
+
+    Args:
+        df: input DataFrame, e.g. data['process']
+        index: list of index tuples
+        column: column name
+
+    Returns:
+        float array of len(index)
+    """
+    if not index:
+        return np.zeros(0)
+    values = df[column].to_dict()
+    return np.array([values.get(i, default) for i in index], dtype=float)
+
+
+def timeseries(df, columns, timesteps):
+    """Array of timeseries values for given columns and timesteps.
+
+    Args:
+        df: timeseries DataFrame, e.g. data['demand']
+        columns: list of column labels
+        timesteps: array of timesteps
+
+    Returns:
+        float array of shape (len(columns), len(timesteps))
+    """
+    if not columns:
+        return np.zeros((0, len(timesteps)))
+    return df.loc[timesteps, columns].values.T.astype(float)
+
+
+def add_variables(prob, ctx):
+    """Add all variable blocks (cf. section Variables in create_model)."""
+    names = ctx['names']
+    com_tuples = ctx['com_tuples']
+    pro_tuples = ctx['pro_tuples']
+    tra_tuples = ctx['tra_tuples']
+    sto_tuples = ctx['sto_tuples']
+    dsm_tuples = ctx['dsm_tuples']
+    partial = ctx['pro_partial_tuples']
+
+    # Pyomo domain of e_pro_in/e_pro_out: all combinations of process tuples
+    # and commodities
+    all_com = ctx['sets']['com'][0]
+    pro_com_domain = [(sit, pro, com) for (sit, pro) in pro_tuples
+                      for com in all_com]
+
+    prob.add_var('costs', COST_TYPES, ['cost_type'], lb=-np.inf,
+                 doc='Costs by type (EUR/a)')
+
+    # commodity source terms: only entries whose commodity has matching type
+    # (cf. m.com_stock_tuples etc. in create_model)
+    ctx['stock_tuples'] = [c for c in com_tuples if c[1] in names('Stock')]
+    ctx['sell_tuples'] = [c for c in com_tuples if c[1] in names('Sell')]
+    ctx['buy_tuples'] = [c for c in com_tuples if c[1] in names('Buy')]
+    prob.add_var('e_co_stock', ctx['stock_tuples'], COM_LABELS, 'tm',
+                 doc='Use of stock commodity source (MW) per timestep')
+    prob.add_var('e_co_sell', ctx['sell_tuples'], COM_LABELS, 'tm',
+                 doc='Use of sell commodity source (MW) per timestep')
+    prob.add_var('e_co_buy', ctx['buy_tuples'], COM_LABELS, 'tm',
+                 doc='Use of buy commodity source (MW) per timestep')
+
+    # process
+    prob.add_var('cap_pro', pro_tuples, PRO_LABELS,
+                 doc='Total process capacity (MW)')
+    prob.add_var('cap_pro_new', pro_tuples, PRO_LABELS,
+                 doc='New process capacity (MW)')
+    prob.add_var('tau_pro', pro_tuples, PRO_LABELS, 't',
+                 doc='Power flow (MW) through process')
+    prob.add_var('e_pro_in', ctx['pro_input_tuples'], PRO_COM_LABELS, 'tm',
+                 domain=pro_com_domain,
+                 doc='Power flow of commodity into process (MW) per timestep')
+    prob.add_var('e_pro_out', ctx['pro_output_tuples'], PRO_COM_LABELS, 'tm',
+                 domain=pro_com_domain,
+                 doc='Power flow out of process (MW) per timestep')
+    prob.add_var('cap_online', partial, PRO_LABELS, 't',
+                 doc='Online capacity (MW) of process per timestep')
+    prob.add_var('startup_pro', partial, PRO_LABELS, 'tm',
+                 doc='Started capacity (MW) of process per timestep')
+
+    # transmission
+    prob.add_var('cap_tra', ctx['tra_cap_tuples'], TRA_LABELS,
+                 doc='Total transmission capacity (MW)')
+    prob.add_var('cap_tra_new', ctx['tra_cap_tuples'], TRA_LABELS,
+                 doc='New transmission capacity (MW)')
+    prob.add_var('e_tra_in', tra_tuples, TRA_LABELS, 'tm',
+                 doc='Power flow into transmission line (MW) per timestep')
+    prob.add_var('e_tra_out', tra_tuples, TRA_LABELS, 'tm',
+                 doc='Power flow out of transmission line (MW) per timestep')
+
+    # storage
+    prob.add_var('cap_sto_c', sto_tuples, STO_LABELS,
+                 doc='Total storage size (MWh)')
+    prob.add_var('cap_sto_c_new', sto_tuples, STO_LABELS,
+                 doc='New storage size (MWh)')
+    prob.add_var('cap_sto_p', sto_tuples, STO_LABELS,
+                 doc='Total storage power (MW)')
+    prob.add_var('cap_sto_p_new', sto_tuples, STO_LABELS,
+                 doc='New  storage power (MW)')
+    prob.add_var('e_sto_in', sto_tuples, STO_LABELS, 'tm',
+                 doc='Power flow into storage (MW) per timestep')
+    prob.add_var('e_sto_out', sto_tuples, STO_LABELS, 'tm',
+                 doc='Power flow out of storage (MW) per timestep')
+    prob.add_var('e_sto_con', sto_tuples, STO_LABELS, 't',
+                 doc='Energy content of storage (MWh) in timestep')
+
+    # demand side management
+    prob.add_var('dsm_up', dsm_tuples, DSM_LABELS, 'tm', doc='DSM upshift')
+    dsm_j, k1, k2 = ctx['dsm_down']
+    tm = ctx['tm']
+    prob.add_var('dsm_down',
+                 [(tm[a], tm[b]) + dsm_tuples[j]
+                  for j, a, b in zip(dsm_j, k1, k2)],
+                 ['t', 't_'] + DSM_LABELS,
+                 doc='DSM downshift')
+
+
+def add_balance(prob, ctx, block, keys, factor=1.0, rows=None, axis='tm'):
+    """Add the commodity balance of given (site, commodity) keys to a block.
+
+    Adds the terms of commodity_balance(m, tm, sit, com) * factor for each
+    key, either per timestep (time-indexed block) or summed over all
+    modelled timesteps (block without time axis).
+
+    Args:
+        prob: a MatrixModel
+        ctx: the context dict from prepare_context
+        block: a constraint block
+        keys: list of (site, commodity) tuples
+        factor: scalar or array (len(keys)) or array (len(keys), K)
+        rows: (optional) static block row of each key; default: key position
+        axis: for blocks without time axis: the time axis to sum over
+
+    Returns:
+        Nothing
+    """
+    factor = np.asarray(factor, float)
+    if factor.ndim == 0:
+        factor = np.full(len(keys), float(factor))
+    if rows is None:
+        rows = range(len(keys))
+    terms = {}
+    for i, (row_j, key) in enumerate(zip(rows, keys)):
+        for var, var_j, sign in ctx['balance'].get(key, []):
+            terms.setdefault(var, ([], [], [], []))
+            terms[var][0].append(row_j)
+            terms[var][1].append(var_j)
+            terms[var][2].append(sign)
+            terms[var][3].append(i)
+    for var, (row_j, var_j, sign, key_i) in terms.items():
+        sign = np.array(sign, float)
+        coef = (sign.reshape((-1,) + (1,) * (factor.ndim - 1)) *
+                factor[np.array(key_i, dtype=int)])
+        add_terms(prob, block, var, row_j, var_j, coef, axis=axis)
+
+
+# Constraint block builders
+# Each builder returns a list of constraint blocks. Row orientation and bounds
+# follow the corresponding Pyomo rules in model.py, so that dual values have
+# identical signs.
+
+def commodity_blocks(prob, ctx):
+    data = ctx['data']
+    names = ctx['names']
+    com_tuples = ctx['com_tuples']
+    pos = ctx['pos']
+    tm = ctx['tm']
+    K = len(tm)
+    weight_dt = ctx['weight'] * ctx['dt']
+    commodity = data['commodity']
+    blocks = []
+
+    # vertex equation
+    vertex = [c for c in com_tuples
+              if c[1] not in names('Env') and c[1] not in names('SupIm')]
+    demand = np.zeros((len(vertex), K))
+    demand_columns = set(data['demand'].columns.tolist())
+    rows_with_demand = [j for j, (sit, com, _) in enumerate(vertex)
+                        if com in names('Demand') and
+                        (sit, com) in demand_columns]
+    demand[rows_with_demand] = timeseries(
+        data['demand'], [vertex[j][:2] for j in rows_with_demand], tm)
+    b = con_block(prob, 'res_vertex', vertex, COM_LABELS, 'tm',
+                  lb=demand, ub=demand,
+                  doc='storage + transmission + process + source + buy - '
+                      'sell == demand')
+    add_balance(prob, ctx, b, [c[:2] for c in vertex], -1.0)
+    for var, sign in (('e_co_stock', 1), ('e_co_sell', -1),
+                      ('e_co_buy', 1)):
+        var_pos = positions(prob._vars[var]['index'])
+        row_j = [j for j, c in enumerate(vertex) if c in var_pos]
+        add_terms(prob, b, var, row_j,
+                  [var_pos[vertex[j]] for j in row_j], sign)
+    dsm_rows = [j for j, c in enumerate(vertex) if c[:2] in pos['dsm']]
+    dsm_j = [pos['dsm'][vertex[j][:2]] for j in dsm_rows]
+    add_terms(prob, b, 'dsm_up', dsm_rows, dsm_j, -1)
+    # downshift dsm_down[t, tm] counts in timestep tm
+    row_of_dsm = {dj: rj for rj, dj in zip(dsm_rows, dsm_j)}
+    down_j, k1, k2 = ctx['dsm_down']
+    if down_j.size:
+        row_j = np.array([row_of_dsm.get(j, -1) for j in down_j])
+        valid = row_j >= 0
+        add_entries(prob, b, row_j[valid] * K + k2[valid],
+                    prob._vars['dsm_down']['offset'] +
+                    np.arange(down_j.size)[valid], 1)
+    blocks.append(b)
+
+    # stock, sell and buy limits per step and in total
+    for kind, var, com_type in (('stock', 'e_co_stock', 'Stock'),
+                                ('sell', 'e_co_sell', 'Sell'),
+                                ('buy', 'e_co_buy', 'Buy')):
+        index = prob._vars[var]['index']
+        j = np.arange(len(index))
+        b = con_block(prob, 'res_{}_step'.format(kind), index, COM_LABELS,
+                      'tm', ub=param(commodity, index, 'maxperstep'),
+                      doc='{} commodity per step <= commodity.maxperstep'
+                          .format(com_type))
+        add_terms(prob, b, var, j, j, 1)
+        blocks.append(b)
+        b = con_block(prob, 'res_{}_total'.format(kind), index, COM_LABELS,
+                      ub=param(commodity, index, 'max'),
+                      doc='total {} commodity <= commodity.max'
+                          .format(com_type))
+        add_terms(prob, b, var, j, j, weight_dt)
+        blocks.append(b)
+
+    # environmental output per step and in total
+    env = [c for c in com_tuples if c[1] in names('Env')]
+    b = con_block(prob, 'res_env_step', env, COM_LABELS, 'tm',
+                  ub=param(commodity, env, 'maxperstep'),
+                  doc='environmental output per step <= commodity.maxperstep')
+    add_balance(prob, ctx, b, [c[:2] for c in env], -1.0)
+    blocks.append(b)
+    b = con_block(prob, 'res_env_total', env, COM_LABELS,
+                  ub=param(commodity, env, 'max'),
+                  doc='total environmental commodity output <= commodity.max')
+    add_balance(prob, ctx, b, [c[:2] for c in env], -weight_dt)
+    blocks.append(b)
+    return blocks
+
+
+def process_blocks(prob, ctx):
+    data = ctx['data']
+    process = data['process']
+    pos = ctx['pos']
+    tm = ctx['tm']
+    dt = ctx['dt']
+    names = ctx['names']
+    pro_tuples = ctx['pro_tuples']
+    blocks = []
+    j_pro = np.arange(len(pro_tuples))
+
+    b = con_block(prob, 'def_process_capacity', pro_tuples, PRO_LABELS,
+                  lb=param(process, pro_tuples, 'inst-cap'),
+                  ub=param(process, pro_tuples, 'inst-cap'),
+                  doc='total process capacity = inst-cap + new capacity')
+    add_terms(prob, b, 'cap_pro', j_pro, j_pro, 1)
+    add_terms(prob, b, 'cap_pro_new', j_pro, j_pro, -1)
+    blocks.append(b)
+
+    # fixed input/output ratios (processes without partial operation)
+    for name, var, tuples, partial, ratio in (
+            ('def_process_input', 'e_pro_in', ctx['pro_input_tuples'],
+             ctx['pro_partial_input_tuples'], ctx['r_in']),
+            ('def_process_output', 'e_pro_out', ctx['pro_output_tuples'],
+             ctx['pro_partial_output_tuples'], ctx['r_out'])):
+        partial = set(partial)
+        index = [p for p in tuples if p not in partial]
+        var_pos = positions(tuples)
+        j = np.arange(len(index))
+        b = con_block(prob, name, index, PRO_COM_LABELS, 'tm', lb=0, ub=0,
+                      doc='process {} = process throughput * {} ratio'.format(
+                          var[-3:].strip('_'), var[-3:].strip('_')))
+        add_terms(prob, b, var, j, [var_pos[p] for p in index], 1)
+        add_terms(prob, b, 'tau_pro', j, [pos['pro'][p[:2]] for p in index],
+                  [-ratio[p[1:]] for p in index])
+        blocks.append(b)
+
+    # intermittent supply
+    supim = [p for p in ctx['pro_input_tuples'] if p[2] in names('SupIm')]
+    j = np.arange(len(supim))
+    b = con_block(prob, 'def_intermittent_supply', supim, PRO_COM_LABELS,
+                  'tm', lb=0, ub=0,
+                  doc='process output = process capacity * supim timeseries')
+    add_terms(prob, b, 'e_pro_in', j, [pos['pro_in'][p] for p in supim], 1)
+    add_terms(prob, b, 'cap_pro', j, [pos['pro'][p[:2]] for p in supim],
+              -timeseries(data['supim'], [(p[0], p[2]) for p in supim], tm))
+    blocks.append(b)
+
+    b = con_block(prob, 'res_process_throughput_by_capacity', pro_tuples,
+                  PRO_LABELS, 'tm', ub=0,
+                  doc='process throughput <= total process capacity')
+    add_terms(prob, b, 'tau_pro', j_pro, j_pro, 1)
+    add_terms(prob, b, 'cap_pro', j_pro, j_pro, -1)
+    blocks.append(b)
+
+    # maximum gradient
+    maxgrad = ctx['pro_maxgrad_tuples']
+    j = np.arange(len(maxgrad))
+    j_mg = [pos['pro'][p] for p in maxgrad]
+    grad = param(process, maxgrad, 'max-grad') * dt
+    b = con_block(prob, 'res_process_maxgrad_lower', maxgrad, PRO_LABELS,
+                  'tm', ub=0,
+                  doc='throughput may not decrease faster than maximal '
+                      'gradient')
+    add_terms(prob, b, 'tau_pro', j, j_mg, 1, shift=-1)
+    add_terms(prob, b, 'cap_pro', j, j_mg, -grad)
+    add_terms(prob, b, 'tau_pro', j, j_mg, -1)
+    blocks.append(b)
+    b = con_block(prob, 'res_process_maxgrad_upper', maxgrad, PRO_LABELS,
+                  'tm', lb=0,
+                  doc='throughput may not increase faster than maximal '
+                      'gradient')
+    add_terms(prob, b, 'tau_pro', j, j_mg, 1, shift=-1)
+    add_terms(prob, b, 'cap_pro', j, j_mg, grad)
+    add_terms(prob, b, 'tau_pro', j, j_mg, -1)
+    blocks.append(b)
+
+    b = con_block(prob, 'res_process_capacity', pro_tuples, PRO_LABELS,
+                  lb=param(process, pro_tuples, 'cap-lo'),
+                  ub=param(process, pro_tuples, 'cap-up'),
+                  doc='process.cap-lo <= total process capacity <= '
+                      'process.cap-up')
+    add_terms(prob, b, 'cap_pro', j_pro, j_pro, 1)
+    blocks.append(b)
+
+    # process area
+    site_area = data['site']['area'].to_dict()
+    area_per_cap = process['area-per-cap'].to_dict()
+    area_sites = []
+    area_terms = []
+    for sit in ctx['sets']['sit'][0]:
+        pros = [p for p in pro_tuples
+                if p[0] == sit and area_per_cap[p] >= 0]
+        if (site_area.get(sit, np.nan) >= 0 and
+                sum(area_per_cap[p] for p in pros) > 0):
+            area_sites.append(sit)
+            area_terms.append(pros)
+    b = con_block(prob, 'res_area', [(s,) for s in area_sites], ['sit'],
+                  ub=[site_area[s] for s in area_sites],
+                  doc='used process area <= total process area')
+    for row_j, pros in enumerate(area_terms):
+        add_terms(prob, b, 'cap_pro', [row_j] * len(pros),
+                  [pos['pro'][p] for p in pros],
+                  [area_per_cap[p] for p in pros])
+    blocks.append(b)
+
+    # power connection capacity: Sell == Buy
+    index = []
+    sell_pros = []
+    for (sit, pro, com) in ctx['pro_input_tuples']:
+        if com in names('Buy'):
+            sell_pro = sell_buy_tuple(ctx, pro)
+            if sell_pro is not None:
+                index.append((sit, pro, com))
+                sell_pros.append((sit, sell_pro))
+    j = np.arange(len(index))
+    b = con_block(prob, 'res_sell_buy_symmetry', index, PRO_COM_LABELS,
+                  lb=0, ub=0,
+                  doc='power connection capacity must be symmetric in both '
+                      'directions')
+    add_terms(prob, b, 'cap_pro', j, [pos['pro'][p[:2]] for p in index], 1)
+    add_terms(prob, b, 'cap_pro', j, [pos['pro'][p] for p in sell_pros], -1)
+    blocks.append(b)
+    return blocks
+
+
+def sell_buy_tuple(ctx, pro_in):
+    """Return the equivalent sell-process for a given buy-process.
+
+    Same logic as search_sell_buy_tuple, on the tuple lists of ctx.
+    """
+    buy_out = set((x[0], x[2]) for x in ctx['pro_output_tuples']
+                  if x[1] == pro_in)
+    for x in ctx['pro_output_tuples']:
+        if x[2] in ctx['names']('Sell'):
+            sell_pro = x[1]
+            sell_in = set((y[0], y[2]) for y in ctx['pro_input_tuples']
+                          if y[1] == sell_pro)
+            if not sell_in.isdisjoint(buy_out):
+                return sell_pro
+    return None
+
+
+def partial_blocks(prob, ctx):
+    process = ctx['data']['process']
+    pos = ctx['pos']
+    partial = ctx['pro_partial_tuples']
+    j = np.arange(len(partial))
+    j_pro = [pos['pro'][p] for p in partial]
+    min_fraction = param(process, partial, 'min-fraction')
+    blocks = []
+
+    b = con_block(prob, 'res_throughput_by_online_capacity_min', partial,
+                  PRO_LABELS, 'tm', lb=0,
+                  doc='cap_online * min-fraction <= tau_pro')
+    add_terms(prob, b, 'tau_pro', j, j_pro, 1)
+    add_terms(prob, b, 'cap_online', j, j, -min_fraction)
+    blocks.append(b)
+    b = con_block(prob, 'res_throughput_by_online_capacity_max', partial,
+                  PRO_LABELS, 'tm', ub=0, doc='tau_pro <= cap_online')
+    add_terms(prob, b, 'tau_pro', j, j_pro, 1)
+    add_terms(prob, b, 'cap_online', j, j, -1)
+    blocks.append(b)
+
+    for name, var, tuples, ratio, ratio_min, var_pos in (
+            ('def_partial_process_input', 'e_pro_in',
+             ctx['pro_partial_input_tuples'], ctx['r_in'], ctx['r_in_min'],
+             pos['pro_in']),
+            ('def_partial_process_output', 'e_pro_out',
+             ctx['pro_partial_output_tuples'], ctx['r_out'],
+             ctx['r_out_min'], pos['pro_out'])):
+        R = np.array([ratio[p[1:]] for p in tuples])
+        r = np.array([ratio_min[p[1:]] for p in tuples])
+        mf = param(process, [p[:2] for p in tuples], 'min-fraction')
+        online_factor = mf * (r - R) / (1 - mf)
+        throughput_factor = (R - mf * r) / (1 - mf)
+        jt = np.arange(len(tuples))
+        b = con_block(prob, name, tuples, PRO_COM_LABELS, 'tm', lb=0, ub=0,
+                      doc='{} = cap_online * min_fraction * (r - R) / '
+                          '(1 - min_fraction) + tau_pro * '
+                          '(R - min_fraction * r) / (1 - min_fraction)'
+                          .format(var))
+        add_terms(prob, b, var, jt, [var_pos[p] for p in tuples], 1)
+        add_terms(prob, b, 'cap_pro', jt, [pos['pro'][p[:2]] for p in tuples],
+                  -online_factor)
+        add_terms(prob, b, 'tau_pro', jt, [pos['pro'][p[:2]] for p in tuples],
+                  -throughput_factor)
+        blocks.append(b)
+
+    b = con_block(prob, 'res_cap_online_by_cap_pro', partial, PRO_LABELS,
+                  'tm', ub=0, doc='online capacity <= process capacity')
+    add_terms(prob, b, 'cap_online', j, j, 1)
+    add_terms(prob, b, 'cap_pro', j, j_pro, -1)
+    blocks.append(b)
+    b = con_block(prob, 'def_startup_capacity', partial, PRO_LABELS, 'tm',
+                  lb=0,
+                  doc='startup_capacity[t] >= cap_online[t] - '
+                      'cap_online[t-1]')
+    add_terms(prob, b, 'startup_pro', j, j, 1)
+    add_terms(prob, b, 'cap_online', j, j, -1)
+    add_terms(prob, b, 'cap_online', j, j, 1, shift=-1)
+    blocks.append(b)
+    return blocks
+
+
+def transmission_blocks(prob, ctx):
+    transmission = ctx['data']['transmission']
+    tra_tuples = ctx['tra_tuples']
+    cap_tuples = ctx['tra_cap_tuples']
+    j = np.arange(len(tra_tuples))
+    j_cap = np.arange(len(cap_tuples))
+    blocks = []
+
+    b = con_block(prob, 'def_transmission_capacity', cap_tuples, TRA_LABELS,
+                  lb=param(transmission, cap_tuples, 'inst-cap'),
+                  ub=param(transmission, cap_tuples, 'inst-cap'),
+                  doc='total transmission capacity = inst-cap + new capacity')
+    add_terms(prob, b, 'cap_tra', j_cap, j_cap, 1)
+    add_terms(prob, b, 'cap_tra_new', j_cap, j_cap, -1)
+    blocks.append(b)
+    b = con_block(prob, 'def_transmission_output', tra_tuples, TRA_LABELS,
+                  'tm', lb=0, ub=0,
+                  doc='transmission output = transmission input * efficiency')
+    add_terms(prob, b, 'e_tra_out', j, j, 1)
+    add_terms(prob, b, 'e_tra_in', j, j,
+              -param(transmission, tra_tuples, 'eff'))
+    blocks.append(b)
+    b = con_block(prob, 'res_transmission_input_by_capacity', tra_tuples,
+                  TRA_LABELS, 'tm', ub=0,
+                  doc='transmission input <= total transmission capacity')
+    add_terms(prob, b, 'e_tra_in', j, j, 1)
+    add_terms(prob, b, 'cap_tra', j, ctx['tra_cap'], -1)
+    blocks.append(b)
+    b = con_block(prob, 'res_transmission_capacity', cap_tuples, TRA_LABELS,
+                  lb=param(transmission, cap_tuples, 'cap-lo'),
+                  ub=param(transmission, cap_tuples, 'cap-up'),
+                  doc='transmission.cap-lo <= total transmission capacity <= '
+                      'transmission.cap-up')
+    add_terms(prob, b, 'cap_tra', j_cap, j_cap, 1)
+    blocks.append(b)
+    if not ctx['undirected']:
+        # undirected corridors share one capacity instead
+        tra_pos = ctx['pos']['tra']
+        b = con_block(prob, 'res_transmission_symmetry', tra_tuples,
+                      TRA_LABELS, lb=0, ub=0,
+                      doc='total transmission capacity must be symmetric in '
+                          'both directions')
+        add_terms(prob, b, 'cap_tra', j, j, 1)
+        add_terms(prob, b, 'cap_tra', j,
+                  [tra_pos[(sout, sin, tra, com)]
+                   for (sin, sout, tra, com) in tra_tuples], -1)
+        blocks.append(b)
+    return blocks
+
+
+def storage_blocks(prob, ctx):
+    storage = ctx['data']['storage']
+    sto_tuples = ctx['sto_tuples']
+    dt = ctx['dt']
+    j = np.arange(len(sto_tuples))
+    blocks = []
+
+    b = con_block(prob, 'def_storage_state', sto_tuples, STO_LABELS, 'tm',
+                  lb=0, ub=0,
+                  doc='storage[t] = storage[t-1] * (1 - discharge) + input '
+                      '- output')
+    add_terms(prob, b, 'e_sto_con', j, j, 1)
+    add_terms(prob, b, 'e_sto_con', j, j,
+              -(1 - param(storage, sto_tuples, 'discharge')), shift=-1)
+    add_terms(prob, b, 'e_sto_in', j, j,
+              -param(storage, sto_tuples, 'eff-in') * dt)
+    add_terms(prob, b, 'e_sto_out', j, j,
+              dt / param(storage, sto_tuples, 'eff-out'))
+    blocks.append(b)
+
+    for kind, var, unit in (('power', 'cap_sto_p', 'p'),
+                            ('capacity', 'cap_sto_c', 'c')):
+        inst_cap = param(storage, sto_tuples, 'inst-cap-' + unit)
+        b = con_block(prob, 'def_storage_' + kind, sto_tuples, STO_LABELS,
+                      lb=inst_cap, ub=inst_cap,
+                      doc='storage {} = inst-cap + new {}'.format(kind, kind))
+        add_terms(prob, b, var, j, j, 1)
+        add_terms(prob, b, var + '_new', j, j, -1)
+        blocks.append(b)
+
+    for name, var, doc in (
+            ('res_storage_input_by_power', 'e_sto_in',
+             'storage input <= storage power'),
+            ('res_storage_output_by_power', 'e_sto_out',
+             'storage output <= storage power')):
+        b = con_block(prob, name, sto_tuples, STO_LABELS, 'tm', ub=0, doc=doc)
+        add_terms(prob, b, var, j, j, 1)
+        add_terms(prob, b, 'cap_sto_p', j, j, -1)
+        blocks.append(b)
+    b = con_block(prob, 'res_storage_state_by_capacity', sto_tuples,
+                  STO_LABELS, 't', ub=0,
+                  doc='storage content <= storage capacity')
+    add_terms(prob, b, 'e_sto_con', j, j, 1)
+    add_terms(prob, b, 'cap_sto_c', j, j, -1)
+    blocks.append(b)
+
+    for kind, var, unit in (('power', 'cap_sto_p', 'p'),
+                            ('capacity', 'cap_sto_c', 'c')):
+        b = con_block(prob, 'res_storage_' + kind, sto_tuples, STO_LABELS,
+                      lb=param(storage, sto_tuples, 'cap-lo-' + unit),
+                      ub=param(storage, sto_tuples, 'cap-up-' + unit),
+                      doc='storage.cap-lo-{0} <= storage {1} <= '
+                          'storage.cap-up-{0}'.format(unit, kind))
+        add_terms(prob, b, var, j, j, 1)
+        blocks.append(b)
+
+    # initial (==) and final (>=) storage content, as one block indexed by
+    # (t, sto_tuples) for t in (first, last)
+    t = ctx['t']
+    init = param(storage, sto_tuples, 'init')
+    index = ([(t[0],) + s for s in sto_tuples] +
+             [(t[-1],) + s for s in sto_tuples])
+    n = len(sto_tuples)
+    b = con_block(prob, 'res_initial_and_final_storage_state', index,
+                  ['t'] + STO_LABELS,
+                  lb=np.zeros(2 * n),
+                  ub=np.concatenate([np.zeros(n), np.full(n, np.inf)]),
+                  doc='storage content initial == and final >= storage.init '
+                      '* capacity')
+    con = prob._vars['e_sto_con']
+    add_entries(prob, b, np.arange(2 * n),
+                con['offset'] + np.concatenate([j * con['K'],
+                                                j * con['K'] + con['K'] - 1]),
+                1)
+    add_terms(prob, b, 'cap_sto_c', np.arange(2 * n), np.tile(j, 2),
+              -np.tile(init, 2))
+    blocks.append(b)
+    return blocks
+
+
+def cost_blocks(prob, ctx):
+    data = ctx['data']
+    process = data['process']
+    transmission = data['transmission']
+    storage = data['storage']
+    commodity = data['commodity']
+    tm = ctx['tm']
+    names = ctx['names']
+    weight_dt = ctx['weight'] * ctx['dt']
+    pro_tuples = ctx['pro_tuples']
+    tra_tuples = ctx['tra_tuples']
+    sto_tuples = ctx['sto_tuples']
+    j_pro = np.arange(len(pro_tuples))
+    j_tra = np.arange(len(tra_tuples))
+    j_sto = np.arange(len(sto_tuples))
+
+    b = con_block(prob, 'def_costs', [(ct,) for ct in COST_TYPES],
+                  ['cost_type'], lb=0, ub=0,
+                  doc='main cost function by cost type')
+    row = {ct: j for j, ct in enumerate(COST_TYPES)}
+    add_terms(prob, b, 'costs', np.arange(len(COST_TYPES)),
+              np.arange(len(COST_TYPES)), 1)
+
+    def cost(cost_type, var, var_j, coef):
+        var_j = np.asarray(var_j, dtype=int)
+        add_terms(prob, b, var, np.full(var_j.size, row[cost_type]), var_j,
+                  -np.asarray(coef, float))
+
+    # Invest
+    cost('Invest', 'cap_pro_new', j_pro,
+         param(process, pro_tuples, 'inv-cost') *
+         param(process, pro_tuples, 'annuity-factor'))
+    cost('Invest', 'cap_tra_new', ctx['tra_cap'],
+         param(transmission, tra_tuples, 'inv-cost') *
+         param(transmission, tra_tuples, 'annuity-factor'))
+    sto_af = param(storage, sto_tuples, 'annuity-factor')
+    cost('Invest', 'cap_sto_p_new', j_sto,
+         param(storage, sto_tuples, 'inv-cost-p') * sto_af)
+    cost('Invest', 'cap_sto_c_new', j_sto,
+         param(storage, sto_tuples, 'inv-cost-c') * sto_af)
+
+    # Fixed
+    cost('Fixed', 'cap_pro', j_pro, param(process, pro_tuples, 'fix-cost'))
+    cost('Fixed', 'cap_tra', ctx['tra_cap'],
+         param(transmission, tra_tuples, 'fix-cost'))
+    cost('Fixed', 'cap_sto_p', j_sto,
+         param(storage, sto_tuples, 'fix-cost-p'))
+    cost('Fixed', 'cap_sto_c', j_sto,
+         param(storage, sto_tuples, 'fix-cost-c'))
+
+    # Variable (summed over modelled timesteps)
+    cost('Variable', 'tau_pro', j_pro,
+         weight_dt * param(process, pro_tuples, 'var-cost'))
+    cost('Variable', 'e_tra_in', j_tra,
+         weight_dt * param(transmission, tra_tuples, 'var-cost'))
+    cost('Variable', 'e_sto_con', j_sto,
+         ctx['weight'] * param(storage, sto_tuples, 'var-cost-c'))
+    var_cost_p = weight_dt * param(storage, sto_tuples, 'var-cost-p')
+    cost('Variable', 'e_sto_in', j_sto, var_cost_p)
+    cost('Variable', 'e_sto_out', j_sto, var_cost_p)
+
+    # Fuel
+    stock = prob._vars['e_co_stock']['index']
+    cost('Fuel', 'e_co_stock', np.arange(len(stock)),
+         weight_dt * param(commodity, stock, 'price'))
+
+    # Revenue and Purchase (timeseries prices)
+    price = data['buy_sell_price']
+    price_columns = price.columns.get_level_values(0).tolist()
+    for cost_type, var, sign in (('Revenue', 'e_co_sell', -1),
+                                 ('Purchase', 'e_co_buy', 1)):
+        index = prob._vars[var]['index']
+        if not index:
+            continue
+        series = price.loc[tm].values.T.astype(float)
+        series = series[[price_columns.index(c[1]) for c in index]]
+        cost(cost_type, var, np.arange(len(index)),
+             sign * weight_dt * series *
+             param(commodity, index, 'price')[:, np.newaxis])
+
+    # Startup
+    partial = ctx['pro_partial_tuples']
+    cost('Startup', 'startup_pro', np.arange(len(partial)),
+         weight_dt * param(process, partial, 'startup-cost'))
+
+    # Environmental
+    env = [c for c in ctx['com_tuples'] if c[1] in names('Env')]
+    add_balance(prob, ctx, b, [c[:2] for c in env],
+                weight_dt * param(commodity, env, 'price'),
+                rows=[row['Environmental']] * len(env))
+    return [b]
+
+
+def dsm_blocks(prob, ctx):
+    dsm = ctx['data']['dsm']
+    dsm_tuples = ctx['dsm_tuples']
+    if not dsm_tuples:
+        return []
+    K = len(ctx['tm'])
+    j = np.arange(len(dsm_tuples))
+    cap_up = param(dsm, dsm_tuples, 'cap-max-up')
+    cap_do = param(dsm, dsm_tuples, 'cap-max-do')
+    delay = param(dsm, dsm_tuples, 'delay')
+    down_j, k1, k2 = ctx['dsm_down']
+    down_cols = prob._vars['dsm_down']['offset'] + np.arange(down_j.size)
+    blocks = []
+
+    b = con_block(prob, 'def_dsm_variables', dsm_tuples, DSM_LABELS, 'tm',
+                  lb=0, ub=0, doc='DSMup * efficiency factor n == DSMdo')
+    add_entries(prob, b, down_j * K + k1, down_cols, 1)
+    add_terms(prob, b, 'dsm_up', j, j, -param(dsm, dsm_tuples, 'eff'))
+    blocks.append(b)
+
+    b = con_block(prob, 'res_dsm_upward', dsm_tuples, DSM_LABELS, 'tm',
+                  ub=np.floor(cap_up),
+                  doc='DSMup <= Cup (threshold capacity of DSMup)')
+    add_terms(prob, b, 'dsm_up', j, j, 1)
+    blocks.append(b)
+
+    b = con_block(prob, 'res_dsm_downward', dsm_tuples, DSM_LABELS, 'tm',
+                  ub=cap_do,
+                  doc='DSMdo <= Cdo (threshold capacity of DSMdo)')
+    add_entries(prob, b, down_j * K + k2, down_cols, 1)
+    blocks.append(b)
+
+    b = con_block(prob, 'res_dsm_maximum', dsm_tuples, DSM_LABELS, 'tm',
+                  ub=np.maximum(cap_up, cap_do),
+                  doc='DSMup + DSMdo <= max(Cup,Cdo)')
+    add_terms(prob, b, 'dsm_up', j, j, 1)
+    add_entries(prob, b, down_j * K + k2, down_cols, 1)
+    blocks.append(b)
+
+    # sum of upshift within recovery period [tm, tm + recov)
+    b = con_block(prob, 'res_dsm_recovery', dsm_tuples, DSM_LABELS, 'tm',
+                  ub=cap_up * delay,
+                  doc='DSMup(t, t + recovery time R) <= Cup * delay time L')
+    up = prob._vars['dsm_up']
+    for row_j, recov in enumerate(param(dsm, dsm_tuples, 'recov')):
+        offsets = np.arange(int(recov))
+        k = np.repeat(np.arange(K), offsets.size)
+        k_up = k + np.tile(offsets, K)
+        valid = k_up < K
+        add_entries(prob, b, row_j * K + k[valid],
+                    up['offset'] + row_j * up['K'] + k_up[valid], 1)
+    blocks.append(b)
+    return blocks
+
+
+def co2_blocks(prob, ctx):
+    co2_limit = ctx['data']['global_prop'].loc['CO2 limit', 'value']
+    if math.isinf(co2_limit) or not co2_limit > 0:
+        return []
+    sites = ctx['sets']['sit'][0]
+    b = con_block(prob, 'res_global_co2_limit', [(None,)], ['None'],
+                  ub=co2_limit,
+                  doc='total co2 commodity output <= Global CO2 limit')
+    add_balance(prob, ctx, b, [(sit, 'CO2') for sit in sites],
+                -ctx['weight'] * ctx['dt'], rows=[0] * len(sites))
+    return [b]
+
+
+# all constraint block builders, in the order of create_model
+BLOCK_BUILDERS = [commodity_blocks, process_blocks, partial_blocks,
+                  transmission_blocks, storage_blocks, cost_blocks,
+                  dsm_blocks, co2_blocks]
+
+
+# Solution
+
+def entity_series(name, values, index, labels, times=None):
+    """Wrap values of a variable or constraint block in a Series.
+
+    Creates a Series shaped like the result of get_entity for the
+    corresponding Pyomo entity: the timestep (if any) comes first in the
+    index, followed by the static index tuple.
+
+    Args:
+        name: entity name
+        values: array of block values (tuple-major, cf. MatrixModel)
+        index: list of static index tuples
+        labels: onset names of the static index tuples
+        times: (optional) array of timesteps of the block
+
+    Returns:
+        a Series with entity values
+    """
+    if len(index) == 0:
+        return pd.Series(name=name)
+    if times is None:
+        if len(labels) == 1:
+            index = pd.Index([i[0] if isinstance(i, tuple) else i
+                              for i in index], name=labels[0])
+        else:
+            index = pd.MultiIndex.from_tuples(index, names=labels)
+        return pd.Series(values, index=index, name=name)
+
+    # reorder from tuple-major to time-major
+    J, K = len(index), len(times)
+    values = np.asarray(values).reshape(J, K).T.ravel()
+    arrays = [np.repeat(times, J)]
+    for component in zip(*index):
+        component_array = np.empty(J, dtype=object)
+        component_array[:] = component
+        arrays.append(np.tile(component_array, K))
+    index = pd.MultiIndex.from_arrays(arrays, names=['t'] + labels)
+    return pd.Series(values, index=index, name=name)
+
+
+def load_solution(prob, x, duals=None):
+    """Store solution as result cache of the model.
+
+    After this, get_entity (and all functions based on it) return the
+    solution values under the entity names of the Pyomo model.
+
+    Args:
+        prob: a MatrixModel
+        x: array of variable values
+        duals: (optional) array of constraint dual values
+
+    Returns:
+        Nothing
+    """
+    result = {}
+    for name, (values, labels) in prob._sets.items():
+        values = [v if isinstance(v, tuple) else (v,) for v in values]
+        series_name = name + '_' if labels == [name] else name
+        result[name] = entity_series(series_name, np.ones(len(values)),
+                                     values, labels)
+    for name, value in prob._params.items():
+        if not isinstance(value, pd.Series):
+            value = pd.Series([value], name=name,
+                              index=pd.Index([None], name='None'))
+        result[name] = value
+
+    for name, v in prob._vars.items():
+        times = prob.timesteps[v['axis']] if v['axis'] else None
+        values = x[v['offset']:v['offset'] + v['size']]
+        series = entity_series(name, values, v['index'], v['labels'], times)
+        if v['domain'] is not None and len(times) > 0:
+            # report on the full domain of the Pyomo variable
+            full = entity_series(name, np.zeros(len(v['domain']) * len(times)),
+                                 v['domain'], v['labels'], times)
+            series = (series.reindex(full.index, fill_value=0)
+                      if not series.empty else full)
+        result[name] = series
+
+    if duals is not None:
+        for name, c in prob._cons.items():
+            times = prob.timesteps[c['axis']] if c['axis'] else None
+            values = duals[c['offset']:c['offset'] + c['size']]
+            result[name] = entity_series(name, values, c['index'],
+                                         c['labels'], times)
+    prob._result = result
+
+
+def solve_matrix(prob, solver='glpk', logfile=None, tee=False,
+                 presolve=True):
+    """Solve a MatrixModel and store its solution as result cache.
+
+    Args:
+        prob: a MatrixModel, as created by create_model(..., backend='matrix')
+        solver: 'glpk' (via MPS file) or 'highs' (in-process, via SciPy);
+                glpk starts from the basis of a previous solve, if any (cf.
+                warm_start)
+        logfile: (optional) solver log filename
+        tee: set True to show solver output
+        presolve: set False to pass the linear program to the solver as
+                  built, instead of its reduction by urbs.presolve; always
+                  False for models with dual=True
+
+    Returns:
+        solver status, e.g. 'optimal'
+    """
+    if solver not in ('highs', 'glpk'):
+        raise ValueError("Unknown solver '{}'".format(solver))
+    lp = prob
+    if presolve and not prob.dual:
+        lp = presolve_model(prob)
+        if lp is None:
+            return 'infeasible'
+        lp.basis = getattr(prob, 'basis', None)
+
+    if solver == 'highs':
+        status, x, duals = solve_highs(lp, tee)
+    else:
+        status, x, duals = solve_glpk(lp, logfile, tee)
+    if lp is not prob:
+        if getattr(lp, 'basis', None) is not None:
+            prob.basis = lp.basis
+        if status == 'optimal':
+            x = postsolve(lp, x)
+    if status == 'optimal':
+        load_solution(prob, x, duals if prob.dual else None)
+    return status
+
+
+def solve_highs(prob, tee=False):
+    """Solve with the HiGHS solver of scipy.optimize.linprog."""
+    from scipy.optimize import linprog
+
+    A, lb, ub = prob.A, prob.row_lb, prob.row_ub
+    eq = (lb == ub)
+    le = ~eq & np.isfinite(ub)
+    ge = ~eq & np.isfinite(lb)
+    A_ub = sp.vstack([A[le], -A[ge]]).tocsr()
+    b_ub = np.concatenate([ub[le], -lb[ge]])
+    result = linprog(
+        prob.c,
+        A_ub=A_ub if A_ub.shape[0] else None,
+        b_ub=b_ub if A_ub.shape[0] else None,
+        A_eq=A[eq] if eq.any() else None,
+        b_eq=lb[eq] if eq.any() else None,
+        bounds=np.column_stack([prob.col_lb, prob.col_ub]),
+        method='highs', options={'disp': tee})
+    if result.status != 0:
+        return result.message, None, None
+
+    # marginals are derivatives of the objective with respect to the
+    # right-hand sides; for the negated >= rows, the sign flips
+    duals = np.zeros(prob.nrows)
+    if eq.any():
+        duals[eq] = result.eqlin.marginals
+    if A_ub.shape[0]:
+        marginals = result.ineqlin.marginals
+        duals[le] += marginals[:le.sum()]
+        duals[ge] -= marginals[le.sum():]
+    return 'optimal', result.x, duals
+
+
+def solve_glpk(prob, logfile=None, tee=False):
+    """Solve with glpsol, via MPS file and GLPK solution file."""
+    tmpdir = tempfile.mkdtemp(prefix='urbs')
+    try:
+        mps_file = os.path.join(tmpdir, 'model.mps')
+        sol_file = os.path.join(tmpdir, 'model.sol')
+        rows = write_mps(prob, mps_file)
+        command = ['glpsol', '--freemps', mps_file, '--min', '-w', sol_file]
+        if logfile:
+            command += ['--log', logfile]
+
+        # initial basis from a previous solve (cf. warm_start), if the same
+        # rows were written
+        basis = getattr(prob, 'basis', None)
+        if (basis is not None and np.array_equal(basis['rows'], rows) and
+                basis.get('ncols', prob.ncols) == prob.ncols):
+            ini_file = os.path.join(tmpdir, 'initial.sol')
+            with open(ini_file, 'w') as f:
+                f.write(basis['solution'])
+            command += ['--ini', ini_file]
+        stdout = None if tee else open(os.devnull, 'w')
+        try:
+            subprocess.check_call(command, stdout=stdout)
+        finally:
+            if stdout is not None:
+                stdout.close()
+        status, x, row_duals = read_glpk_solution(sol_file, prob.ncols)
+        if (status == 'optimal' and
+                max_row_violation(prob, x) > FEASIBILITY_TOLERANCE):
+            raise RuntimeError("GLPK solution of '{}' violates its rows by "
+                               "up to {:g}".format(
+                                   prob.name, max_row_violation(prob, x)))
+        if status == 'optimal':
+            # keep final basis for warm starting the next solve
+            with open(sol_file) as f:
+                prob.basis = {'rows': rows, 'ncols': prob.ncols,
+                              'solution': f.read()}
+    finally:
+        shutil.rmtree(tmpdir)
+
+    # map duals of written rows back to all rows
+    duals = np.zeros(prob.nrows)
+    if row_duals is not None:
+        duals[rows] = row_duals
+    return status, x, duals
+
+
+def max_row_violation(prob, x):
+    """Return the largest violation of the row bounds of prob by x.
+
+    Violations are relative to the row activity (or 1, if smaller).
+    """
+    if prob.nrows == 0:
+        return 0.0
+    activity = prob.A.dot(x)
+    violation = np.maximum(prob.row_lb - activity, activity - prob.row_ub)
+    return float(np.max(violation / np.maximum(1, np.abs(activity))))
+
+
+def read_glpk_solution(filename, ncols):
+    """Read basic solution file written by glpsol -w (GLPK >= 4.57).
+
+    Args:
+        filename: GLPK solution filename
+        ncols: number of columns
+
+    Returns:
+        (status, x, row_duals) tuple
+    """
+    x = np.zeros(ncols)
+    row_duals = []
+    status = None
+    with open(filename) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0] == 'c':
+                continue
+            elif fields[0] == 's':
+                # s bas ROWS COLS PRIMAL_STATUS DUAL_STATUS OBJECTIVE
+                if int(fields[3]) != ncols:
+                    raise ValueError("GLPK solution in '{}' has {} columns, "
+                                     "expected {}".format(filename,
+                                                          fields[3], ncols))
+                if fields[4] == 'f' and fields[5] == 'f':
+                    status = 'optimal'
+                elif fields[4] in ('i', 'n'):
+                    status = 'infeasible'
+                else:
+                    status = 'unknown'
+            elif fields[0] == 'i':
+                # i ROW STATUS PRIMAL DUAL
+                row_duals.append(float(fields[4]))
+            elif fields[0] == 'j':
+                # j COLUMN STATUS PRIMAL DUAL
+                x[int(fields[1]) - 1] = float(fields[3])
+    if status is None:
+        raise ValueError("Unknown GLPK solution file format in "
+                         "'{}'".format(filename))
+    return status, x, np.array(row_duals)
+
+
+def write_mps(prob, filename):
+    """Write MatrixModel to a (free) MPS file.
+
+    Rows and columns are named R<number> and C<number> after their position
+    in the MatrixModel. Rows without any finite bound are not written; all
+    columns are, in order, so that column j of the file is column j - 1 of
+    prob (cf. read_glpk_solution).
+
+    Args:
+        prob: a MatrixModel
+        filename: MPS filename to be written
+
+    Returns:
+        array of row numbers that were written, in file order
+    """
+    lb, ub = prob.row_lb, prob.row_ub
+    rows = np.flatnonzero(np.isfinite(lb) | np.isfinite(ub))
+    row_type = np.where(lb == ub, 'E',
+                        np.where(np.isfinite(ub), 'L', 'G'))
+    rhs = np.where(np.isfinite(ub), ub, lb)
+    ranged = np.isfinite(lb) & np.isfinite(ub) & (lb != ub)
+    A = prob.A[rows].tocsc()
+    number = '{:.17g}'.format
+
+    with open(filename, 'w') as f:
+        f.write('NAME {}\n'.format(prob.name))
+        f.write('ROWS\n N OBJ\n')
+        f.writelines(' {} R{}\n'.format(row_type[i], i) for i in rows)
+
+        f.write('COLUMNS\n')
+        for j in range(prob.ncols):
+            start, end = A.indptr[j], A.indptr[j + 1]
+            # every column is written, even empty ones (with a zero
+            # objective entry), as GLPK numbers columns in file order
+            if prob.c[j] or start == end:
+                f.write(' C{} OBJ {}\n'.format(j, number(prob.c[j])))
+            f.writelines(' C{} R{} {}\n'.format(j, rows[i], number(v))
+                         for i, v in zip(A.indices[start:end],
+                                         A.data[start:end]))
+
+        f.write('RHS\n')
+        f.writelines(' RHS R{} {}\n'.format(i, number(rhs[i]))
+                     for i in rows if rhs[i] != 0)
+        if ranged.any():
+            f.write('RANGES\n')
+            f.writelines(' RNG R{} {}\n'.format(i, number(ub[i] - lb[i]))
+                         for i in np.flatnonzero(ranged))
+
+        f.write('BOUNDS\n')
+        for j in range(prob.ncols):
+            lo, up = prob.col_lb[j], prob.col_ub[j]
+            if lo == up:
+                f.write(' FX BND C{} {}\n'.format(j, number(lo)))
+                continue
+            if np.isinf(lo) and np.isinf(up):
+                f.write(' FR BND C{}\n'.format(j))
+                continue
+            if np.isinf(lo):
+                f.write(' MI BND C{}\n'.format(j))
+            elif lo != 0:
+                f.write(' LO BND C{} {}\n'.format(j, number(lo)))
+            if not np.isinf(up):
+                f.write(' UP BND C{} {}\n'.format(j, number(up)))
+        f.write('ENDATA\n')
+    return rows
@@ -1,23 +1,102 @@
 import math
+import pandas as pd
 import pyomo.core as pyomo
 from datetime import datetime
+from .buildprofile import finish_profile, start_profile
+from .matrix import create_matrix_model
 from .modelhelper import *
-
-
-def create_model(data, timesteps=None, dt=1, dual=False):
+from .prune import is_pruned, prune_data
+from .tsa import TIMESERIES, typical_timesteps
+from .validation import validate_input
+
+# input attributes that are stored as mutable Params, i.e. that can be changed
+# on an existing model by update_model without rebuilding it
+MUTABLE_PARAMETERS = {
+    'commodity': ['price', 'max', 'maxperstep'],
+    'process': ['inv-cost', 'fix-cost', 'var-cost', 'startup-cost',
+                'cap-lo', 'cap-up', 'annuity-factor'],
+    'transmission': ['inv-cost', 'fix-cost', 'var-cost', 'cap-lo', 'cap-up',
+                     'annuity-factor'],
+    'storage': ['inv-cost-p', 'inv-cost-c', 'fix-cost-p', 'fix-cost-c',
+                'var-cost-p', 'var-cost-c', 'cap-lo-p', 'cap-up-p',
+                'cap-lo-c', 'cap-up-c', 'annuity-factor']}
+
+# attributes only read by the rules during model construction, which slim
+# models release afterwards: the input tables (still accessible via
+# get_input, which falls back to m._data) and the lookup tables derived from
+# them
+BUILD_HELPERS = [
+    'global_prop', 'site', 'commodity', 'process', 'process_commodity',
+    'transmission', 'storage', 'demand', 'supim', 'buy_sell_price', 'dsm',
+    'periods', 'period_timesteps', 'timestep_period', 'r_in', 'r_out',
+    'r_in_dict', 'r_out_dict', 'proc_area', 'sit_area', 'r_in_min_fraction',
+    'r_out_min_fraction', 'r_in_min_fraction_dict', 'r_out_min_fraction_dict',
+    'global_prop_dict', 'site_dict', 'commodity_dict', 'process_dict',
+    'transmission_dict', 'storage_dict', 'dsm_dict', 'dsm_delay_windows',
+    'dsm_recovery_windows', 'period_dict', 'demand_dict', 'supim_dict',
+    'buy_sell_price_dict', 'com_balance_index', 'tra_corridor']
+
+
+def create_model(data, timesteps=None, dt=1, dual=False, backend='pyomo',
+                 profile=False, workers=1, slim=False, undirected=False,
+                 prune=False):
     """Create a pyomo ConcreteModel urbs object from given input data.
 
     Args:
         data: a dict of 6 DataFrames with the keys 'commodity', 'process',
-            'transmission', 'storage', 'demand' and 'supim'.
-        timesteps: optional list of timesteps, default: demand timeseries
+            'transmission', 'storage', 'demand' and 'supim'. If it contains
+            the key 'periods' (cf. aggregate_timeseries), its timeseries
+            are modelled as typical periods.
+        timesteps: optional list of timesteps, default: demand timeseries;
+            must be omitted for typical periods
         dt: timestep duration in hours (default: 1)
         dual: set True to add dual variables to model (slower); default: False
+        backend: 'pyomo' (default) or 'matrix' to assemble the same linear
+            program as sparse matrix (cf. module urbs.matrix)
+        profile: set True to record build time and size of each model
+            component in attribute build_profile (a DataFrame, cf. module
+            urbs.buildprofile), or a filename to write it to a JSON file,
+            too; default: False
+        workers: number of processes that build constraint blocks in
+            parallel; requires backend 'matrix' (default: 1)
+        slim: set True to reduce the memory of the model: it keeps a copy
+            of data with timeseries sliced to the modelled timesteps (data
+            itself is not changed) and releases the input tables and lookup
+            tables only needed for construction (cf. BUILD_HELPERS);
+            default: False
+        undirected: set True to model each transmission corridor (site
+            pair, transmission, commodity) with one capacity shared by both
+            directions, instead of one capacity per direction tied by
+            res_transmission_symmetry. Both directions must have equal
+            inst-cap, cap-lo and cap-up; their costs are added up.
+            default: False
+        prune: set True to remove processes, transmissions, storages and
+            commodities that cannot be used from the input first (cf.
+            prune_data); default: False
 
     Returns:
-        a pyomo ConcreteModel object
+        a pyomo ConcreteModel object (or a MatrixModel for backend 'matrix')
     """
-    m = pyomo.ConcreteModel()
+    validate_input(data)
+    if prune:
+        data = prune_data(data)
+    if slim:
+        data = slim_data(data, timesteps)
+    if backend == 'matrix':
+        if profile:
+            raise ValueError("Build profile requires backend 'pyomo'")
+        return create_matrix_model(data, timesteps, dt, dual, workers,
+                                   undirected)
+    elif backend != 'pyomo':
+        raise ValueError("Unknown backend '{}'".format(backend))
+    if workers != 1:
+        raise ValueError("Parallel model construction requires backend "
+                         "'matrix'")
+
+    if profile:
+        m, tracing = start_profile()
+    else:
+        m = pyomo.ConcreteModel()
     m.name = 'urbs'
     m.created = datetime.now().strftime('%Y%m%dT%H%M')
     m._data = data
@@ -25,14 +104,15 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     # Optional
     if not timesteps:
         timesteps = data['demand'].index.tolist()
+    elif 'periods' in data:
+        raise ValueError("Typical periods are always modelled completely; "
+                         "omit argument timesteps")
 
     # Preparations
     # ============
-    # Data import. Syntax to access a value within equation definitions looks
-    # like this:
-    #
-    #     m.storage.loc[site, storage, commodity][attribute]
-    #
+    # Data import. The DataFrames are kept accessible for reporting functions
+    # (cf. get_input); equation definitions use the parameter lookup tables
+    # derived from them below.
     m.global_prop = data['global_prop'].drop('description', axis=1)
     m.site = data['site']
     m.commodity = data['commodity']
@@ -46,6 +126,23 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     m.timesteps = timesteps
     m.dsm = data['dsm']
 
+    # periods: lists of modelled timesteps, each preceded by an
+    # initialisation timestep. With typical periods (cf.
+    # aggregate_timeseries), there is one list per typical period and
+    # m.periods assigns them to the original periods. Otherwise, all
+    # timesteps form a single period.
+    if 'periods' in data:
+        m.periods = data['periods']
+        m.period_timesteps = typical_timesteps(m.periods)
+        occurrences = m.periods['typical'].value_counts().to_dict()
+    else:
+        m.periods = pd.DataFrame(columns=['typical', 'first', 'last'])
+        m.period_timesteps = [list(m.timesteps[1:])]
+        occurrences = {0: 1}
+    m.timestep_period = {t: k
+                         for k, period in enumerate(m.period_timesteps)
+                         for t in [period[0] - 1] + period}
+
     # process input/output ratios
     m.r_in = m.process_commodity.xs('In', level='Direction')['ratio']
     m.r_out = m.process_commodity.xs('Out', level='Direction')['ratio']
@@ -85,6 +182,40 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         m.storage['depreciation'],
         m.storage['wacc'])
 
+    # Parameter lookup tables. Constraint rules read single values from these
+    # dicts instead of the DataFrames above, as pandas indexing is too slow
+    # to be called once per index tuple. Syntax:
+    #
+    #     m.storage_dict[attribute][site, storage, commodity]
+    #     m.demand_dict[site, commodity][timestep]
+    #
+    m.global_prop_dict = parameter_dict(m.global_prop)
+    m.site_dict = parameter_dict(m.site)
+    m.commodity_dict = parameter_dict(m.commodity)
+    m.process_dict = parameter_dict(m.process)
+    m.transmission_dict = parameter_dict(m.transmission)
+    m.storage_dict = parameter_dict(m.storage)
+    m.dsm_dict = parameter_dict(m.dsm)
+
+    # DSM time windows {(sit, com): {t: timesteps}}: downshifts for an
+    # upshift in t happen within +/- delay, recovery lasts recov timesteps
+    m.dsm_delay_windows = dsm_windows(
+        m.period_timesteps, m.dsm_dict.get('delay', {}),
+        lambda delay: -delay, lambda delay: delay)
+    m.dsm_recovery_windows = dsm_windows(
+        m.period_timesteps, m.dsm_dict.get('recov', {}),
+        lambda recov: 0, lambda recov: recov - 1)
+    m.period_dict = parameter_dict(m.periods)
+    # timeseries lookup tables: only the rows of the modelled timesteps are
+    # read, e.g. from memory-mapped input (cf. convert_input)
+    m.demand_dict = parameter_dict(m.demand.loc[list(m.timesteps)])
+    m.supim_dict = parameter_dict(m.supim.loc[list(m.timesteps)])
+    m.buy_sell_price_dict = parameter_dict(
+        m.buy_sell_price.loc[list(m.timesteps)],
+        m.buy_sell_price.columns.get_level_values(0))
+    m.r_in_min_fraction_dict = m.r_in_min_fraction.to_dict()
+    m.r_out_min_fraction_dict = m.r_out_min_fraction.to_dict()
+
     # Sets
     # ====
     # Syntax: m.{name} = Set({domain}, initialize={values})
@@ -101,7 +232,7 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     # modelled (i.e. excluding init time step for storage) time steps
     m.tm = pyomo.Set(
         within=m.t,
-        initialize=m.timesteps[1:],
+        initialize=[t for period in m.period_timesteps for t in period],
         ordered=True,
         doc='Set of modelled timesteps')
 
@@ -109,10 +240,36 @@ def create_model(data, timesteps=None, dt=1, dual=False):
     # downshift effective in tt to compensate for upshift in t
     m.tt = pyomo.Set(
         within=m.t,
-        initialize=m.timesteps[1:],
+        initialize=[t for period in m.period_timesteps for t in period],
         ordered=True,
         doc='Set of additional DSM time steps')
 
+    # first and last timestep, for the initial and final storage content
+    # (typical periods link storage contents by period instead)
+    m.t_init_final = pyomo.Set(
+        within=m.t,
+        initialize=([m.t[1], m.t[len(m.t)]] if m.periods.empty else []),
+        ordered=True,
+        doc='Set of first and last timestep')
+
+    # original and typical periods (cf. aggregate_timeseries), both empty
+    # unless typical periods are modelled
+    m.period = pyomo.Set(
+        initialize=m.periods.index,
+        ordered=True,
+        doc='Set of original periods')
+    m.typical = pyomo.Set(
+        initialize=sorted(occurrences) if not m.periods.empty else [],
+        ordered=True,
+        doc='Set of typical periods')
+    m.typical_t = pyomo.Set(
+        within=m.typical*m.t,
+        initialize=[(k, t)
+                    for k in m.typical
+                    for t in [m.period_timesteps[k][0] - 1] +
+                    m.period_timesteps[k]],
+        doc='Timesteps of typical periods, e.g. (2,51)')
+
     # site (e.g. north, middle, south...)
     m.sit = pyomo.Set(
         initialize=m.commodity.index.get_level_values('Site').unique(),
@@ -164,6 +321,21 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         initialize=m.transmission.index,
         doc='Combinations of possible transmissions, e.g. '
             '(South,Mid,hvac,Elec)')
+
+    # transmission capacities: one per transmission tuple, or one per
+    # corridor (undirected), indexed by its first direction; m.tra_corridor
+    # maps each transmission tuple to the index of its capacity
+    if undirected:
+        tra_cap_tuples, m.tra_corridor = transmission_corridors(
+            m.transmission)
+    else:
+        tra_cap_tuples = m.transmission.index
+        m.tra_corridor = {t: t for t in m.transmission.index}
+    m.tra_cap_tuples = pyomo.Set(
+        within=m.sit*m.sit*m.tra*m.com,
+        initialize=tra_cap_tuples,
+        doc='Transmissions with own capacity: all, or one direction per '
+            'corridor if undirected, e.g. (Mid,South,hvac,Elec)')
     m.sto_tuples = pyomo.Set(
         within=m.sit*m.sto*m.com,
         initialize=m.storage.index,
@@ -176,9 +348,9 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         within=m.tm*m.tm*m.sit*m.com,
         initialize=[(t, tt, site, commodity)
                     for (t, tt, site, commodity)
-                    in dsm_down_time_tuples(m.timesteps[1:],
+                    in dsm_down_time_tuples(m.period_timesteps,
                                             m.dsm_site_tuples,
-                                            m)],
+                                            m.dsm_delay_windows)],
         doc='Combinations of possible dsm_down combinations, e.g. '
             '(5001,5003,Mid,Elec)')
 
@@ -204,12 +376,16 @@ def create_model(data, timesteps=None, dt=1, dual=False):
                     if process == pro],
         doc='Commodities produced by process by site, e.g. (Mid,PV,Elec)')
 
+    # (site, commodity) index of all process, transmission and storage terms
+    # that contribute to the commodity balance (cf. commodity_balance)
+    m.com_balance_index = commodity_balance_index(m)
+
     # process tuples for maximum gradient feature
     m.pro_maxgrad_tuples = pyomo.Set(
         within=m.sit*m.pro,
         initialize=[(sit, pro)
                     for (sit, pro) in m.pro_tuples
-                    if m.process.loc[sit, pro]['max-grad'] < 1.0 / dt],
+                    if m.process_dict['max-grad'][sit, pro] < 1.0 / dt],
         doc='Processes with maximum gradient smaller than timestep length')
 
     # process tuples for startup & partial feature
@@ -263,17 +439,56 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         initialize=commodity_subset(m.com_tuples, 'Env'),
         doc='Commodities that (might) have a maximum creation limit')
 
+    # commodity tuples by type (of commodity name, cf. commodity_subset)
+    m.com_vertex_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples
+                    if c[1] not in m.com_env and c[1] not in m.com_supim],
+        doc='Commodity tuples with vertex rule (not Env or SupIm)')
+    m.com_stock_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_stock],
+        doc='Commodity tuples of stock commodities')
+    m.com_sell_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_sell],
+        doc='Commodity tuples of sell commodities')
+    m.com_buy_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_buy],
+        doc='Commodity tuples of buy commodities')
+    m.com_env_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples if c[1] in m.com_env],
+        doc='Commodity tuples of environmental commodities')
+    m.pro_supim_input_tuples = pyomo.Set(
+        within=m.sit*m.pro*m.com,
+        initialize=[p for p in m.pro_input_tuples if p[2] in m.com_supim],
+        doc='Processes with intermittent input, e.g. (Mid,PV,Solar)')
+
     # Parameters
 
     # weight = length of year (hours) / length of simulation (hours)
     # weight scales costs and emissions from length of simulation to a full
     # year, making comparisons among cost types (invest is annualized, fixed
     # costs are annual by default, variable costs are scaled by weight) and
-    # among different simulation durations meaningful.
+    # among different simulation durations meaningful. For typical periods,
+    # each timestep is weighted by the number of periods it represents.
+    weights = timestep_weights(m.period_timesteps, occurrences, dt)
     m.weight = pyomo.Param(
-        initialize=float(8760) / (len(m.tm) * dt),
+        m.tm,
+        initialize=weights,
         doc='Pre-factor for variable costs and emissions for an annual result')
 
+    # period_weight = weight of the storage content at the start of an
+    # original period, which applies to all timesteps of that period
+    m.period_weight = pyomo.Param(
+        m.period,
+        initialize={p: len(m.period_timesteps[k]) *
+                    weights[m.period_timesteps[k][0]] / occurrences[k]
+                    for p, k in m.period_dict['typical'].items()},
+        doc='Pre-factor for storage content costs of original periods')
+
     # dt = spacing between timesteps. Required for storage equation that
     # converts between energy (storage content, e_sto_con) and power (all other
     # quantities that start with "e_")
@@ -281,6 +496,30 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         initialize=dt,
         doc='Time step duration (in hours), default: 1')
 
+    # mutable parameters: costs, capacity bounds and commodity limits. They
+    # replace the finite entries of the lookup tables, so that the rules use
+    # them unchanged, and can be changed by update_model; infinite entries
+    # stay plain floats (cf. mutable_parameter_lookup)
+    for table, index in [('commodity', m.com_tuples),
+                         ('process', m.pro_tuples),
+                         ('transmission', m.tra_tuples),
+                         ('storage', m.sto_tuples)]:
+        lookup = getattr(m, table + '_dict')
+        for attribute in MUTABLE_PARAMETERS[table]:
+            name = mutable_parameter_name(table, attribute)
+            m.add_component(name, pyomo.Param(
+                index,
+                initialize=lookup[attribute],
+                mutable=True,
+                doc='{} {}'.format(table, attribute)))
+            lookup[attribute] = mutable_parameter_lookup(
+                m.find_component(name), lookup[attribute])
+
+    m.co2_limit = pyomo.Param(
+        initialize=m.global_prop_dict['value']['CO2 limit'],
+        mutable=True,
+        doc='Global CO2 limit (t/a)')
+
     # Variables
 
     # costs
@@ -291,15 +530,15 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     # commodity
     m.e_co_stock = pyomo.Var(
-        m.tm, m.com_tuples,
+        m.tm, m.com_stock_tuples,
         within=pyomo.NonNegativeReals,
         doc='Use of stock commodity source (MW) per timestep')
     m.e_co_sell = pyomo.Var(
-        m.tm, m.com_tuples,
+        m.tm, m.com_sell_tuples,
         within=pyomo.NonNegativeReals,
         doc='Use of sell commodity source (MW) per timestep')
     m.e_co_buy = pyomo.Var(
-        m.tm, m.com_tuples,
+        m.tm, m.com_buy_tuples,
         within=pyomo.NonNegativeReals,
         doc='Use of buy commodity source (MW) per timestep')
 
@@ -336,11 +575,11 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     # transmission
     m.cap_tra = pyomo.Var(
-        m.tra_tuples,
+        m.tra_cap_tuples,
         within=pyomo.NonNegativeReals,
         doc='Total transmission capacity (MW)')
     m.cap_tra_new = pyomo.Var(
-        m.tra_tuples,
+        m.tra_cap_tuples,
         within=pyomo.NonNegativeReals,
         doc='New transmission capacity (MW)')
     m.e_tra_in = pyomo.Var(
@@ -379,8 +618,23 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         doc='Power flow out of storage (MW) per timestep')
     m.e_sto_con = pyomo.Var(
         m.t, m.sto_tuples,
+        within=pyomo.NonNegativeReals if m.periods.empty else pyomo.Reals,
+        doc='Energy content of storage (MWh) in timestep; for typical '
+            'periods relative to the start of the period')
+
+    # storage linking between typical periods
+    m.e_sto_con_inter = pyomo.Var(
+        m.period, m.sto_tuples,
         within=pyomo.NonNegativeReals,
-        doc='Energy content of storage (MWh) in timestep')
+        doc='Energy content of storage (MWh) at start of original period')
+    m.e_sto_con_max = pyomo.Var(
+        m.typical, m.sto_tuples,
+        within=pyomo.Reals,
+        doc='Maximum relative storage content (MWh) in typical period')
+    m.e_sto_con_min = pyomo.Var(
+        m.typical, m.sto_tuples,
+        within=pyomo.Reals,
+        doc='Minimum relative storage content (MWh) in typical period')
 
     # demand side management
     m.dsm_up = pyomo.Var(
@@ -398,39 +652,39 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     # commodity
     m.res_vertex = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_vertex_tuples,
         rule=res_vertex_rule,
         doc='storage + transmission + process + source + buy - sell == demand')
     m.res_stock_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_stock_tuples,
         rule=res_stock_step_rule,
         doc='stock commodity input per step <= commodity.maxperstep')
     m.res_stock_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_stock_tuples,
         rule=res_stock_total_rule,
         doc='total stock commodity input <= commodity.max')
     m.res_sell_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_sell_tuples,
         rule=res_sell_step_rule,
         doc='sell commodity output per step <= commodity.maxperstep')
     m.res_sell_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_sell_tuples,
         rule=res_sell_total_rule,
         doc='total sell commodity output <= commodity.max')
     m.res_buy_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_buy_tuples,
         rule=res_buy_step_rule,
         doc='buy commodity output per step <= commodity.maxperstep')
     m.res_buy_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_buy_tuples,
         rule=res_buy_total_rule,
         doc='total buy commodity output <= commodity.max')
     m.res_env_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_env_tuples,
         rule=res_env_step_rule,
         doc='environmental output per step <= commodity.maxperstep')
     m.res_env_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_env_tuples,
         rule=res_env_total_rule,
         doc='total environmental commodity output <= commodity.max')
 
@@ -448,7 +702,7 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         rule=def_process_output_rule,
         doc='process output = process throughput * output ratio')
     m.def_intermittent_supply = pyomo.Constraint(
-        m.tm, m.pro_input_tuples,
+        m.tm, m.pro_supim_input_tuples,
         rule=def_intermittent_supply_rule,
         doc='process output = process capacity * supim timeseries')
     m.res_process_throughput_by_capacity = pyomo.Constraint(
@@ -509,7 +763,7 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 
     # transmission
     m.def_transmission_capacity = pyomo.Constraint(
-        m.tra_tuples,
+        m.tra_cap_tuples,
         rule=def_transmission_capacity_rule,
         doc='total transmission capacity = inst-cap + new capacity')
     m.def_transmission_output = pyomo.Constraint(
@@ -521,14 +775,16 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         rule=res_transmission_input_by_capacity_rule,
         doc='transmission input <= total transmission capacity')
     m.res_transmission_capacity = pyomo.Constraint(
-        m.tra_tuples,
+        m.tra_cap_tuples,
         rule=res_transmission_capacity_rule,
         doc='transmission.cap-lo <= total transmission capacity <= '
             'transmission.cap-up')
-    m.res_transmission_symmetry = pyomo.Constraint(
-        m.tra_tuples,
-        rule=res_transmission_symmetry_rule,
-        doc='total transmission capacity must be symmetric in both directions')
+    if not undirected:
+        m.res_transmission_symmetry = pyomo.Constraint(
+            m.tra_tuples,
+            rule=res_transmission_symmetry_rule,
+            doc='total transmission capacity must be symmetric in both '
+                'directions')
 
     # storage
     m.def_storage_state = pyomo.Constraint(
@@ -564,10 +820,41 @@ def create_model(data, timesteps=None, dt=1, dual=False):
         rule=res_storage_capacity_rule,
         doc='storage.cap-lo-c <= storage capacity <= storage.cap-up-c')
     m.res_initial_and_final_storage_state = pyomo.Constraint(
-        m.t, m.sto_tuples,
+        m.t_init_final, m.sto_tuples,
         rule=res_initial_and_final_storage_state_rule,
         doc='storage content initial == and final >= storage.init * capacity')
 
+    # storage linking between typical periods
+    m.def_storage_inter_state = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=def_storage_inter_state_rule,
+        doc='storage[p+1] = storage[p] * (1 - discharge)^length + '
+            'storage change in typical period of p')
+    m.res_storage_intra_start = pyomo.Constraint(
+        m.typical, m.sto_tuples,
+        rule=res_storage_intra_start_rule,
+        doc='relative storage content at start of typical period == 0')
+    m.res_storage_intra_max = pyomo.Constraint(
+        m.typical_t, m.sto_tuples,
+        rule=res_storage_intra_max_rule,
+        doc='relative storage content <= maximum of typical period')
+    m.res_storage_intra_min = pyomo.Constraint(
+        m.typical_t, m.sto_tuples,
+        rule=res_storage_intra_min_rule,
+        doc='relative storage content >= minimum of typical period')
+    m.res_storage_inter_by_capacity = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=res_storage_inter_by_capacity_rule,
+        doc='storage[p] + relative storage content <= storage capacity')
+    m.res_storage_inter_positive = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=res_storage_inter_positive_rule,
+        doc='storage[p] + relative storage content >= 0')
+    m.res_initial_and_final_storage_inter = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=res_initial_and_final_storage_inter_rule,
+        doc='storage content initial == and final >= storage.init * capacity')
+
     # costs
     m.def_costs = pyomo.Constraint(
         m.cost_type,
@@ -608,8 +895,130 @@ def create_model(data, timesteps=None, dt=1, dual=False):
             rule=res_global_co2_limit_rule,
             doc='total co2 commodity output <= Global CO2 limit')
 
+    m.slim = slim
+    m.undirected = undirected
+    if slim:
+        for name in BUILD_HELPERS:
+            delattr(m, name)
+
     if dual:
         m.dual = pyomo.Suffix(direction=pyomo.Suffix.IMPORT)
+    if profile:
+        finish_profile(m, tracing, None if profile is True else profile)
+    return m
+
+
+def slim_data(data, timesteps=None):
+    """Return data with timeseries sliced to the given timesteps.
+
+    Args:
+        data: input data dict
+        timesteps: list of timesteps, including the initialisation
+            timestep; None (or typical periods in data, which are modelled
+            completely) leaves the timeseries as they are
+
+    Returns:
+        a shallow copy of data, with sliced copies of the TIMESERIES tables
+    """
+    data = dict(data)
+    if timesteps and 'periods' not in data:
+        for name in TIMESERIES:
+            data[name] = data[name].loc[list(timesteps)]
+    return data
+
+
+def update_model(m, data):
+    """Apply changed input data to an existing model in place.
+
+    Only the attributes listed in MUTABLE_PARAMETERS and the global 'CO2
+    limit' may differ between data and the input the model was created from;
+    everything else (sets, timeseries, DSM, ...) requires a new model. This
+    allows to solve several scenarios with one model instance.
+
+    Args:
+        m: a pyomo ConcreteModel created by create_model
+        data: a modified copy of the input data dict used for creating m
+
+    Returns:
+        the modified model m
+
+    Raises:
+        ValueError: if data changes more than the mutable parameters,
+            changes one of them between infinite and finite, or makes the
+            two directions of an undirected transmission differ
+
+    Example:
+        >>> prob = create_model(data, timesteps)
+        >>> prob = update_model(prob, scenario(copy.deepcopy(data)))
+    """
+    if not isinstance(m, pyomo.ConcreteModel):
+        raise ValueError("update_model only supports Pyomo models")
+    if is_pruned(m._data):
+        data = prune_data(data)
+    if m.slim:
+        data = slim_data(data, m.timesteps)
+
+    # structural check: compare everything but the mutable parameters (a
+    # pruned model also requires the same entries to be pruned)
+    for name in m._data:
+        old, new = m._data[name], data[name]
+        mutable = MUTABLE_PARAMETERS.get(name.replace('pruned_', ''), [])
+        if name == 'global_prop':
+            old, new = old.drop('CO2 limit'), new.drop('CO2 limit')
+        if not (old.index.equals(new.index) and
+                old.drop(mutable, axis=1, errors='ignore').equals(
+                    new.drop(mutable, axis=1, errors='ignore'))):
+            raise ValueError("Input '{}' differs in more than mutable "
+                             "parameters; create a new model".format(name))
+
+    for table in ['process', 'transmission', 'storage']:
+        data[table]['annuity-factor'] = annuity_factor(
+            data[table]['depreciation'],
+            data[table]['wacc'])
+
+    # infinite mutable parameters are not part of the constraints (cf.
+    # mutable_parameter_lookup), so they must stay infinite and vice versa
+    lookups = {}
+    for table in MUTABLE_PARAMETERS:
+        lookups[table] = parameter_dict(data[table])
+        for attribute in MUTABLE_PARAMETERS[table]:
+            param = m.find_component(mutable_parameter_name(table, attribute))
+            for index, value in lookups[table][attribute].items():
+                current = pyomo.value(param[index])
+                if math.isinf(value) != math.isinf(current):
+                    raise ValueError(
+                        "Input '{}' changes {} of {} between infinite and "
+                        "finite; create a new model".format(
+                            table, attribute, index))
+    if m.undirected:
+        transmission_corridors(data['transmission'])
+    co2_limit = data['global_prop'].loc['CO2 limit', 'value']
+    if has_co2_limit(co2_limit) != has_co2_limit(pyomo.value(m.co2_limit)):
+        raise ValueError("Global CO2 limit is switched on or off; "
+                         "create a new model")
+
+    # replace input DataFrames and lookup tables (unless released, cf.
+    # slim), keep mutable Params as lookup table entries
+    m._data = data
+    if not m.slim:
+        m.global_prop = data['global_prop'].drop('description', axis=1)
+        m.global_prop_dict = parameter_dict(m.global_prop)
+    for table in MUTABLE_PARAMETERS:
+        lookup = lookups[table]
+        for attribute in MUTABLE_PARAMETERS[table]:
+            param = m.find_component(mutable_parameter_name(table, attribute))
+            for index, value in lookup[attribute].items():
+                param[index] = value
+            lookup[attribute] = mutable_parameter_lookup(
+                param, lookup[attribute])
+        if not m.slim:
+            setattr(m, table, data[table])
+            setattr(m, table + '_dict', lookup)
+    m.co2_limit = co2_limit
+
+    # a result cache (cf. save) refers to the previous solution
+    if hasattr(m, '_result'):
+        del m._result
     return m
 
 
@@ -622,11 +1031,8 @@ def create_model(data, timesteps=None, dt=1, dual=False):
 # storage activity (calculated by function commodity_balance);
 # contains implicit constraint for stock commodity source term
 def res_vertex_rule(m, tm, sit, com, com_type):
-    # environmental or supim commodities don't have this constraint (yet)
-    if com in m.com_env:
-        return pyomo.Constraint.Skip
-    if com in m.com_supim:
-        return pyomo.Constraint.Skip
+    # environmental or supim commodities don't have this constraint (yet),
+    # cf. m.com_vertex_tuples
 
     # helper function commodity_balance calculates balance from input to
     # and output from processes, storage and transmission.
@@ -656,7 +1062,7 @@ def res_vertex_rule(m, tm, sit, com, com_type):
     # constraint is about power (MW), not energy (MWh)
     if com in m.com_demand:
         try:
-            power_surplus -= m.demand.loc[tm][sit, com]
+            power_surplus -= m.demand_dict[sit, com][tm]
         except KeyError:
             pass
     # if sit com is a dsm tuple, the power surplus is decreased by the
@@ -664,9 +1070,7 @@ def res_vertex_rule(m, tm, sit, com, com_type):
     if (sit, com) in m.dsm_site_tuples:
         power_surplus -= m.dsm_up[tm, sit, com]
         power_surplus += sum(m.dsm_down[t, tm, sit, com]
-                             for t in dsm_time_tuples(
-                                 tm, m.timesteps[1:],
-                                 m.dsm['delay'].loc[sit, com]))
+                             for t in m.dsm_delay_windows[sit, com][tm])
     return power_surplus == 0
 
 # demand side management (DSM) constraints
@@ -675,127 +1079,98 @@ def res_vertex_rule(m, tm, sit, com, com_type):
 # DSMup == DSMdo * efficiency factor n
 def def_dsm_variables_rule(m, tm, sit, com):
     dsm_down_sum = 0
-    for tt in dsm_time_tuples(tm,
-                              m.timesteps[1:],
-                              m.dsm['delay'].loc[sit, com]):
+    for tt in m.dsm_delay_windows[sit, com][tm]:
         dsm_down_sum += m.dsm_down[tm, tt, sit, com]
-    return dsm_down_sum == m.dsm_up[tm, sit, com] * m.dsm.loc[sit, com]['eff']
+    return dsm_down_sum == m.dsm_up[tm, sit, com] * m.dsm_dict['eff'][sit, com]
 
 
 # DSMup <= Cup (threshold capacity of DSMup)
 def res_dsm_upward_rule(m, tm, sit, com):
-    return m.dsm_up[tm, sit, com] <= int(m.dsm.loc[sit, com]['cap-max-up'])
+    return m.dsm_up[tm, sit, com] <= int(m.dsm_dict['cap-max-up'][sit, com])
 
 
 # DSMdo <= Cdo (threshold capacity of DSMdo)
 def res_dsm_downward_rule(m, tm, sit, com):
     dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             m.dsm['delay'].loc[sit, com]):
+    for t in m.dsm_delay_windows[sit, com][tm]:
         dsm_down_sum += m.dsm_down[t, tm, sit, com]
-    return dsm_down_sum <= m.dsm.loc[sit, com]['cap-max-do']
+    return dsm_down_sum <= m.dsm_dict['cap-max-do'][sit, com]
 
 
 # DSMup + DSMdo <= max(Cup,Cdo)
 def res_dsm_maximum_rule(m, tm, sit, com):
     dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             m.dsm['delay'].loc[sit, com]):
+    for t in m.dsm_delay_windows[sit, com][tm]:
         dsm_down_sum += m.dsm_down[t, tm, sit, com]
 
-    max_dsm_limit = max(m.dsm.loc[sit, com]['cap-max-up'],
-                        m.dsm.loc[sit, com]['cap-max-do'])
+    max_dsm_limit = max(m.dsm_dict['cap-max-up'][sit, com],
+                        m.dsm_dict['cap-max-do'][sit, com])
     return m.dsm_up[tm, sit, com] + dsm_down_sum <= max_dsm_limit
 
 
 # DSMup(t, t + recovery time R) <= Cup * delay time L
 def res_dsm_recovery_rule(m, tm, sit, com):
     dsm_up_sum = 0
-    for t in dsm_recovery(tm,
-                          m.timesteps[1:],
-                          m.dsm['recov'].loc[sit, com]):
+    for t in m.dsm_recovery_windows[sit, com][tm]:
         dsm_up_sum += m.dsm_up[t, sit, com]
-    return dsm_up_sum <= (m.dsm.loc[sit, com]['cap-max-up'] *
-                          m.dsm['delay'].loc[sit, com])
+    return dsm_up_sum <= (m.dsm_dict['cap-max-up'][sit, com] *
+                          m.dsm_dict['delay'][sit, com])
 
 
 # stock commodity purchase == commodity consumption, according to
 # commodity_balance of current (time step, site, commodity);
 # limit stock commodity use per time step
 def res_stock_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_stock[tm, sit, com, com_type] <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    return (m.e_co_stock[tm, sit, com, com_type] <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
 
 
 # limit stock commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_stock_total_rule(m, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total consumption of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_stock[tm, sit, com, com_type] * m.dt)
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total consumption of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_stock[tm, sit, com, com_type] * m.dt * m.weight[tm])
+    return (total_consumption <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 
 # limit sell commodity use per time step
 def res_sell_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_sell:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_sell[tm, sit, com, com_type] <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    return (m.e_co_sell[tm, sit, com, com_type] <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
 
 
 # limit sell commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_sell_total_rule(m, sit, com, com_type):
-    if com not in m.com_sell:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total sale of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_sell[tm, sit, com, com_type] * m.dt)
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total sale of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_sell[tm, sit, com, com_type] * m.dt * m.weight[tm])
+    return (total_consumption <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 
 # limit buy commodity use per time step
 def res_buy_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_buy:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_buy[tm, sit, com, com_type] <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    return (m.e_co_buy[tm, sit, com, com_type] <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
 
 
 # limit buy commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_buy_total_rule(m, sit, com, com_type):
-    if com not in m.com_buy:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total sale of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_buy[tm, sit, com, com_type] * m.dt)
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total sale of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_buy[tm, sit, com, com_type] * m.dt * m.weight[tm])
+    return (total_consumption <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 
 # environmental commodity creation == - commodity_balance of that commodity
@@ -803,27 +1178,21 @@ def res_buy_total_rule(m, sit, com, com_type):
 # any process activity;
 # limit environmental commodity output per time step
 def res_env_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        environmental_output = - commodity_balance(m, tm, sit, com)
-        return (environmental_output <=
-                m.commodity.loc[sit, com, com_type]['maxperstep'])
+    environmental_output = - commodity_balance(m, tm, sit, com)
+    return (environmental_output <=
+            m.commodity_dict['maxperstep'][sit, com, com_type])
 
 
 # limit environmental commodity output in total (scaled to annual
 # emissions, thanks to m.weight)
 def res_env_total_rule(m, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total creation of environmental commodity com
-        env_output_sum = 0
-        for tm in m.tm:
-            env_output_sum += (- commodity_balance(m, tm, sit, com) * m.dt)
-        env_output_sum *= m.weight
-        return (env_output_sum <=
-                m.commodity.loc[sit, com, com_type]['max'])
+    # calculate total creation of environmental commodity com
+    env_output_sum = 0
+    for tm in m.tm:
+        env_output_sum += (- commodity_balance(m, tm, sit, com) *
+                           m.dt * m.weight[tm])
+    return (env_output_sum <=
+            m.commodity_dict['max'][sit, com, com_type])
 
 # process
 
@@ -832,28 +1201,25 @@ def res_env_total_rule(m, sit, com, com_type):
 def def_process_capacity_rule(m, sit, pro):
     return (m.cap_pro[sit, pro] ==
             m.cap_pro_new[sit, pro] +
-            m.process.loc[sit, pro]['inst-cap'])
+            m.process_dict['inst-cap'][sit, pro])
 
 
 # process input power == process throughput * input ratio
 def def_process_input_rule(m, tm, sit, pro, co):
     return (m.e_pro_in[tm, sit, pro, co] ==
-            m.tau_pro[tm, sit, pro] * m.r_in.loc[pro, co])
+            m.tau_pro[tm, sit, pro] * m.r_in_dict[pro, co])
 
 
 # process output power = process throughput * output ratio
 def def_process_output_rule(m, tm, sit, pro, co):
     return (m.e_pro_out[tm, sit, pro, co] ==
-            m.tau_pro[tm, sit, pro] * m.r_out.loc[pro, co])
+            m.tau_pro[tm, sit, pro] * m.r_out_dict[pro, co])
 
 
 # process input (for supim commodity) = process capacity * timeseries
 def def_intermittent_supply_rule(m, tm, sit, pro, coin):
-    if coin in m.com_supim:
-        return (m.e_pro_in[tm, sit, pro, coin] ==
-                m.cap_pro[sit, pro] * m.supim.loc[tm][sit, coin])
-    else:
-        return pyomo.Constraint.Skip
+    return (m.e_pro_in[tm, sit, pro, coin] ==
+            m.cap_pro[sit, pro] * m.supim_dict[sit, coin][tm])
 
 
 # process throughput <= process capacity
@@ -863,20 +1229,22 @@ def res_process_throughput_by_capacity_rule(m, tm, sit, pro):
 
 def res_process_maxgrad_lower_rule(m, t, sit, pro):
     return (m.tau_pro[t-1, sit, pro] -
-            m.cap_pro[sit, pro] * m.process.loc[sit, pro]['max-grad'] * m.dt <=
+            m.cap_pro[sit, pro] *
+            m.process_dict['max-grad'][sit, pro] * m.dt <=
             m.tau_pro[t, sit, pro])
 
 
 def res_process_maxgrad_upper_rule(m, t, sit, pro):
     return (m.tau_pro[t-1, sit, pro] +
-            m.cap_pro[sit, pro] * m.process.loc[sit, pro]['max-grad'] * m.dt >=
+            m.cap_pro[sit, pro] *
+            m.process_dict['max-grad'][sit, pro] * m.dt >=
             m.tau_pro[t, sit, pro])
 
 
 def res_throughput_by_online_capacity_min_rule(m, tm, sit, pro):
     return (m.tau_pro[tm, sit, pro] >=
             m.cap_online[tm, sit, pro] *
-            m.process.loc[sit, pro]['min-fraction'])
+            m.process_dict['min-fraction'][sit, pro])
 
 
 def res_throughput_by_online_capacity_max_rule(m, tm, sit, pro):
@@ -884,9 +1252,9 @@ def res_throughput_by_online_capacity_max_rule(m, tm, sit, pro):
 
 
 def def_partial_process_input_rule(m, tm, sit, pro, coin):
-    R = m.r_in.loc[pro, coin]  # input ratio at maximum operation point
-    r = m.r_in_min_fraction[pro, coin]  # input ratio at lowest operation point
-    min_fraction = m.process.loc[sit, pro]['min-fraction']
+    R = m.r_in_dict[pro, coin]  # input ratio at maximum operation point
+    r = m.r_in_min_fraction_dict[pro, coin]  # input ratio at lowest operation
+    min_fraction = m.process_dict['min-fraction'][sit, pro]
 
     online_factor = min_fraction * (r - R) / (1 - min_fraction)
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
@@ -897,9 +1265,9 @@ def def_partial_process_input_rule(m, tm, sit, pro, coin):
 
 
 def def_partial_process_output_rule(m, tm, sit, pro, coo):
-    R = m.r_out.loc[pro, coo]  # input ratio at maximum operation point
-    r = m.r_out_min_fraction[pro, coo]  # input ratio at lowest operation point
-    min_fraction = m.process.loc[sit, pro]['min-fraction']
+    R = m.r_out_dict[pro, coo]  # input ratio at maximum operation point
+    r = m.r_out_min_fraction_dict[pro, coo]  # input ratio at lowest operation
+    min_fraction = m.process_dict['min-fraction'][sit, pro]
 
     online_factor = min_fraction * (r - R) / (1 - min_fraction)
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
@@ -921,22 +1289,22 @@ def def_startup_capacity_rule(m, tm, sit, pro):
 
 # lower bound <= process capacity <= upper bound
 def res_process_capacity_rule(m, sit, pro):
-    return (m.process.loc[sit, pro]['cap-lo'],
+    return (m.process_dict['cap-lo'][sit, pro],
             m.cap_pro[sit, pro],
-            m.process.loc[sit, pro]['cap-up'])
+            m.process_dict['cap-up'][sit, pro])
 
 
 # used process area <= maximal process area
 def res_area_rule(m, sit):
-    if m.site.loc[sit]['area'] >= 0 and sum(
-                         m.process.loc[(s, p), 'area-per-cap']
+    if m.site_dict['area'][sit] >= 0 and sum(
+                         m.process_dict['area-per-cap'][s, p]
                          for (s, p) in m.pro_area_tuples
                          if s == sit) > 0:
         total_area = sum(m.cap_pro[s, p] *
-                         m.process.loc[(s, p), 'area-per-cap']
+                         m.process_dict['area-per-cap'][s, p]
                          for (s, p) in m.pro_area_tuples
                          if s == sit)
-        return total_area <= m.site.loc[sit]['area']
+        return total_area <= m.site_dict['area'][sit]
     else:
         # Skip constraint, if area is not numeric
         return pyomo.Constraint.Skip
@@ -962,27 +1330,27 @@ def res_sell_buy_symmetry_rule(m, sit_in, pro_in, coin):
 def def_transmission_capacity_rule(m, sin, sout, tra, com):
     return (m.cap_tra[sin, sout, tra, com] ==
             m.cap_tra_new[sin, sout, tra, com] +
-            m.transmission.loc[sin, sout, tra, com]['inst-cap'])
+            m.transmission_dict['inst-cap'][sin, sout, tra, com])
 
 
 # transmission output == transmission input * efficiency
 def def_transmission_output_rule(m, tm, sin, sout, tra, com):
     return (m.e_tra_out[tm, sin, sout, tra, com] ==
             m.e_tra_in[tm, sin, sout, tra, com] *
-            m.transmission.loc[sin, sout, tra, com]['eff'])
+            m.transmission_dict['eff'][sin, sout, tra, com])
 
 
 # transmission input <= transmission capacity
 def res_transmission_input_by_capacity_rule(m, tm, sin, sout, tra, com):
     return (m.e_tra_in[tm, sin, sout, tra, com] <=
-            m.cap_tra[sin, sout, tra, com])
+            m.cap_tra[m.tra_corridor[sin, sout, tra, com]])
 
 
 # lower bound <= transmission capacity <= upper bound
 def res_transmission_capacity_rule(m, sin, sout, tra, com):
-    return (m.transmission.loc[sin, sout, tra, com]['cap-lo'],
+    return (m.transmission_dict['cap-lo'][sin, sout, tra, com],
             m.cap_tra[sin, sout, tra, com],
-            m.transmission.loc[sin, sout, tra, com]['cap-up'])
+            m.transmission_dict['cap-up'][sin, sout, tra, com])
 
 
 # transmission capacity from A to B == transmission capacity from B to A
@@ -998,25 +1366,25 @@ def res_transmission_symmetry_rule(m, sin, sout, tra, com):
 def def_storage_state_rule(m, t, sit, sto, com):
     return (m.e_sto_con[t, sit, sto, com] ==
             m.e_sto_con[t-1, sit, sto, com] *
-            (1 - m.storage.loc[sit, sto, com]['discharge']) +
+            (1 - m.storage_dict['discharge'][sit, sto, com]) +
             m.e_sto_in[t, sit, sto, com] *
-            m.storage.loc[sit, sto, com]['eff-in'] * m.dt -
+            m.storage_dict['eff-in'][sit, sto, com] * m.dt -
             m.e_sto_out[t, sit, sto, com] /
-            m.storage.loc[sit, sto, com]['eff-out'] * m.dt)
+            m.storage_dict['eff-out'][sit, sto, com] * m.dt)
 
 
 # storage power == new storage power + existing storage power
 def def_storage_power_rule(m, sit, sto, com):
     return (m.cap_sto_p[sit, sto, com] ==
             m.cap_sto_p_new[sit, sto, com] +
-            m.storage.loc[sit, sto, com]['inst-cap-p'])
+            m.storage_dict['inst-cap-p'][sit, sto, com])
 
 
 # storage capacity == new storage capacity + existing storage capacity
 def def_storage_capacity_rule(m, sit, sto, com):
     return (m.cap_sto_c[sit, sto, com] ==
             m.cap_sto_c_new[sit, sto, com] +
-            m.storage.loc[sit, sto, com]['inst-cap-c'])
+            m.storage_dict['inst-cap-c'][sit, sto, com])
 
 
 # storage input <= storage power
@@ -1030,56 +1398,121 @@ def res_storage_output_by_power_rule(m, t, sit, sto, co):
 
 
 # storage content <= storage capacity
+# (for typical periods, cf. res_storage_inter_by_capacity_rule)
 def res_storage_state_by_capacity_rule(m, t, sit, sto, com):
+    if not m.periods.empty:
+        return pyomo.Constraint.Skip
     return m.e_sto_con[t, sit, sto, com] <= m.cap_sto_c[sit, sto, com]
 
 
 # lower bound <= storage power <= upper bound
 def res_storage_power_rule(m, sit, sto, com):
-    return (m.storage.loc[sit, sto, com]['cap-lo-p'],
+    return (m.storage_dict['cap-lo-p'][sit, sto, com],
             m.cap_sto_p[sit, sto, com],
-            m.storage.loc[sit, sto, com]['cap-up-p'])
+            m.storage_dict['cap-up-p'][sit, sto, com])
 
 
 # lower bound <= storage capacity <= upper bound
 def res_storage_capacity_rule(m, sit, sto, com):
-    return (m.storage.loc[sit, sto, com]['cap-lo-c'],
+    return (m.storage_dict['cap-lo-c'][sit, sto, com],
             m.cap_sto_c[sit, sto, com],
-            m.storage.loc[sit, sto, com]['cap-up-c'])
+            m.storage_dict['cap-up-c'][sit, sto, com])
 
 
 # initialization of storage content in first timestep t[1]
 # forced minimun  storage content in final timestep t[len(m.t)]
 # content[t=1] == storage capacity * fraction <= content[t=final]
+# (for typical periods, cf. res_initial_and_final_storage_inter_rule)
 def res_initial_and_final_storage_state_rule(m, t, sit, sto, com):
     if t == m.t[1]:  # first timestep (Pyomo uses 1-based indexing)
         return (m.e_sto_con[t, sit, sto, com] ==
                 m.cap_sto_c[sit, sto, com] *
-                m.storage.loc[sit, sto, com]['init'])
-    elif t == m.t[len(m.t)]:  # last timestep
+                m.storage_dict['init'][sit, sto, com])
+    else:  # last timestep
         return (m.e_sto_con[t, sit, sto, com] >=
                 m.cap_sto_c[sit, sto, com] *
-                m.storage.loc[sit, sto, com]['init'])
+                m.storage_dict['init'][sit, sto, com])
+
+
+# storage linking between typical periods: the storage content of timestep
+# t in original period p is e_sto_con_inter[p] + e_sto_con[t], with t in the
+# typical period of p; e_sto_con is relative to the start of that period
+
+# content[p+1] == content[p] * (1-discharge)^length + change in period p
+def def_storage_inter_state_rule(m, p, sit, sto, com):
+    if p == m.period[len(m.period)]:  # last period
+        return pyomo.Constraint.Skip
+    period = m.period_timesteps[m.period_dict['typical'][p]]
+    return (m.e_sto_con_inter[p + 1, sit, sto, com] ==
+            m.e_sto_con_inter[p, sit, sto, com] *
+            (1 - m.storage_dict['discharge'][sit, sto, com]) **
+            len(period) +
+            m.e_sto_con[period[-1], sit, sto, com])
+
+
+# relative storage content at initialisation timestep of period == 0
+def res_storage_intra_start_rule(m, k, sit, sto, com):
+    return m.e_sto_con[m.period_timesteps[k][0] - 1, sit, sto, com] == 0
+
+
+# relative storage content <= maximum of typical period
+def res_storage_intra_max_rule(m, k, t, sit, sto, com):
+    return (m.e_sto_con[t, sit, sto, com] <=
+            m.e_sto_con_max[k, sit, sto, com])
+
+
+# relative storage content >= minimum of typical period
+def res_storage_intra_min_rule(m, k, t, sit, sto, com):
+    return (m.e_sto_con[t, sit, sto, com] >=
+            m.e_sto_con_min[k, sit, sto, com])
+
+
+# content[p] + maximum relative content in p <= storage capacity
+# (discharge within a period is neglected here and below)
+def res_storage_inter_by_capacity_rule(m, p, sit, sto, com):
+    k = m.period_dict['typical'][p]
+    return (m.e_sto_con_inter[p, sit, sto, com] +
+            m.e_sto_con_max[k, sit, sto, com] <=
+            m.cap_sto_c[sit, sto, com])
+
+
+# content[p] + minimum relative content in p >= 0
+def res_storage_inter_positive_rule(m, p, sit, sto, com):
+    k = m.period_dict['typical'][p]
+    return (m.e_sto_con_inter[p, sit, sto, com] +
+            m.e_sto_con_min[k, sit, sto, com] >= 0)
+
+
+# content[p=first] == storage capacity * fraction <= content[p=last+1]
+def res_initial_and_final_storage_inter_rule(m, p, sit, sto, com):
+    if p == m.period[1]:  # first period
+        return (m.e_sto_con_inter[p, sit, sto, com] ==
+                m.cap_sto_c[sit, sto, com] *
+                m.storage_dict['init'][sit, sto, com])
+    elif p == m.period[len(m.period)]:  # last period
+        period = m.period_timesteps[m.period_dict['typical'][p]]
+        return (m.e_sto_con_inter[p, sit, sto, com] *
+                (1 - m.storage_dict['discharge'][sit, sto, com]) **
+                len(period) +
+                m.e_sto_con[period[-1], sit, sto, com] >=
+                m.cap_sto_c[sit, sto, com] *
+                m.storage_dict['init'][sit, sto, com])
     else:
         return pyomo.Constraint.Skip
 
 
 # total CO2 output <= Global CO2 limit
 def res_global_co2_limit_rule(m):
-    if math.isinf(m.global_prop.loc['CO2 limit', 'value']):
-        return pyomo.Constraint.Skip
-    elif m.global_prop.loc['CO2 limit', 'value'] > 0:
+    if has_co2_limit(pyomo.value(m.co2_limit)):
         co2_output_sum = 0
         for tm in m.tm:
             for sit in m.sit:
                 # minus because negative commodity_balance represents creation
                 # of that commodity.
+                # scaling to annual output (cf. definition of m.weight)
                 co2_output_sum += (- commodity_balance(m, tm, sit, 'CO2') *
-                                   m.dt)
-
-        # scaling to annual output (cf. definition of m.weight)
-        co2_output_sum *= m.weight
-        return (co2_output_sum <= m.global_prop.loc['CO2 limit', 'value'])
+                                   m.dt * m.weight[tm])
+        return (co2_output_sum <= m.co2_limit)
     else:
         return pyomo.Constraint.Skip
 
@@ -1106,91 +1539,90 @@ def def_costs_rule(m, cost_type):
     if cost_type == 'Invest':
         return m.costs[cost_type] == \
             sum(m.cap_pro_new[p] *
-                m.process.loc[p]['inv-cost'] *
-                m.process.loc[p]['annuity-factor']
+                m.process_dict['inv-cost'][p] *
+                m.process_dict['annuity-factor'][p]
                 for p in m.pro_tuples) + \
-            sum(m.cap_tra_new[t] *
-                m.transmission.loc[t]['inv-cost'] *
-                m.transmission.loc[t]['annuity-factor']
+            sum(m.cap_tra_new[m.tra_corridor[t]] *
+                m.transmission_dict['inv-cost'][t] *
+                m.transmission_dict['annuity-factor'][t]
                 for t in m.tra_tuples) + \
             sum(m.cap_sto_p_new[s] *
-                m.storage.loc[s]['inv-cost-p'] *
-                m.storage.loc[s]['annuity-factor'] +
+                m.storage_dict['inv-cost-p'][s] *
+                m.storage_dict['annuity-factor'][s] +
                 m.cap_sto_c_new[s] *
-                m.storage.loc[s]['inv-cost-c'] *
-                m.storage.loc[s]['annuity-factor']
+                m.storage_dict['inv-cost-c'][s] *
+                m.storage_dict['annuity-factor'][s]
                 for s in m.sto_tuples)
 
     elif cost_type == 'Fixed':
         return m.costs[cost_type] == \
-            sum(m.cap_pro[p] * m.process.loc[p]['fix-cost']
+            sum(m.cap_pro[p] * m.process_dict['fix-cost'][p]
                 for p in m.pro_tuples) + \
-            sum(m.cap_tra[t] * m.transmission.loc[t]['fix-cost']
+            sum(m.cap_tra[m.tra_corridor[t]] *
+                m.transmission_dict['fix-cost'][t]
                 for t in m.tra_tuples) + \
-            sum(m.cap_sto_p[s] * m.storage.loc[s]['fix-cost-p'] +
-                m.cap_sto_c[s] * m.storage.loc[s]['fix-cost-c']
+            sum(m.cap_sto_p[s] * m.storage_dict['fix-cost-p'][s] +
+                m.cap_sto_c[s] * m.storage_dict['fix-cost-c'][s]
                 for s in m.sto_tuples)
 
     elif cost_type == 'Variable':
         return m.costs[cost_type] == \
-            sum(m.tau_pro[(tm,) + p] * m.dt * m.weight *
-                m.process.loc[p]['var-cost']
+            sum(m.tau_pro[(tm,) + p] * m.dt * m.weight[tm] *
+                m.process_dict['var-cost'][p]
                 for tm in m.tm
                 for p in m.pro_tuples) + \
-            sum(m.e_tra_in[(tm,) + t] * m.dt * m.weight *
-                m.transmission.loc[t]['var-cost']
+            sum(m.e_tra_in[(tm,) + t] * m.dt * m.weight[tm] *
+                m.transmission_dict['var-cost'][t]
                 for tm in m.tm
                 for t in m.tra_tuples) + \
-            sum(m.e_sto_con[(tm,) + s] * m.weight *
-                m.storage.loc[s]['var-cost-c'] +
-                m.dt * m.weight *
+            sum(m.e_sto_con[(tm,) + s] * m.weight[tm] *
+                m.storage_dict['var-cost-c'][s] +
+                m.dt * m.weight[tm] *
                 (m.e_sto_in[(tm,) + s] + m.e_sto_out[(tm,) + s]) *
-                m.storage.loc[s]['var-cost-p']
+                m.storage_dict['var-cost-p'][s]
                 for tm in m.tm
+                for s in m.sto_tuples) + \
+            sum(m.e_sto_con_inter[(p,) + s] * m.period_weight[p] *
+                m.storage_dict['var-cost-c'][s]
+                for p in m.period
                 for s in m.sto_tuples)
 
     elif cost_type == 'Fuel':
         return m.costs[cost_type] == sum(
-            m.e_co_stock[(tm,) + c] * m.dt * m.weight *
-            m.commodity.loc[c]['price']
-            for tm in m.tm for c in m.com_tuples
-            if c[1] in m.com_stock)
+            m.e_co_stock[(tm,) + c] * m.dt * m.weight[tm] *
+            m.commodity_dict['price'][c]
+            for tm in m.tm for c in m.com_stock_tuples)
 
     elif cost_type == 'Revenue':
-        sell_tuples = commodity_subset(m.com_tuples, m.com_sell)
-
         return m.costs[cost_type] == -sum(
-            m.e_co_sell[(tm,) + c] * m.weight * m.dt *
-            m.buy_sell_price.loc[tm][c[1]] *
-            m.commodity.loc[c]['price']
+            m.e_co_sell[(tm,) + c] * m.weight[tm] * m.dt *
+            m.buy_sell_price_dict[c[1]][tm] *
+            m.commodity_dict['price'][c]
             for tm in m.tm
-            for c in sell_tuples)
+            for c in m.com_sell_tuples)
 
     elif cost_type == 'Purchase':
-        buy_tuples = commodity_subset(m.com_tuples, m.com_buy)
-
         return m.costs[cost_type] == sum(
-            m.e_co_buy[(tm,) + c] * m.weight * m.dt *
-            m.buy_sell_price.loc[tm][c[1]] *
-            m.commodity.loc[c]['price']
+            m.e_co_buy[(tm,) + c] * m.weight[tm] * m.dt *
+            m.buy_sell_price_dict[c[1]][tm] *
+            m.commodity_dict['price'][c]
             for tm in m.tm
-            for c in buy_tuples)
+            for c in m.com_buy_tuples)
 
     elif cost_type == 'Startup':
         return m.costs[cost_type] == sum(
-            m.startup_pro[(tm,) + p] * m.weight * m.dt *
-            m.process.loc[p]['startup-cost']
+            m.startup_pro[(tm,) + p] * m.weight[tm] * m.dt *
+            m.process_dict['startup-cost'][p]
             for tm in m.tm
             for p in m.pro_partial_tuples)
 
     elif cost_type == 'Environmental':
         return m.costs[cost_type] == sum(
             - commodity_balance(m, tm, sit, com) *
-            m.weight * m.dt *
-            m.commodity.loc[sit, com, com_type]['price']
+            m.weight[tm] * m.dt *
+            m.commodity_dict['price'][sit, com, com_type]
             for tm in m.tm
-            for sit, com, com_type in m.com_tuples
-            if com in m.com_env)
+            for sit, com, com_type in m.com_env_tuples)
 
     else:
         raise NotImplementedError("Unknown cost type.")
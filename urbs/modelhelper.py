@@ -1,3 +1,5 @@
+import math
+import numpy as np
 import pandas as pd
 
 
@@ -31,6 +33,9 @@ def commodity_balance(m, tm, sit, com):
     (from process/storage/transmission, counts negative) power. Used as helper
     function in create_model for constraints on demand and stock commodities.
 
+    Only the terms listed in m.com_balance_index (cf. function
+    commodity_balance_index) for the given site and commodity are visited.
+
     Args:
         m: the model object
         tm: the timestep
@@ -41,110 +46,148 @@ def commodity_balance(m, tm, sit, com):
         balance: net value of consumed (positive) or provided (negative) power
 
     """
-    balance = (sum(m.e_pro_in[(tm, site, process, com)]
+    try:
+        terms = m.com_balance_index[sit, com]
+    except KeyError:
+        # commodity is neither produced, consumed, transported nor stored
+        return 0
+
+    balance = (sum(m.e_pro_in[(tm,) + pro]
                    # usage as input for process increases balance
-                   for site, process in m.pro_tuples
-                   if site == sit and (process, com) in m.r_in_dict)
-               - sum(m.e_pro_out[(tm, site, process, com)]
+                   for pro in terms['pro_in'])
+               - sum(m.e_pro_out[(tm,) + pro]
                      # output from processes decreases balance
-                     for site, process in m.pro_tuples
-                     if site == sit and (process, com) in m.r_out_dict)
-               + sum(m.e_tra_in[(tm, site_in, site_out, transmission, com)]
+                     for pro in terms['pro_out'])
+               + sum(m.e_tra_in[(tm,) + tra]
                      # exports increase balance
-                     for site_in, site_out, transmission, commodity
-                     in m.tra_tuples
-                     if site_in == sit and commodity == com)
-               - sum(m.e_tra_out[(tm, site_in, site_out, transmission, com)]
+                     for tra in terms['tra_in'])
+               - sum(m.e_tra_out[(tm,) + tra]
                      # imports decrease balance
-                     for site_in, site_out, transmission, commodity
-                     in m.tra_tuples
-                     if site_out == sit and commodity == com)
-               + sum(m.e_sto_in[(tm, site, storage, com)] -
-                     m.e_sto_out[(tm, site, storage, com)]
+                     for tra in terms['tra_out'])
+               + sum(m.e_sto_in[(tm,) + sto] - m.e_sto_out[(tm,) + sto]
                      # usage as input for storage increases consumption
                      # output from storage decreases consumption
-                     for site, storage, commodity in m.sto_tuples
-                     if site == sit and commodity == com))
+                     for sto in terms['sto']))
     return balance
 
 
-def dsm_down_time_tuples(time, sit_com_tuple, m):
-    """ Dictionary for the two time instances of DSM_down
+def commodity_balance_index(m):
+    """Index all terms of the commodity balance by (site, commodity).
 
+    Scans the process, transmission and storage tuples once, so that
+    commodity_balance only has to visit the terms that actually apply to a
+    given site and commodity instead of filtering all tuples on every call.
 
     Args:
-        time: list with time indices
-        sit_com_tuple: a list of (site, commodity) tuples
-        m: model instance
+        m: the model object, with pro_tuples, tra_tuples, sto_tuples,
+           r_in_dict and r_out_dict already defined
 
     Returns:
-        A list of possible time tuples depending on site and commodity
+        a dict {(site, commodity): terms}, where terms is a dict with the keys
+        'pro_in', 'pro_out', 'tra_in', 'tra_out' and 'sto'. Each holds a list
+        of variable index tuples (without timestep), e.g. terms['pro_in']
+        contains (site, process, commodity) tuples of e_pro_in
     """
-    if m.dsm.empty:
-        return []
+    index = {}
 
-    delay = m.dsm['delay']
-    ub = max(time)
-    lb = min(time)
-    time_list = []
+    def terms(sit, com):
+        if (sit, com) not in index:
+            index[sit, com] = {'pro_in': [], 'pro_out': [],
+                               'tra_in': [], 'tra_out': [], 'sto': []}
+        return index[sit, com]
 
-    for (site, commodity) in sit_com_tuple:
-        for step1 in time:
-            for step2 in range(step1 - delay[site, commodity],
-                               step1 + delay[site, commodity] + 1):
-                if lb <= step2 <= ub:
-                    time_list.append((step1, step2, site, commodity))
+    # commodities per process, derived from the input/output ratios
+    pro_inputs = {}
+    pro_outputs = {}
+    for (pro, com) in m.r_in_dict:
+        pro_inputs.setdefault(pro, []).append(com)
+    for (pro, com) in m.r_out_dict:
+        pro_outputs.setdefault(pro, []).append(com)
 
-    return time_list
+    for (sit, pro) in m.pro_tuples:
+        for com in pro_inputs.get(pro, []):
+            terms(sit, com)['pro_in'].append((sit, pro, com))
+        for com in pro_outputs.get(pro, []):
+            terms(sit, com)['pro_out'].append((sit, pro, com))
 
+    for (sin, sout, tra, com) in m.tra_tuples:
+        terms(sin, com)['tra_in'].append((sin, sout, tra, com))
+        terms(sout, com)['tra_out'].append((sin, sout, tra, com))
 
-def dsm_time_tuples(timestep, time, delay):
-    """ Tuples for the two time instances of DSM_down
+    for (sit, sto, com) in m.sto_tuples:
+        terms(sit, com)['sto'].append((sit, sto, com))
 
-    Args:
-        timestep: current timestep
-        time: list with time indices
-        delay: allowed dsm delay in particular site and commodity
+    return index
 
-    Returns:
-        A list of possible time tuples of a current time step in a specific
-        site and commodity
-    """
 
-    ub = max(time)
-    lb = min(time)
+def dsm_down_time_tuples(period_timesteps, sit_com_tuple, delay_windows):
+    """ Dictionary for the two time instances of DSM_down
 
-    time_list = list()
 
-    for step in range(timestep - delay, timestep + delay + 1):
-        if step >= lb and step <= ub:
-            time_list.append(step)
+    Args:
+        period_timesteps: list of modelled timestep lists, one per period
+        sit_com_tuple: a list of (site, commodity) tuples
+        delay_windows: dict {(site, commodity): window table}, as returned
+                       by dsm_windows for the DSM delay
+
+    Returns:
+        A list of possible time tuples depending on site and commodity
+    """
+    return [(step1, step2, site, commodity)
+            for period in period_timesteps
+            for (site, commodity) in sit_com_tuple
+            for step1 in period
+            for step2 in delay_windows[site, commodity][step1]]
 
-    return time_list
 
+def dsm_windows(period_timesteps, values, first, last):
+    """ Time windows of DSM constraints for all (site, commodity) tuples
 
-def dsm_recovery(timestep, time, recov):
-    """ Time frame for the allowed time indices in case of recovery
+    The windows only depend on the delay or recovery value, so one window
+    table is built per distinct value and shared by all (site, commodity)
+    tuples with that value.
 
     Args:
-        timestep: current timestep
-        time: list with time indices
-        recov: allowed dsm recovery in particular site and commodity
+        period_timesteps: list of modelled timestep lists, one per period
+        values: dict {(site, commodity): delay or recovery time}
+        first: function of a value returning the window start relative to
+               the current timestep, e.g. lambda delay: -delay
+        last: same for the window end, e.g. lambda delay: delay
 
     Returns:
-        A list of possible time indices which are within the modelled time
-        area
+        a dict {(site, commodity): {timestep: list of timesteps}}
     """
+    tables = {}
+    windows = {}
+    for sit_com, value in values.items():
+        value = int(value)
+        if value not in tables:
+            tables[value] = window_table(period_timesteps,
+                                         first(value), last(value))
+        windows[sit_com] = tables[value]
+    return windows
 
-    ub = max(time)
 
-    time_list = list()
+def window_table(period_timesteps, first, last):
+    """ Window [t + first, t + last] of each timestep t, clipped to its period
 
-    for step in range(timestep, timestep+recov):
-        if step <= ub:
-            time_list.append(step)
+    Args:
+        period_timesteps: list of modelled timestep lists, one per period
+        first: window start, relative to the current timestep
+        last: window end, relative to the current timestep
 
-    return time_list
+    Returns:
+        a dict {timestep: list of timesteps within the modelled time area}
+    """
+    offsets = np.arange(first, last + 1)
+    table = {}
+    for period in period_timesteps:
+        period = np.asarray(period)
+        windows = period[:, np.newaxis] + offsets
+        inside = (windows >= period.min()) & (windows <= period.max())
+        for t, window, valid in zip(period.tolist(), windows, inside):
+            table[t] = window[valid].tolist()
+    return table
 
 
 def commodity_subset(com_tuples, type_name):
@@ -200,3 +243,134 @@ def search_sell_buy_tuple(instance, sit_in, pro_in, coin):
         if not(sell_in.isdisjoint(buy_out)):
             return sell_pro
     return None
+
+
+def parameter_dict(df, columns=None):
+    """Convert a DataFrame into a dict of dicts for fast lookups.
+
+    Reading single values with chained pandas calls like
+    df.loc[index][column] creates a temporary Series on every call. Within
+    constraint rules, which are called once per index tuple, a plain dict
+    lookup like parameter_dict(df)[column][index] is much cheaper.
+
+    Args:
+        df: a DataFrame, e.g. m.process or m.demand
+        columns: (optional) list of keys to use instead of df.columns, e.g.
+                 to replace one-level MultiIndex column tuples by strings
+
+    Returns:
+        a dict {column: {index: value}}
+
+    Example:
+        >>> df = pd.DataFrame({'eff': [0.9, 0.8]}, index=['a', 'b'])
+        >>> parameter_dict(df)['eff']['b']
+        0.8
+    """
+    if columns is None:
+        columns = df.columns
+    index = df.index.tolist()
+    return {column: dict(zip(index, df.iloc[:, k].tolist()))
+            for k, column in enumerate(columns)}
+
+
+def mutable_parameter_name(table, attribute):
+    """Return the model component name of a mutable parameter.
+
+    Args:
+        table: input table name, e.g. 'process'
+        attribute: column name within that table, e.g. 'inv-cost'
+
+    Returns:
+        Param name, e.g. 'process_inv_cost'
+    """
+    return '{}_{}'.format(table, attribute.replace('-', '_'))
+
+
+def mutable_parameter_lookup(param, values):
+    """Return the lookup table entries of a mutable parameter.
+
+    Finite values are replaced by the entries of the mutable Param, so that
+    update_model can change them. Infinite values (e.g. a cap-up or max of
+    inf) stay plain floats, so that Pyomo drops the corresponding side of a
+    constraint instead of writing a row with an infinite Param bound.
+
+    Args:
+        param: a mutable Param, initialized with values
+        values: dict {index: value}, as returned by parameter_dict
+
+    Returns:
+        dict {index: Param entry or infinite value}
+    """
+    return {index: value if math.isinf(value) else param[index]
+            for index, value in values.items()}
+
+
+def has_co2_limit(co2_limit):
+    """Return True if the global CO2 limit constraint is to be created.
+
+    Args:
+        co2_limit: value of the global property 'CO2 limit'
+
+    Returns:
+        True if co2_limit is a finite, positive number
+    """
+    return not math.isinf(co2_limit) and co2_limit > 0
+
+
+def timestep_weights(period_timesteps, occurrences, dt):
+    """Scaling factors from modelled timesteps to a full year.
+
+    Args:
+        period_timesteps: list of modelled timestep lists, one per period
+        occurrences: dict {period number: number of represented periods}
+        dt: timestep duration in hours
+
+    Returns:
+        a dict {timestep: weight}
+    """
+    hours = dt * sum(occurrences[k] * len(period)
+                     for k, period in enumerate(period_timesteps))
+    return {t: float(8760) * occurrences[k] / hours
+            for k, period in enumerate(period_timesteps)
+            for t in period}
+
+
+def transmission_corridors(transmission):
+    """Group transmission tuples into undirected corridors.
+
+    Each (site pair, transmission, commodity) corridor is represented by
+    the direction listed first in the transmission table. As both directions
+    share one capacity, they must agree on installed capacity and capacity
+    bounds.
+
+    Args:
+        transmission: transmission input DataFrame
+
+    Returns:
+        (corridors, corridor): list of corridor tuples and a dict mapping
+        each transmission tuple (of both directions) to its corridor tuple
+
+    Raises:
+        ValueError: if a transmission has no reverse direction, or both
+            directions differ in inst-cap, cap-lo or cap-up
+    """
+    corridors = []
+    corridor = {}
+    tra_tuples = set(transmission.index)
+    for (sin, sout, tra, com) in transmission.index:
+        reverse = (sout, sin, tra, com)
+        if reverse not in tra_tuples:
+            raise ValueError("Transmission {} has no reverse direction"
+                             .format((sin, sout, tra, com)))
+        if reverse in corridor:
+            corridor[sin, sout, tra, com] = corridor[reverse]
+            continue
+        for attribute in ['inst-cap', 'cap-lo', 'cap-up']:
+            if (transmission.loc[(sin, sout, tra, com), attribute] !=
+                    transmission.loc[reverse, attribute]):
+                raise ValueError("Transmission {} differs from its reverse "
+                                 "direction in {}".format(
+                                     (sin, sout, tra, com), attribute))
+        corridors.append((sin, sout, tra, com))
+        corridor[sin, sout, tra, com] = (sin, sout, tra, com)
+    return corridors, corridor
@@ -1,6 +1,7 @@
 import pandas as pd
 from .input import get_input
 from .pyomoio import get_entity, get_entities
+from .tsa import expand_periods, expand_timeseries
 from .util import is_string
 
 
@@ -37,6 +38,11 @@ def get_constants(instance):
     csto = get_entities(instance, ['cap_sto_c', 'cap_sto_c_new',
                                    'cap_sto_p', 'cap_sto_p_new'])
 
+    # entries removed by prune_data have zero capacity
+    cpro = add_pruned(instance, cpro, 'process')
+    ctra = add_pruned(instance, ctra, 'transmission')
+    csto = add_pruned(instance, csto, 'storage')
+
     # better labels and index names and return sorted
     if not cpro.empty:
         cpro.index.names = ['Site', 'Process']
@@ -53,6 +59,28 @@ def get_constants(instance):
     return costs, cpro, ctra, csto
 
 
+def add_pruned(instance, df, table):
+    """Append zero rows for the input entries removed by prune_data.
+
+    Args:
+        instance: a urbs model instance
+        df: DataFrame indexed like the input table
+        table: input table name, e.g. 'process'
+
+    Returns:
+        df, extended by one row of zeros per pruned entry
+    """
+    try:
+        pruned = get_input(instance, 'pruned_' + table)
+    except ValueError:
+        return df
+    if pruned.empty or df.empty:
+        return df
+    zeros = pd.DataFrame(0.0, index=pruned.index, columns=df.columns)
+    zeros.index.names = df.index.names
+    return pd.concat([df, zeros])
+
+
 def get_timeseries(instance, com, sites, timesteps=None):
     """Return DataFrames of all timeseries referring to given commodity
 
@@ -65,6 +93,7 @@ def get_timeseries(instance, com, sites, timesteps=None):
         com: a commodity name
         sites: a site name or list of site names
         timesteps: optional list of timesteps, default: all modelled timesteps
+            (for typical periods: all original timesteps)
 
     Returns:
         a tuple of (created, consumed, storage, imported, exported, dsm) with
@@ -77,7 +106,13 @@ def get_timeseries(instance, com, sites, timesteps=None):
         - exported: timeseries of commodity export
         - dsm: timeseries of demand-side management
     """
-    if timesteps is None:
+    periods = get_periods(instance)
+    if periods is not None:
+        # typical periods: derive timeseries for all modelled timesteps,
+        # then expand them to the requested original timesteps (at the end)
+        original_timesteps = timesteps
+        timesteps = sorted(get_entity(instance, 'tm').index)
+    elif timesteps is None:
         # default to all simulated timesteps
         timesteps = sorted(get_entity(instance, 'tm').index)
     else:
@@ -102,8 +137,8 @@ def get_timeseries(instance, com, sites, timesteps=None):
 
     # STOCK
     eco = get_entity(instance, 'e_co_stock')
-    eco = eco.xs([com, 'Stock'], level=['com', 'com_type'])
     try:
+        eco = eco.xs([com, 'Stock'], level=['com', 'com_type'])
         stock = eco.unstack()[sites].sum(axis=1)
     except KeyError:
         stock = pd.Series(0, index=timesteps)
@@ -111,8 +146,8 @@ def get_timeseries(instance, com, sites, timesteps=None):
 
     # PROCESS
     created = get_entity(instance, 'e_pro_out')
-    created = created.xs(com, level='com').loc[timesteps]
     try:
+        created = created.xs(com, level='com').loc[timesteps]
         created = created.unstack(level='sit')[sites].fillna(0).sum(axis=1)
         created = created.unstack(level='pro')
         created = drop_all_zero_columns(created)
@@ -120,8 +155,8 @@ def get_timeseries(instance, com, sites, timesteps=None):
         created = pd.DataFrame(index=timesteps)
 
     consumed = get_entity(instance, 'e_pro_in')
-    consumed = consumed.xs(com, level='com').loc[timesteps]
     try:
+        consumed = consumed.xs(com, level='com').loc[timesteps]
         consumed = consumed.unstack(level='sit')[sites].fillna(0).sum(axis=1)
         consumed = consumed.unstack(level='pro')
         consumed = drop_all_zero_columns(consumed)
@@ -221,9 +256,64 @@ def get_timeseries(instance, com, sites, timesteps=None):
     created = created.join(stock)  # show stock as created
     consumed = consumed.join(shifted.rename('Demand'))
 
+    if periods is not None:
+        timeseries = [expand_timeseries(df, periods)
+                      for df in (created, consumed, stored, imported,
+                                 exported, dsm)]
+        created, consumed, stored, imported, exported, dsm = timeseries
+
+        # absolute storage level = content at start of original period +
+        # content relative to the start of its typical period
+        inter = get_entity(instance, 'e_sto_con_inter')
+        try:
+            inter = inter.xs(com, level='com').unstack(level='sit')[sites]
+            inter = inter.fillna(0).sum(axis=1).groupby(level='period').sum()
+            stored['Level'] += expand_periods(inter, periods)
+        except KeyError:
+            pass
+
+        if original_timesteps is not None:
+            timeseries = [df.loc[sorted(original_timesteps)]
+                          for df in (created, consumed, stored, imported,
+                                     exported, dsm)]
+            created, consumed, stored, imported, exported, dsm = timeseries
+
     return created, consumed, stored, imported, exported, dsm
 
 
+def get_periods(instance):
+    """Return the typical period assignment of a urbs model instance.
+
+    Args:
+        instance: a urbs model instance
+
+    Returns:
+        the input DataFrame 'periods' (cf. aggregate_timeseries), or None if
+        the instance does not model typical periods
+    """
+    try:
+        periods = get_input(instance, 'periods')
+    except ValueError:
+        return None
+    return None if periods.empty else periods
+
+
+def get_timesteps(instance):
+    """Return all timesteps for which get_timeseries returns results.
+
+    Args:
+        instance: a urbs model instance
+
+    Returns:
+        sorted list of modelled timesteps or, for typical periods, of the
+        original timesteps they represent
+    """
+    periods = get_periods(instance)
+    if periods is None:
+        return sorted(get_entity(instance, 'tm').index)
+    return sorted(expand_periods(periods['typical'], periods).index)
+
+
 def drop_all_zero_columns(df):
     """ Drop columns from DataFrame if they contain only zeros.
 
@@ -5,7 +5,7 @@ import pandas as pd
 from random import random
 from .data import COLORS
 from .input import get_input
-from .output import get_constants, get_timeseries
+from .output import get_constants, get_timeseries, get_timesteps
 from .util import is_string
 
 
@@ -85,7 +85,7 @@ def plot(prob, com, sit, timesteps=None,
 
     if timesteps is None:
         # default to all simulated timesteps
-        timesteps = sorted(get_entity(prob, 'tm').index)
+        timesteps = get_timesteps(prob)
 
     if is_string(sit):
         # wrap single site in 1-element list for consistent behaviour
@@ -316,7 +316,7 @@ def result_figures(prob, figure_basename, plot_title_prefix=None,
 
     # default to all timesteps if no periods are given
     if periods is None:
-        periods = {'all': sorted(get_entity(prob, 'tm').index)}
+        periods = {'all': get_timesteps(prob)}
 
     # default to PNG and PDF plots if no filetypes are specified
     if extensions is None:
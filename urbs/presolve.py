@@ -0,0 +1,278 @@
+"""Presolve for the sparse matrix backend
+
+Many constraint blocks of urbs are bounds or definitions in disguise:
+
+- rows with a single variable, e.g. res_process_capacity (cap-lo <= cap_pro
+  <= cap-up), res_stock_step or res_dsm_upward, are bounds of that variable;
+- variables with equal lower and upper bound, e.g. capacities with cap-lo
+  == cap-up, are constants;
+- equality rows with two variables, e.g. def_process_capacity (cap_pro ==
+  inst-cap + cap_pro_new) or def_process_input (e_pro_in == r_in *
+  tau_pro), define one variable by the other.
+
+presolve removes them from a MatrixModel in repeated passes, as each pass
+creates new candidates for the next (a fixed capacity turns
+res_storage_input_by_power into a bound of e_sto_in). Bounds are moved to
+the variables, constants to the row bounds, and defined variables are
+substituted in all rows and the objective, their bounds being transferred to
+the defining variable. The reduced linear program is solved instead of the
+original one; postsolve then reconstructs the values of all removed
+variables, so that the solution covers the full model again:
+
+    reduced = presolve(prob)
+    status, x, _ = solve_highs(reduced)
+    x = postsolve(reduced, x)
+
+Duals of removed rows are not reconstructed; solve_matrix therefore skips
+presolve for models created with dual=True.
+
+"""
+import numpy as np
+import scipy.sparse as sp
+
+# relative tolerance for equal bounds and for bound violations
+TOLERANCE = 1e-9
+
+# minimum ratio |coefficient of eliminated variable| / |coefficient of
+# defining variable|, so that substitution does not amplify coefficients
+MIN_PIVOT_RATIO = 1e-3
+
+
+class PresolvedModel(object):
+    """ Reduced linear program of a MatrixModel, as returned by presolve.
+
+    It has the attributes of a finalized MatrixModel that the solver
+    functions of module urbs.matrix use (A, c, col_lb, col_ub, row_lb,
+    row_ub, nrows, ncols, name).
+
+    Attributes:
+        rows, cols: original row and column numbers of the reduced rows and
+                    columns
+        original_ncols: number of columns of the original model
+        steps: list of reductions, in the order applied (cf. postsolve)
+    """
+    def __init__(self, prob):
+        self.name = prob.name
+        self.A = prob.A.tocsr(copy=True)
+        self.c = np.array(prob.c, float)
+        self.col_lb = np.array(prob.col_lb, float)
+        self.col_ub = np.array(prob.col_ub, float)
+        self.row_lb = np.array(prob.row_lb, float)
+        self.row_ub = np.array(prob.row_ub, float)
+        self.rows = np.arange(prob.nrows)
+        self.cols = np.arange(prob.ncols)
+        self.original_ncols = prob.ncols
+        self.steps = []
+
+    @property
+    def nrows(self):
+        return self.A.shape[0]
+
+    @property
+    def ncols(self):
+        return self.A.shape[1]
+
+    def remove_rows(self, remove):
+        """Remove rows (boolean mask)."""
+        keep = ~remove
+        self.A = self.A[keep]
+        self.row_lb = self.row_lb[keep]
+        self.row_ub = self.row_ub[keep]
+        self.rows = self.rows[keep]
+
+    def remove_cols(self, remove):
+        """Remove columns (boolean mask)."""
+        keep = np.flatnonzero(~remove)
+        self.A = self.A[:, keep].tocsr()
+        self.c = self.c[keep]
+        self.col_lb = self.col_lb[keep]
+        self.col_ub = self.col_ub[keep]
+        self.cols = self.cols[keep]
+
+
+def presolve(prob, max_passes=20):
+    """Remove bound rows, fixed variables and definitions from a model.
+
+    Args:
+        prob: a finalized MatrixModel
+        max_passes: maximum number of passes over all reductions
+
+    Returns:
+        a PresolvedModel, or None if the bounds are found contradictory,
+        i.e. the model is infeasible
+    """
+    reduced = PresolvedModel(prob)
+    for _ in range(max_passes):
+        before = reduced.A.shape
+        if not (bound_rows(reduced) and fixed_columns(reduced) and
+                substitute_definitions(reduced)):
+            return None
+        if reduced.A.shape == before:
+            break
+    return reduced
+
+
+def bound_rows(reduced):
+    """Turn rows with at most one variable into bounds of the variable.
+
+    Returns:
+        False if a row or bound turns out infeasible, else True
+    """
+    A = reduced.A
+    nnz = np.diff(A.indptr)
+
+    empty = nnz == 0
+    if (np.any(reduced.row_lb[empty] > TOLERANCE) or
+            np.any(reduced.row_ub[empty] < -TOLERANCE)):
+        return False
+
+    single = np.flatnonzero(nnz == 1)
+    j = A.indices[A.indptr[single]]
+    a = A.data[A.indptr[single]]
+    with np.errstate(invalid='ignore'):
+        lower = np.where(a > 0, reduced.row_lb[single],
+                         reduced.row_ub[single]) / a
+        upper = np.where(a > 0, reduced.row_ub[single],
+                         reduced.row_lb[single]) / a
+    np.maximum.at(reduced.col_lb, j, lower)
+    np.minimum.at(reduced.col_ub, j, upper)
+
+    remove = empty
+    remove[single] = True
+    if remove.any():
+        reduced.remove_rows(remove)
+    return check_bounds(reduced)
+
+
+def fixed_columns(reduced):
+    """Replace variables with equal bounds by their value.
+
+    Returns:
+        True
+    """
+    fixed = reduced.col_lb == reduced.col_ub
+    if not fixed.any():
+        return True
+    values = reduced.col_lb[fixed]
+    shift = reduced.A[:, np.flatnonzero(fixed)].dot(values)
+    reduced.row_lb -= shift
+    reduced.row_ub -= shift
+    reduced.steps.append(('fixed', reduced.cols[fixed], values))
+    reduced.remove_cols(fixed)
+    return True
+
+
+def substitute_definitions(reduced):
+    """Substitute variables defined by equality rows with two variables.
+
+    For row a * x_e + b * x_k == r, x_e = r / a - b / a * x_k is substituted
+    in all other rows and the objective, and the bounds of x_e become
+    bounds of x_k. Of both variables, the one in fewer rows is eliminated.
+    Per pass, a variable is eliminated at most once and not used to define
+    another one.
+
+    Returns:
+        False if the transferred bounds are infeasible, else True
+    """
+    A = reduced.A
+    nnz = np.diff(A.indptr)
+    candidates = np.flatnonzero((nnz == 2) &
+                                (reduced.row_lb == reduced.row_ub))
+    if candidates.size == 0:
+        return True
+    first = A.indptr[candidates]
+    j1, j2 = A.indices[first], A.indices[first + 1]
+    a1, a2 = A.data[first], A.data[first + 1]
+
+    col_nnz = np.bincount(A.indices, minlength=reduced.ncols)
+    swap = col_nnz[j2] < col_nnz[j1]
+    elim = np.where(swap, j2, j1)
+    keep = np.where(swap, j1, j2)
+    a_elim = np.where(swap, a2, a1)
+    a_keep = np.where(swap, a1, a2)
+
+    # stable pivots only; each variable eliminated at most once and not
+    # used to define another variable in the same pass
+    ok = np.abs(a_elim) >= MIN_PIVOT_RATIO * np.abs(a_keep)
+    _, unique = np.unique(elim, return_index=True)
+    once = np.zeros(candidates.size, bool)
+    once[unique] = True
+    ok &= once
+    defining = np.zeros(reduced.ncols, bool)
+    defining[keep[ok]] = True
+    ok &= ~defining[elim]
+    if not ok.any():
+        return True
+    rows = candidates[ok]
+    elim, keep = elim[ok], keep[ok]
+    coef = -a_keep[ok] / a_elim[ok]
+    offset = reduced.row_lb[rows] / a_elim[ok]
+
+    # bounds of x_e = offset + coef * x_k transferred to x_k
+    with np.errstate(invalid='ignore'):
+        lower = np.where(coef > 0, reduced.col_lb[elim] - offset,
+                         reduced.col_ub[elim] - offset) / coef
+        upper = np.where(coef > 0, reduced.col_ub[elim] - offset,
+                         reduced.col_lb[elim] - offset) / coef
+    np.maximum.at(reduced.col_lb, keep, lower)
+    np.minimum.at(reduced.col_ub, keep, upper)
+
+    # substitute in all rows (A * x = A_rest * x + A_e * (offset + M * x))
+    # and in the objective
+    A_elim = A[:, elim]
+    M = sp.csr_matrix((coef, (np.arange(elim.size), keep)),
+                      shape=(elim.size, reduced.ncols))
+    shift = A_elim.dot(offset)
+    reduced.A = (A + A_elim.dot(M)).tocsr()
+    reduced.A.data[np.abs(reduced.A.data) < 1e-12] = 0
+    reduced.A.eliminate_zeros()
+    reduced.row_lb -= shift
+    reduced.row_ub -= shift
+    np.add.at(reduced.c, keep, reduced.c[elim] * coef)
+
+    reduced.steps.append(('substituted', reduced.cols[elim],
+                          reduced.cols[keep], coef, offset))
+    remove_rows = np.zeros(reduced.nrows, bool)
+    remove_rows[rows] = True
+    reduced.remove_rows(remove_rows)
+    remove_cols = np.zeros(reduced.ncols, bool)
+    remove_cols[elim] = True
+    reduced.remove_cols(remove_cols)
+    return check_bounds(reduced)
+
+
+def check_bounds(reduced):
+    """Snap (almost) equal variable bounds; False if any are crossing."""
+    lb, ub = reduced.col_lb, reduced.col_ub
+    with np.errstate(invalid='ignore'):
+        gap = ub - lb
+        scale = np.maximum(1, np.abs(np.where(np.isfinite(lb), lb, 0)))
+    if np.any(gap < -TOLERANCE * scale):
+        return False
+    close = np.isfinite(gap) & (gap <= TOLERANCE * scale)
+    ub[close] = lb[close]
+    return True
+
+
+def postsolve(reduced, x):
+    """Reconstruct the solution of the original model.
+
+    Args:
+        reduced: a PresolvedModel
+        x: solution of the reduced linear program
+
+    Returns:
+        array of values of all columns of the original model
+    """
+    full = np.zeros(reduced.original_ncols)
+    full[reduced.cols] = x
+    # a defining variable may be removed by a later step, so the steps are
+    # undone in reverse order
+    for step in reversed(reduced.steps):
+        if step[0] == 'fixed':
+            _, cols, values = step
+            full[cols] = values
+        else:
+            _, elim, keep, coef, offset = step
+            full[elim] = offset + coef * full[keep]
+    return full
@@ -0,0 +1,105 @@
+"""Pruning of unusable input entries for urbs
+
+Input sheets often list every technology at every site, even where it can
+never be built: processes, storages and transmissions whose installed
+capacity and upper capacity bound are zero, and commodities that no
+remaining process, transmission or storage at a site produces or consumes.
+create_model would still create all their time-indexed variables and
+constraints. prune_data removes them from the input beforehand:
+
+    data = urbs.prune_data(urbs.read_excel('mimo-example.xlsx'))
+    data['pruned']  # number of removed rows per table
+    data['pruned_process']  # the removed processes
+    prob = urbs.create_model(data)
+
+or, equivalently, urbs.create_model(data, prune=True). The removed rows are
+kept as additional input DataFrames 'pruned_commodity', 'pruned_process',
+'pruned_transmission' and 'pruned_storage', so that get_input returns them
+and get_constants (and thus report) lists their capacities as zero.
+
+"""
+import numpy as np
+import pandas as pd
+
+# tables pruned by prune_data
+PRUNED_TABLES = ['commodity', 'process', 'transmission', 'storage']
+
+
+def prune_data(data):
+    """Remove input entries that cannot be used in any solution.
+
+    Removed are
+
+    - processes with inst-cap == cap-up == 0, except processes with Buy or
+      Sell commodities, which are paired by res_sell_buy_symmetry,
+    - transmissions with inst-cap == cap-up == 0,
+    - storages with zero installed capacity and upper bound for both
+      content (c) and power (p); a storage with power but no content can
+      still destroy energy through its losses,
+    - commodities (except Demand commodities) that no remaining process,
+      transmission or storage at their site produces or consumes.
+
+    Data that is pruned already (cf. is_pruned) is returned unchanged.
+
+    Args:
+        data: input data dict, as returned by read_excel
+
+    Returns:
+        a shallow copy of data with the pruned tables replaced by their
+        remaining rows, the removed rows added as 'pruned_<table>' and
+        their number per table as 'pruned'
+    """
+    if is_pruned(data):
+        return data
+    commodity = data['commodity']
+    process = data['process']
+    process_commodity = data['process_commodity']
+    transmission = data['transmission']
+    storage = data['storage']
+
+    types = commodity.index.get_level_values('Type')
+    buy_sell = set(commodity.index.get_level_values('Commodity')[
+        types.isin(['Buy', 'Sell'])])
+    pro_coms = {}
+    for (pro, com, _) in process_commodity.index:
+        pro_coms.setdefault(pro, set()).add(com)
+
+    # boolean masks of the rows to remove, per table
+    remove = {
+        'process': np.array(
+            [not pro_coms.get(pro, set()) & buy_sell
+             for (sit, pro) in process.index], dtype=bool) &
+        (process['inst-cap'] == 0).values &
+        (process['cap-up'] == 0).values,
+        'transmission': ((transmission['inst-cap'] == 0) &
+                         (transmission['cap-up'] == 0)).values,
+        'storage': ((storage['inst-cap-c'] == 0) &
+                    (storage['cap-up-c'] == 0) &
+                    (storage['inst-cap-p'] == 0) &
+                    (storage['cap-up-p'] == 0)).values}
+
+    # (site, commodity) pairs still in use
+    used = set()
+    for (sit, pro) in process.index[~remove['process']]:
+        used.update((sit, com) for com in pro_coms.get(pro, []))
+    for (sin, sout, tra, com) in transmission.index[~remove['transmission']]:
+        used.update([(sin, com), (sout, com)])
+    for (sit, sto, com) in storage.index[~remove['storage']]:
+        used.add((sit, com))
+    remove['commodity'] = np.array(
+        [com_type != 'Demand' and (sit, com) not in used
+         for (sit, com, com_type) in commodity.index], dtype=bool)
+
+    data = dict(data)
+    for name in PRUNED_TABLES:
+        data['pruned_' + name] = data[name][remove[name]]
+        data[name] = data[name][~remove[name]]
+    data['pruned'] = pd.DataFrame(
+        {'removed': [int(remove[name].sum()) for name in PRUNED_TABLES]},
+        index=pd.Index(PRUNED_TABLES, name='table'))
+    return data
+
+
+def is_pruned(data):
+    """Return True if data has been pruned by prune_data."""
+    return 'pruned' in data
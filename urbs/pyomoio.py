@@ -38,15 +38,16 @@ def get_entity(instance, name):
             name = name+'_'
 
     elif isinstance(entity, pyomo.Param):
+        # pyomo.value also evaluates entries of mutable Params
         if entity.dim() > 1:
             results = pd.DataFrame(
-                [v[0]+(v[1],) for v in entity.iteritems()])
+                [v[0]+(pyomo.value(v[1]),) for v in entity.iteritems()])
         elif entity.dim() == 1:
             results = pd.DataFrame(
-                [(v[0], v[1]) for v in entity.iteritems()])
+                [(v[0], pyomo.value(v[1])) for v in entity.iteritems()])
         else:
             results = pd.DataFrame(
-                [(v[0], v[1].value) for v in entity.iteritems()])
+                [(v[0], pyomo.value(v[1])) for v in entity.iteritems()])
             labels = ['None']
 
     elif isinstance(entity, pyomo.Constraint):
@@ -0,0 +1,268 @@
+"""Rolling horizon solve mode for urbs
+
+For dispatch problems with fixed capacities, the horizon can be split into
+consecutive windows that are solved one after another. Each window overlaps
+with the next one; only its first timesteps are kept, the overlap is
+optimised again as part of the next window. The state at the last kept
+timestep initialises the next window. Results are appended to a HDF5 file
+window by window, so that peak memory depends on the window size only:
+
+    data = urbs.read_excel('mimo-example.xlsx')
+    urbs.rolling_horizon(data, range(0, 8761), window=168, overlap=24,
+                         filename='dispatch.h5', capacities=prob)
+    result = urbs.load('dispatch.h5')
+    urbs.report(result, 'dispatch.xlsx')
+
+"""
+import copy
+import pandas as pd
+import pyomo.core as pyomo
+from .model import create_model
+from .pyomoio import get_entity, list_entities
+from .solver import solve, solver_factory
+
+# (capacity variable, input table, installed capacity, lower/upper bound)
+CAPACITIES = [
+    ('cap_pro', 'process', 'inst-cap', 'cap-lo', 'cap-up'),
+    ('cap_tra', 'transmission', 'inst-cap', 'cap-lo', 'cap-up'),
+    ('cap_sto_c', 'storage', 'inst-cap-c', 'cap-lo-c', 'cap-up-c'),
+    ('cap_sto_p', 'storage', 'inst-cap-p', 'cap-lo-p', 'cap-up-p')]
+
+
+def fix_capacities(data, prob=None):
+    """Return a copy of the input with capacity expansion switched off.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        prob: (optional) solved urbs model instance whose total capacities
+              become the installed capacities; default: keep the installed
+              capacities of data
+
+    Returns:
+        a copy of data in which installed capacity, lower and upper bound
+        of all processes, transmissions and storages are equal
+    """
+    data = copy.deepcopy(data)
+    for var, table, inst_cap, cap_lo, cap_up in CAPACITIES:
+        df = data[table]
+        if prob is not None:
+            capacity = get_entity(prob, var)
+            if var == 'cap_tra':
+                # undirected models hold one direction per corridor
+                reverse = capacity.copy()
+                reverse.index = reverse.index.swaplevel(0, 1)
+                capacity = capacity.combine_first(reverse)
+            capacity.index.names = df.index.names
+            df[inst_cap] = capacity.reindex(df.index).fillna(0)
+        df[cap_lo] = df[inst_cap]
+        df[cap_up] = df[inst_cap]
+    return data
+
+
+def rolling_horizon(data, timesteps, window, overlap, filename,
+                    solver='glpk', capacities=None, dt=1, dual=False):
+    """Solve a dispatch problem in consecutive, overlapping windows.
+
+    Each window of window modelled timesteps is created with create_model
+    and solved. Its first window - overlap timesteps are kept (all of them
+    in the last window). The state at the last kept timestep initialises
+    the next window:
+
+    - storage content e_sto_con,
+    - process throughput tau_pro (for the max-grad constraints),
+    - online capacity cap_online (for startup costs),
+    - DSM downshifts scheduled after that timestep, which reduce the
+      demand of the next window.
+
+    The final storage content condition applies to the end of each window,
+    so that no window depletes the storages at the expense of the next one.
+    Annual limits (commodity max, CO2 limit) apply to each window, scaled
+    to its length like in create_model.
+
+    Results of the kept timesteps are appended to the HDF5 file filename
+    in the format of save, so that load and all reporting functions can be
+    used on the whole horizon. Time-independent results stem from the first
+    window, except for costs, which are averaged over all windows (weighted
+    by their number of kept timesteps).
+
+    Args:
+        data: input data dict, as returned by read_excel
+        timesteps: list of timesteps of the whole horizon, starting with the
+                   initialisation timestep, e.g. range(0, 8761)
+        window: number of modelled timesteps per window
+        overlap: number of timesteps each window shares with the next one
+        filename: HDF5 store file to be written
+        solver: solver name (cf. solver_factory), default: 'glpk'
+        capacities: (optional) solved urbs model instance whose capacities
+                    are used (cf. fix_capacities)
+        dt: timestep duration in hours (default: 1)
+        dual: set True to store dual values, too
+
+    Returns:
+        DataFrame with first/last kept timestep, solver status and
+        objective value of each window
+    """
+    import warnings
+    warnings.filterwarnings('ignore',
+                            category=pd.io.pytables.PerformanceWarning)
+
+    if not 0 <= overlap < window:
+        raise ValueError("overlap must be between 0 and window - 1")
+    timesteps = list(timesteps)
+    data = fix_capacities(data, capacities)
+    optim = solver_factory(solver)
+
+    summary = []
+    costs = 0
+    kept_timesteps = 0  # sum of the weights len(kept) of costs
+    state = None
+    start = 0
+    with pd.HDFStore(filename, mode='w') as store:
+        for name in data:
+            store['data/' + name] = data[name]
+
+        while True:
+            last_window = start + window + 1 >= len(timesteps)
+            window_timesteps = timesteps[start:start + window + 1]
+            if last_window:
+                kept = window_timesteps[1:]
+            else:
+                kept = window_timesteps[1:window - overlap + 1]
+
+            prob = create_model(window_data(data, state), window_timesteps,
+                                dt=dt, dual=dual)
+            set_initial_state(prob, state)
+            result = solve(prob, optim)
+            status = str(result.solver.termination_condition)
+            if status != 'optimal':
+                raise RuntimeError("Window starting at timestep {} could "
+                                   "not be solved: {}".format(
+                                       window_timesteps[0], status))
+
+            # first window: include initialisation timestep in results
+            append_results(store, prob,
+                           window_timesteps[:1] + kept if start == 0
+                           else kept,
+                           first_window=(start == 0))
+            costs = costs + get_entity(prob, 'costs') * len(kept)
+            kept_timesteps += len(kept)
+            summary.append((kept[0], kept[-1], status,
+                            pyomo.value(prob.obj)))
+
+            if last_window:
+                break
+            state = get_state(prob, kept[-1])
+            start += window - overlap
+            del prob
+
+        store['result/costs'] = costs / kept_timesteps
+
+    return pd.DataFrame(summary,
+                        columns=['first', 'last', 'status', 'objective'])
+
+
+def window_data(data, state):
+    """Input data for next window: demand reduced by pending DSM shifts.
+
+    Args:
+        data: input data dict
+        state: state dict as returned by get_state, or None
+
+    Returns:
+        data, or a shallow copy of it with modified demand
+    """
+    if state is None or not state['dsm_down']:
+        return data
+    data = dict(data)
+    data['demand'] = data['demand'].copy()
+    for (tt, sit, com), value in state['dsm_down'].items():
+        data['demand'].loc[tt, (sit, com)] -= value
+    return data
+
+
+def get_state(prob, t):
+    """Return the state of a solved window at given timestep.
+
+    Args:
+        prob: a solved urbs model instance
+        t: last kept timestep of the window
+
+    Returns:
+        dict with keys 'e_sto_con', 'tau_pro', 'cap_online' ({index tuple
+        without timestep: value}) and 'dsm_down' ({(tt, sit, com): sum of
+        downshifts in timestep tt > t caused by upshifts until t})
+    """
+    state = {}
+    for name in ['e_sto_con', 'tau_pro', 'cap_online']:
+        var = getattr(prob, name)
+        state[name] = {key[1:]: var[key].value
+                       for key in var
+                       if key[0] == t and var[key].value is not None}
+
+    state['dsm_down'] = {}
+    for (up, tt, sit, com) in prob.dsm_down:
+        value = prob.dsm_down[up, tt, sit, com].value
+        if up <= t < tt and value:
+            key = (tt, sit, com)
+            state['dsm_down'][key] = state['dsm_down'].get(key, 0) + value
+    return state
+
+
+def set_initial_state(prob, state):
+    """Initialise a window with the state of the previous one.
+
+    Fixes the variables of the initialisation timestep and replaces the
+    initial storage content condition by the previous storage content.
+
+    Args:
+        prob: an urbs model instance (not yet solved)
+        state: state dict as returned by get_state, or None for the first
+               window
+
+    Returns:
+        Nothing
+    """
+    if state is None:
+        return
+
+    t0 = prob.t[1]
+    for key, value in state['e_sto_con'].items():
+        prob.res_initial_and_final_storage_state[(t0,) + key].deactivate()
+        prob.e_sto_con[(t0,) + key].fix(value)
+    for key, value in state['tau_pro'].items():
+        prob.tau_pro[(t0,) + key].fix(value)
+    for key, value in state['cap_online'].items():
+        prob.cap_online[(t0,) + key].fix(value)
+
+
+def append_results(store, prob, timesteps, first_window):
+    """Append results of given timesteps to a HDF5 store.
+
+    Entities whose first index level is the timestep are appended for the
+    given timesteps only; all others are written for the first window.
+
+    Args:
+        store: an open pandas HDFStore
+        prob: a solved urbs model instance
+        timesteps: list of timesteps to keep
+        first_window: True if prob is the first window
+
+    Returns:
+        Nothing
+    """
+    entity_types = ['set', 'par', 'var']
+    if hasattr(prob, 'dual'):
+        entity_types.append('con')
+
+    for entity_type in entity_types:
+        for name in list_entities(prob, entity_type).index:
+            if name == 'costs':
+                continue  # averaged over all windows by rolling_horizon
+            entity = get_entity(prob, name)
+            if entity.index.names[0] == 't':
+                entity = entity[entity.index.get_level_values(0)
+                                      .isin(timesteps)]
+                if not entity.empty:
+                    store.append('result/' + name, entity)
+            elif first_window:
+                store['result/' + name] = entity
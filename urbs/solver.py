@@ -0,0 +1,152 @@
+"""Solver interface for urbs
+
+Pyomo's file based solver interfaces write the whole model to an LP file,
+run the solver as a subprocess and parse its solution file, for every
+solve. Persistent interfaces instead keep the model in the solver's memory
+(through its Python bindings), so that repeated solves of one model, e.g.
+scenarios applied with update_model, only send the changed coefficients and
+bounds and start from the previous basis:
+
+    optim = urbs.solver_factory('gurobi')  # gurobi_persistent, if installed
+    for scenario in scenarios:
+        prob = urbs.update_model(prob, scenario(copy.deepcopy(data)))
+        result = urbs.solve(prob, optim)
+
+"""
+import pyomo.core as pyomo
+from pyomo.environ import SolverFactory  # with all solver plugins
+
+# in-process alternatives to the file based solver interfaces
+PERSISTENT_SOLVERS = {
+    'cplex': 'cplex_persistent',
+    'gurobi': 'gurobi_persistent',
+    'highs': 'appsi_highs',
+    'xpress': 'xpress_persistent',
+}
+
+
+def solver_factory(solver, persistent=True):
+    """Create a solver, preferably with a persistent in-process interface.
+
+    Args:
+        solver: solver name, e.g. 'glpk', 'gurobi' or 'highs'
+        persistent: set False to always use the file based interface
+
+    Returns:
+        a Pyomo solver object; its persistent interface if persistent is
+        True and one is installed for solver, else SolverFactory(solver)
+    """
+    if persistent and solver in PERSISTENT_SOLVERS:
+        optim = SolverFactory(PERSISTENT_SOLVERS[solver])
+        try:
+            if optim.available(exception_flag=False):
+                return optim
+        except Exception:
+            pass  # unknown to this Pyomo version
+    return SolverFactory(solver)
+
+
+def is_persistent(optim):
+    """Return True if optim is a persistent solver interface."""
+    return hasattr(optim, 'set_instance')
+
+
+def solve(prob, optim, tee=False, warmstart=True):
+    """Solve a urbs model, incrementally if optim is persistent.
+
+    A persistent solver is loaded with the model on its first solve. On the
+    next solves of the same model, only constraints containing mutable
+    parameters that changed since (cf. update_model) are sent again; the
+    solver starts from its previous basis. Other solvers are called with
+    the model as usual.
+
+    Args:
+        prob: a urbs model instance
+        optim: a solver as returned by solver_factory
+        tee: set True to show solver output
+        warmstart: pass variable values (cf. warm_start) as starting point
+                   to file based solvers that are warm start capable;
+                   persistent solvers keep their basis instead
+
+    Returns:
+        Pyomo results object of the solve
+    """
+    if hasattr(optim, 'update_config'):
+        # Pyomo's appsi interfaces track the model and its parameter values
+        # by themselves; the solution is loaded separately, so that an
+        # infeasible model returns its status like other interfaces
+        result = optim.solve(prob, tee=tee, load_solutions=False)
+        if str(result.solver.termination_condition) == 'optimal':
+            optim.load_vars()
+            if hasattr(prob, 'dual'):
+                for con, dual in optim.get_duals().items():
+                    prob.dual[con] = dual
+        return result
+
+    if not is_persistent(optim):
+        if warmstart and optim.warm_start_capable():
+            return optim.solve(prob, tee=tee, warmstart=True)
+        return optim.solve(prob, tee=tee)
+
+    state = getattr(prob, '_persistent', None)
+    if (state is None or state['solver'] is not optim or
+            getattr(optim, '_pyomo_model', None) is not prob):
+        optim.set_instance(prob)
+        prob._persistent = persistent_state(prob, optim)
+    else:
+        update_persistent(prob, optim)
+    return optim.solve(tee=tee)
+
+
+def persistent_state(prob, optim):
+    """Return mutable parameter values and the constraints using them.
+
+    Parameters are keyed by id, as Pyomo components are not hashable in all
+    Pyomo versions.
+
+    Args:
+        prob: a urbs model instance
+        optim: the persistent solver prob was loaded into
+
+    Returns:
+        dict with keys 'solver' (optim), 'params' ({id: parameter}),
+        'values' ({id: value}) and 'constraints' ({id: list of constraints})
+    """
+    try:
+        from pyomo.core.expr import identify_mutable_parameters
+    except ImportError:
+        from pyomo.core.expr.current import identify_mutable_parameters
+
+    params = {}
+    constraints = {}
+    for con in prob.component_data_objects(pyomo.Constraint, active=True):
+        for param in identify_mutable_parameters(con.expr):
+            params[id(param)] = param
+            constraints.setdefault(id(param), []).append(con)
+    values = {key: pyomo.value(param) for key, param in params.items()}
+    return {'solver': optim, 'params': params, 'values': values,
+            'constraints': constraints}
+
+
+def update_persistent(prob, optim):
+    """Send constraints with changed mutable parameters to the solver.
+
+    Args:
+        prob: a urbs model instance, loaded into persistent solver optim
+        optim: a persistent solver
+
+    Returns:
+        number of constraints sent again
+    """
+    state = prob._persistent
+    changed = {}
+    for key, param in state['params'].items():
+        value = pyomo.value(param)
+        if value != state['values'][key]:
+            state['values'][key] = value
+            for con in state['constraints'][key]:
+                changed[id(con)] = con
+    for con in changed.values():
+        optim.remove_constraint(con)
+        optim.add_constraint(con)
+    return len(changed)
@@ -0,0 +1,193 @@
+"""Time series aggregation for urbs
+
+Instead of modelling all timesteps of the input timeseries, a year can be
+represented by a small number of typical periods (e.g. days or weeks). The
+function aggregate_timeseries clusters the periods of the input timeseries
+and returns a reduced input data dict that create_model accepts as usual:
+
+    data = urbs.read_excel('mimo-example.xlsx')
+    data = urbs.aggregate_timeseries(data, period_length=24,
+                                     typical_periods=8,
+                                     extreme_periods=['peak demand'])
+    prob = urbs.create_model(data)
+
+In the reduced timeseries, typical period k occupies the timesteps
+k * (period_length + 1) to (k + 1) * (period_length + 1) - 1, the first of
+which is the initialisation timestep of that period. The additional input
+DataFrame 'periods' assigns each original period to its typical period.
+get_timeseries (and thus report and plot) map the results back to the
+original timesteps.
+
+"""
+import numpy as np
+import pandas as pd
+
+TIMESERIES = ['demand', 'supim', 'buy_sell_price']
+
+
+def aggregate_timeseries(data, period_length=24, typical_periods=8,
+                         extreme_periods=None):
+    """Reduce input timeseries to typical periods.
+
+    Splits the year (all timesteps of data['demand'] after the first, which
+    is the initialisation timestep) into periods of period_length timesteps
+    and clusters them by their normalised demand, intermittent supply and
+    buy/sell price profiles (hierarchical clustering, Ward's method). Each
+    cluster is represented by its medoid, i.e. by the period that is closest
+    to the cluster centre. Extreme periods are added as clusters of their
+    own. Trailing timesteps that do not fill a whole period are dropped.
+
+    Args:
+        data: input data dict, as returned by read_excel
+        period_length: number of timesteps per period, e.g. 24 for days
+        typical_periods: number of typical periods to cluster
+        extreme_periods: (optional) list of extreme periods to add, allowed
+                         values: 'peak demand' (period with the highest
+                         total demand), 'min supim' (period with the lowest
+                         total intermittent supply)
+
+    Returns:
+        a copy of data with timeseries 'demand', 'supim' and
+        'buy_sell_price' reduced to the typical periods and an additional
+        DataFrame 'periods' with the columns 'typical', 'first' and 'last'
+        (typical period and original timesteps of each period)
+    """
+    from scipy.cluster.hierarchy import fcluster, linkage
+
+    timesteps = data['demand'].index[1:]
+    n = len(timesteps) // period_length
+    if n == 0:
+        raise ValueError("Timeseries shorter than one period")
+
+    # feature matrix: one row of normalised profiles per period
+    profiles = pd.concat([data[name].iloc[1:n * period_length + 1]
+                          for name in TIMESERIES], axis=1)
+    values = profiles.values.astype(float)
+    scale = np.abs(values).max(axis=0)
+    scale[scale == 0] = 1
+    features = (values / scale).reshape(n, -1)
+
+    # extreme periods
+    extremes = []
+    for extreme in extreme_periods or []:
+        if extreme == 'peak demand':
+            total = data['demand'].iloc[1:n * period_length + 1].sum(axis=1)
+            period = total.values.reshape(n, period_length).max(axis=1)
+            period = period.argmax()
+        elif extreme == 'min supim':
+            total = data['supim'].iloc[1:n * period_length + 1].sum(axis=1)
+            period = total.values.reshape(n, period_length).sum(axis=1)
+            period = period.argmin()
+        else:
+            raise ValueError("Unknown extreme period '{}'".format(extreme))
+        if period not in extremes:
+            extremes.append(period)
+
+    # cluster all other periods
+    others = np.array([p for p in range(n) if p not in extremes])
+    if typical_periods < 1 or len(others) == 0:
+        raise ValueError("Number of typical periods must be between 1 and "
+                         "the number of non-extreme periods")
+    if typical_periods >= len(others):
+        labels = np.arange(len(others))
+    else:
+        labels = fcluster(linkage(features[others], method='ward'),
+                          typical_periods, criterion='maxclust')
+
+    # medoid of each cluster, then extreme periods
+    typical = np.zeros(n, dtype=int)
+    medoids = []
+    for label in np.unique(labels):
+        members = others[labels == label]
+        centre = features[members].mean(axis=0)
+        distance = ((features[members] - centre) ** 2).sum(axis=1)
+        typical[members] = len(medoids)
+        medoids.append(members[distance.argmin()])
+    for period in extremes:
+        typical[period] = len(medoids)
+        medoids.append(period)
+
+    # reduced timeseries: each typical period is preceded by the timestep
+    # before the medoid period as its initialisation timestep
+    aggregated = dict(data)
+    for name in TIMESERIES:
+        rows = [data[name].iloc[p * period_length:(p + 1) * period_length + 1]
+                for p in medoids]
+        df = pd.concat(rows)
+        df.index = pd.Index(np.arange(len(df)), name=data[name].index.name)
+        aggregated[name] = df
+
+    first = timesteps[np.arange(n) * period_length]
+    last = timesteps[np.arange(n) * period_length + period_length - 1]
+    aggregated['periods'] = pd.DataFrame(
+        {'typical': typical, 'first': first, 'last': last},
+        index=pd.Index(np.arange(1, n + 1), name='Period'),
+        columns=['typical', 'first', 'last'])
+    return aggregated
+
+
+def period_length(periods):
+    """Return the number of timesteps per period.
+
+    Args:
+        periods: DataFrame 'periods' of an aggregated input
+
+    Returns:
+        period length (int)
+    """
+    return int(periods['last'].iloc[0] - periods['first'].iloc[0] + 1)
+
+
+def typical_timesteps(periods):
+    """Return the modelled timesteps of each typical period.
+
+    Args:
+        periods: DataFrame 'periods' of an aggregated input
+
+    Returns:
+        list of timestep lists, one per typical period (without its
+        initialisation timestep)
+    """
+    length = period_length(periods)
+    return [list(range(k * (length + 1) + 1, (k + 1) * (length + 1)))
+            for k in range(periods['typical'].max() + 1)]
+
+
+def expand_timeseries(df, periods):
+    """Map a timeseries of typical periods to the original timesteps.
+
+    Args:
+        df: DataFrame or Series with modelled timesteps of the typical
+            periods as index
+        periods: DataFrame 'periods' of an aggregated input
+
+    Returns:
+        df with one row per original timestep of all periods
+    """
+    length = period_length(periods)
+    offset = np.tile(np.arange(length), len(periods))
+    source = (np.repeat(periods['typical'].values, length) * (length + 1) +
+              1 + offset)
+    original = np.repeat(periods['first'].values, length) + offset
+
+    expanded = df.reindex(source)
+    expanded.index = pd.Index(original, name=df.index.name)
+    return expanded
+
+
+def expand_periods(values, periods):
+    """Repeat per-period values for all original timesteps of each period.
+
+    Args:
+        values: Series with original period numbers as index
+        periods: DataFrame 'periods' of an aggregated input
+
+    Returns:
+        Series with original timesteps as index
+    """
+    length = period_length(periods)
+    offset = np.tile(np.arange(length), len(periods))
+    original = np.repeat(periods['first'].values, length) + offset
+    values = values.reindex(periods.index).fillna(0).values
+    return pd.Series(np.repeat(values, length),
+                     index=pd.Index(original, name='t'))
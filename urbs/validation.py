@@ -0,0 +1,163 @@
+"""Input validation for urbs
+
+Inconsistent input otherwise surfaces late, e.g. as a KeyError within a
+constraint rule after most of the model has been built. validate_input
+checks a whole input dict up front with index and column operations (no
+loop over rows) and reports all violations at once:
+
+    data = urbs.read_excel('mimo-example.xlsx')  # validates, too
+    urbs.input_violations(data)  # [] for valid input
+
+"""
+# number of offending entries listed per violation
+MAX_LISTED = 10
+
+# (table, lower bound, upper bound) column pairs that must be ordered
+ORDERED_COLUMNS = [
+    ('process', 'cap-lo', 'cap-up'),
+    ('process', 'inst-cap', 'cap-up'),
+    ('transmission', 'cap-lo', 'cap-up'),
+    ('transmission', 'inst-cap', 'cap-up'),
+    ('storage', 'cap-lo-c', 'cap-up-c'),
+    ('storage', 'inst-cap-c', 'cap-up-c'),
+    ('storage', 'cap-lo-p', 'cap-up-p'),
+    ('storage', 'inst-cap-p', 'cap-up-p')]
+
+# (table, column) of efficiencies, which must lie in (0, 1]
+EFFICIENCIES = [
+    ('transmission', 'eff'),
+    ('storage', 'eff-in'),
+    ('storage', 'eff-out')]
+
+
+def validate_input(data):
+    """Check an input dict and raise an error listing all violations.
+
+    Args:
+        data: input data dict, as returned by read_excel
+
+    Returns:
+        Nothing
+
+    Raises:
+        ValueError: if input_violations finds any violation
+    """
+    violations = input_violations(data)
+    if violations:
+        raise ValueError("Invalid input ({} violations):\n- {}".format(
+            len(violations), '\n- '.join(violations)))
+
+
+def input_violations(data):
+    """Return all structural and numeric violations of an input dict.
+
+    Structural checks: every demand column, SupIm, Buy and Sell commodity
+    has its counterpart (commodity row or timeseries column), every
+    process-commodity entry a process, every DSM entry a demand, every
+    transmission a reverse direction and all site references a site.
+    Numeric checks: ratio <= ratio-min, cap-lo and inst-cap <= cap-up and
+    efficiencies in (0, 1].
+
+    Empty tables (e.g. data['dsm'] = pd.DataFrame() in a scenario) have
+    no rows to check and are skipped.
+
+    Args:
+        data: input data dict, as returned by read_excel
+
+    Returns:
+        list of violation messages, empty for valid input
+    """
+    commodity = data['commodity']
+    process = data['process']
+    process_commodity = data['process_commodity']
+    transmission = data['transmission']
+    storage = data['storage']
+    dsm = data['dsm']
+    violations = []
+
+    def check(entries, message):
+        if len(entries):
+            entries = list(entries)
+            listed = ', '.join(str(e) for e in entries[:MAX_LISTED])
+            if len(entries) > MAX_LISTED:
+                listed += ', ... ({} in total)'.format(len(entries))
+            violations.append('{}: {}'.format(message, listed))
+
+    def site_commodities(com_type):
+        if commodity.empty:
+            return commodity.index
+        rows = commodity.index.get_level_values('Type') == com_type
+        return commodity.index[rows].droplevel('Type')
+
+    # site references
+    sites = data['site'].index
+    for table, levels in [('commodity', ['Site']),
+                          ('process', ['Site']),
+                          ('storage', ['Site']),
+                          ('transmission', ['Site In', 'Site Out']),
+                          ('dsm', ['Site'])]:
+        if data[table].empty:
+            continue
+        for level in levels:
+            values = data[table].index.get_level_values(level)
+            check(values[~values.isin(sites)].unique(),
+                  '{} {} not in site'.format(table, level))
+
+    # timeseries columns and commodities
+    demand_columns = data['demand'].columns
+    demand_commodities = site_commodities('Demand')
+    check(demand_columns[~demand_columns.isin(demand_commodities)],
+          'demand columns without Demand commodity')
+    check(demand_commodities[~demand_commodities.isin(demand_columns)],
+          'Demand commodities without demand column')
+    supim = site_commodities('SupIm')
+    check(supim[~supim.isin(data['supim'].columns)],
+          'SupIm commodities without supim column')
+    prices = data['buy_sell_price'].columns.get_level_values(0)
+    for com_type in ['Buy', 'Sell']:
+        names = site_commodities(com_type)
+        if names.empty:
+            continue
+        names = names.get_level_values('Commodity')
+        check(names[~names.isin(prices)].unique(),
+              '{} commodities without buy_sell_price column'.format(
+                  com_type))
+    if not dsm.empty:
+        check(dsm.index[~dsm.index.isin(demand_columns)],
+              'DSM entries without demand column')
+
+    # processes of process-commodity entries (including pruned ones, cf.
+    # prune_data)
+    if not process_commodity.empty:
+        processes = set()
+        for df in [process, data.get('pruned_process')]:
+            if df is not None and not df.empty:
+                processes.update(df.index.get_level_values('Process'))
+        pc_processes = process_commodity.index.get_level_values('Process')
+        check(pc_processes[~pc_processes.isin(processes)].unique(),
+              'process_commodity processes not in process')
+        check(process_commodity.index[
+                  (process_commodity['ratio'] >
+                   process_commodity['ratio-min']).values],
+              'process_commodity ratio-min must be larger than ratio')
+
+    # transmission symmetry
+    if not transmission.empty:
+        reverse = transmission.index.swaplevel(0, 1)
+        check(transmission.index[~reverse.isin(transmission.index)],
+              'transmissions without reverse direction')
+
+    # numeric bounds
+    for table, lower, upper in ORDERED_COLUMNS:
+        df = data[table]
+        if df.empty:
+            continue
+        check(df.index[(df[lower] > df[upper]).values],
+              '{} {} > {}'.format(table, lower, upper))
+    for table, column in EFFICIENCIES:
+        df = data[table]
+        if df.empty:
+            continue
+        check(df.index[((df[column] <= 0) | (df[column] > 1)).values],
+              '{} {} not in (0, 1]'.format(table, column))
+    return violations
@@ -0,0 +1,86 @@
+"""Warm start for urbs models
+
+Scenarios often differ only slightly from a previously solved one. The
+solution of that run can seed the solve of a structurally identical model:
+
+    prob = urbs.create_model(scenario(data), timesteps)
+    urbs.warm_start(prob, 'result/scenario_base.h5')
+    optim.solve(prob, warmstart=optim.warm_start_capable())
+
+"""
+import math
+import pyomo.core as pyomo
+from .matrix import MatrixModel
+from .pyomoio import get_entity
+from .saveload import load
+from .util import is_string
+
+
+def warm_start(prob, source):
+    """Seed a model with the solution of a previous run.
+
+    For Pyomo models, the values of all variables present in source are set
+    as initial values; indices missing in source (or without value) are
+    left untouched. Solvers that are warm start capable (e.g. CPLEX, Gurobi
+    and CBC) use them when called with solve(..., warmstart=True).
+
+    For matrix models, the final simplex basis of source (a MatrixModel
+    solved with solve_matrix(..., solver='glpk')) becomes the initial basis
+    of the next GLPK solve, if both models have the same shape.
+
+    Args:
+        prob: a urbs model instance (not yet solved)
+        source: a solved urbs model instance, a result container returned
+                by load or the filename of a HDF5 file written by save
+
+    Returns:
+        number of variable values (Pyomo) or of row and column statuses
+        (matrix) taken over
+    """
+    if is_string(source):
+        source = load(source)
+
+    if isinstance(prob, MatrixModel):
+        basis = getattr(source, 'basis', None)
+        if basis is None or not isinstance(source, MatrixModel):
+            raise ValueError("Matrix models can only be warm started from "
+                             "a matrix model solved with GLPK")
+        if (prob.ncols, prob.nrows) != (source.ncols, source.nrows):
+            return 0
+        prob.basis = basis
+        return len(basis['rows']) + prob.ncols
+
+    count = 0
+    for var in prob.component_objects(pyomo.Var):
+        values = source_values(source, var.name)
+        if not values:
+            continue
+        for index in var:
+            value = values.get(index)
+            if value is None or math.isnan(value):
+                continue
+            var[index].value = value
+            count += 1
+    return count
+
+
+def source_values(source, name):
+    """Return the values of variable name in source as a dict.
+
+    Args:
+        source: a solved urbs model instance or result container
+        name: variable name
+
+    Returns:
+        dict {index: value}, empty if source does not contain name
+    """
+    if hasattr(source, '_result'):
+        if name not in source._result:
+            return {}
+    elif not hasattr(source, name):
+        return {}
+    values = get_entity(source, name)
+    if values.index.names == ['None']:
+        # scalar variable
+        return {None: values.iloc[0]} if len(values) else {}
+    return values.to_dict()